@@ -0,0 +1,207 @@
+"""Índice persistente de los audios guardados (tabla audio_files).
+
+Se actualiza al guardar cada audio (main.store_roleplay) y al generar su
+versión comprimida (ingest.apply_transcode), así /uploads lista desde la
+base de datos sin recorrer la carpeta. Como los audios se guardan por
+contenido (ver storage.py), varios roleplays pueden compartir un fichero:
+`refcount` cuenta cuántos lo usan. Cuando un roleplay deja de usar un
+audio (`release_reference`) se resta uno, y al llegar a 0 el fichero se
+borra después del commit (`delete_released`).
+
+`reconcile` compara el índice con lo que hay en storage por si se han
+copiado o borrado ficheros a mano:
+
+    python audio_index.py                    solo informa
+    python audio_index.py --fix              añade lo que falta, quita lo que ya no existe
+                                             y corrige los refcount
+    python audio_index.py --delete-orphans   borra además los audios que no usa ningún roleplay
+"""
+import hashlib
+import wave
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import event, func, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+import models
+import settings
+import storage
+
+AUDIO_EXTENSIONS = (".wav", ".webm", ".mp3", ".ogg", ".opus", ".flac")
+
+
+def audio_duration(path):
+    """Duración en segundos leyendo solo la cabecera, o None si no se sabe."""
+    try:
+        import soundfile
+    except ImportError:
+        soundfile = None
+    if soundfile is not None:
+        try:
+            return soundfile.info(path).duration
+        except Exception:
+            pass
+    if path.lower().endswith(".wav"):
+        try:
+            with wave.open(path, "rb") as w:
+                return w.getnframes() / float(w.getframerate())
+        except (wave.Error, EOFError, OSError):
+            pass
+    return None
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(settings.UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def add_reference(db: Session, key, size, sha256, roleplay_id, variant="original", duration=None):
+    """Apunta un uso más del audio `key` (se guarda con el commit de la sesión).
+
+    Es un único INSERT ... ON CONFLICT, así dos subidas iguales a la vez no
+    chocan: la segunda solo suma uno a refcount.
+    """
+    stmt = insert(models.AudioFile).values(
+        filename=key,
+        size=size,
+        mtime=datetime.now(),
+        hash=sha256,
+        duration=duration,
+        roleplay_id=roleplay_id,
+        variant=variant,
+        refcount=1,
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[models.AudioFile.filename],
+        set_={"refcount": func.coalesce(models.AudioFile.refcount, 0) + 1},
+    ))
+
+
+def release_reference(db: Session, key):
+    """Quita un uso del audio `key`. Si ya no lo usa nadie sale del índice y queda
+    apuntado en la sesión para que `delete_released` borre el fichero tras el commit."""
+    db.execute(text("UPDATE audio_files SET refcount = coalesce(refcount, 1) - 1 WHERE filename = :key"),
+               {"key": key})
+    unused = db.execute(text("DELETE FROM audio_files WHERE filename = :key AND refcount <= 0"), {"key": key})
+    if unused.rowcount:
+        db.info.setdefault("released_audio", set()).add(key)
+
+
+def delete_released(db: Session):
+    """Borra de storage los audios que se quedaron sin uso en el último commit de `db`."""
+    for key in db.info.pop("released_audio", ()):
+        # Una subida con los mismos bytes puede haberlo vuelto a usar entretanto
+        if db.get(models.AudioFile, key) is None:
+            storage.storage.delete(key)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_released(session):
+    # Si la transacción no se guardó, los audios siguen en uso
+    session.info.pop("released_audio", None)
+
+
+def _roleplay_files(db: Session):
+    """Usos de cada audio en roleplays: (Counter clave -> usos, clave -> (roleplay_id, variant, sha256))."""
+    Roleplay = models.Roleplay
+    refs = Counter()
+    owners = {}
+    rows = db.query(Roleplay.id, Roleplay.audio_filename, Roleplay.audio_hash,
+                    Roleplay.compact_filename, Roleplay.compact_hash)
+    for rp_id, audio, audio_hash, compact, compact_hash in rows:
+        refs[audio] += 1
+        owners.setdefault(audio, (rp_id, "original", audio_hash))
+        if compact:
+            refs[compact] += 1
+            owners.setdefault(compact, (rp_id, "compact", compact_hash))
+    return refs, owners
+
+
+def reconcile(db: Session, fix=False, delete_orphans=False, ignore=()):
+    """Compara el índice con storage y con los roleplays.
+
+    Devuelve un informe con:
+      missing    en el índice pero el fichero ya no está
+      unindexed  en storage pero no en el índice
+      changed    en ambos pero con otro tamaño
+      refcount   en el índice con un refcount que no cuadra con los roleplays
+      orphans    audios que no usa ningún roleplay
+    Con fix=True se corrige el índice. Los audios solo se borran con
+    delete_orphans=True. Los ficheros de `ignore` se tratan como si ya no
+    estuvieran.
+    """
+    stored = {
+        key: (size, mtime) for key, size, mtime in storage.storage.iter_files()
+        if key.lower().endswith(AUDIO_EXTENSIONS) and key not in ignore
+    }
+    indexed = {a.filename: a for a in db.query(models.AudioFile)}
+    refs, owners = _roleplay_files(db)
+
+    report = {
+        "missing": sorted(set(indexed) - set(stored)),
+        "unindexed": sorted(set(stored) - set(indexed)),
+        "changed": sorted(name for name, a in indexed.items() if name in stored and a.size != stored[name][0]),
+        "refcount": sorted(
+            name for name, a in indexed.items()
+            if name in stored and (a.refcount or 0) != refs[name]
+        ),
+        "orphans": sorted(name for name in stored if refs[name] == 0),
+    }
+    if fix or delete_orphans:
+        for name in report["missing"]:
+            db.delete(indexed[name])
+        for name in report["unindexed"] + report["changed"]:
+            rp_id, variant, sha256 = owners.get(name, (None, "original", None))
+            if storage.CONTENT_KEY_RE.match(name):
+                sha256 = name[:64]
+            local = storage.storage.local_path(name)
+            if sha256 is None or name in report["changed"]:
+                sha256 = hash_file(local)
+            db.merge(models.AudioFile(
+                filename=name,
+                size=stored[name][0],
+                mtime=stored[name][1],
+                hash=sha256,
+                duration=audio_duration(local),
+                roleplay_id=rp_id,
+                variant=variant,
+                refcount=refs[name],
+            ))
+        for name in report["refcount"]:
+            indexed[name].refcount = refs[name]
+        db.flush()
+        if delete_orphans:
+            for name in report["orphans"]:
+                storage.storage.delete(name)
+                db.query(models.AudioFile).filter(models.AudioFile.filename == name).delete()
+        db.commit()
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import SessionLocal, engine
+    from migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="Compara el índice de audios con lo guardado en storage.")
+    parser.add_argument("--fix", action="store_true", help="corregir el índice")
+    parser.add_argument("--delete-orphans", action="store_true", help="borrar los audios que no usa ningún roleplay")
+    args = parser.parse_args()
+
+    run_migrations(engine, models.Base.metadata)
+    db = SessionLocal()
+    try:
+        report = reconcile(db, fix=args.fix, delete_orphans=args.delete_orphans)
+    finally:
+        db.close()
+    for key, names in report.items():
+        print(f"{key}: {len(names)}")
+        for name in names[:20]:
+            print(f"  {name}")
+        if len(names) > 20:
+            print(f"  ... y {len(names) - 20} más")
@@ -0,0 +1,349 @@
+"""Prueba de carga del backend con una clase simulada, sin red ni micrófono.
+
+Arranca el backend (serve.py) con una base de datos y carpetas temporales y
+simula a la vez:
+  - alumnos que envían grabaciones a /upload (WAV sintéticos de 16 kHz
+    mono como los de la app del alumno, distintos en cada envío),
+  - profesores que consultan /roleplays, ponen feedback con /update_feedback
+    y escuchan audios (/audio/...).
+
+Al terminar da, por endpoint, latencias p50/p95/p99, peticiones por
+segundo y errores, además de la memoria (RSS) del servidor y los errores
+"database is locked". Con --out se guarda el resultado en JSON y con
+--compare se compara con uno anterior: sale con código 1 si algún endpoint
+ha empeorado más de --threshold.
+
+Uso:
+    python benchmarks/load.py --students 30 --duration 60 --out base.json
+    python benchmarks/load.py --students 30 --duration 60 --compare base.json
+"""
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from collections import defaultdict
+
+import numpy as np
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOCK_MARKER = "database is locked"
+
+
+# --- Audio sintético ---
+
+# El formato en que graba student_app (no se importa: arrastraría tkinter y sounddevice)
+SAMPLE_RATE = 16000
+
+
+def encode_wav(data):
+    """WAV mono de 16 bits con las muestras int16 de `data`."""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(SAMPLE_RATE)
+        wf.writeframes(data.tobytes())
+    return buf.getvalue()
+
+def synthetic_voice(seconds, rng):
+    """Ráfagas de tonos con ruido y pausas, parecido a una conversación (int16)."""
+    n = int(seconds * SAMPLE_RATE)
+    t = np.arange(n) / SAMPLE_RATE
+    envelope = (np.sin(2 * np.pi * rng.uniform(0.2, 0.5) * t) > -0.2).astype(np.float32)
+    tone = np.sin(2 * np.pi * rng.uniform(120, 250) * t) * 0.3
+    noise = rng.normal(0, 0.02, n)
+    return np.int16(np.clip((tone + noise) * envelope, -1, 1) * 32767)
+
+
+class Recordings:
+    """Unas pocas grabaciones base; cada envío cambia unas muestras para que el hash sea distinto."""
+
+    def __init__(self, seconds, count=4, seed=0):
+        rng = np.random.default_rng(seed)
+        self.base = [synthetic_voice(seconds * rng.uniform(0.5, 1.5), rng) for _ in range(count)]
+        self._lock = threading.Lock()
+        self._n = 0
+
+    def next(self):
+        with self._lock:
+            self._n += 1
+            n = self._n
+        data = self.base[n % len(self.base)].copy()
+        data[:8] = np.frombuffer(n.to_bytes(16, "little"), dtype=np.int16)
+        return encode_wav(data)
+
+
+# --- Servidor ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workdir, port, workers, ingest_workers):
+    env = dict(
+        os.environ,
+        ROLEFY_DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        ROLEFY_UPLOAD_DIR=os.path.join(workdir, "uploads"),
+        ROLEFY_PARTIAL_DIR=os.path.join(workdir, "uploads_partial"),
+        ROLEFY_HOST="127.0.0.1",
+        ROLEFY_PORT=str(port),
+        ROLEFY_WEB_WORKERS=str(workers),
+        ROLEFY_INGEST_WORKERS=str(ingest_workers),
+        ROLEFY_RELOAD="0",
+    )
+    env.pop("PORT", None)
+    log = open(os.path.join(workdir, "server.log"), "w")
+    proc = subprocess.Popen([sys.executable, "serve.py"], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited, see {log.name}")
+        try:
+            if requests.get(url + "/healthz", timeout=1).status_code == 200:
+                return proc, url, log.name
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("Server did not become ready")
+
+
+def process_tree_rss(pid):
+    """RSS en MB del proceso y sus hijos (Linux; None en otros sistemas)."""
+    pids, total = [pid], 0
+    try:
+        while pids:
+            p = pids.pop()
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+            for task in os.listdir(f"/proc/{p}/task"):
+                with open(f"/proc/{p}/task/{task}/children") as f:
+                    pids.extend(int(c) for c in f.read().split())
+    except (FileNotFoundError, ProcessLookupError):
+        if total == 0:
+            return None
+    return round(total / 1024, 1)
+
+
+# --- Medidas ---
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock_errors = 0
+
+    def timed(self, endpoint, session, method, url, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            resp = session.request(method, url, timeout=60, **kwargs)
+            body = resp.content
+        except requests.RequestException:
+            resp, body = None, b""
+        elapsed = time.perf_counter() - t0
+        with self._lock:
+            if resp is None or resp.status_code >= 400:
+                self.errors[endpoint] += 1
+                if LOCK_MARKER.encode() in body:
+                    self.lock_errors += 1
+            else:
+                self.latencies[endpoint].append(elapsed)
+        return resp if resp is not None and resp.status_code < 400 else None
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, round(q * (len(values) - 1)))]
+
+
+def summarize(stats, seconds):
+    endpoints = {}
+    for name in sorted(set(stats.latencies) | set(stats.errors)):
+        values = sorted(stats.latencies[name])
+        row = {"requests": len(values), "errors": stats.errors[name], "rps": round(len(values) / seconds, 2)}
+        if values:
+            row.update({f"p{int(q * 100)}_ms": round(percentile(values, q) * 1000, 1) for q in (0.5, 0.95, 0.99)})
+            row["max_ms"] = round(values[-1] * 1000, 1)
+        endpoints[name] = row
+    return endpoints
+
+
+# --- Actores ---
+
+def upload(stats, session, url, recordings, rng, student):
+    partner = f"student{rng.randrange(1000)}"
+    items = [f"item{i}" for i in range(rng.randint(1, 5))]
+    data = {
+        "comprador": student,
+        "vendedor": partner,
+        "productos": json.dumps(items),
+        "costes": json.dumps([f"{rng.uniform(0.5, 20):.2f}" for _ in items]),
+    }
+    files = {"audio": ("recording.wav", recordings.next(), "audio/wav")}
+    return stats.timed("/upload", session, "POST", url + "/upload", data=data, files=files)
+
+
+def student_loop(stats, url, recordings, stop_at, think, seed):
+    rng = random.Random(seed)
+    session = requests.Session()
+    while time.monotonic() < stop_at:
+        upload(stats, session, url, recordings, rng, f"student{seed}")
+        time.sleep(rng.uniform(*think))
+
+
+def teacher_loop(stats, url, stop_at, poll, seed):
+    rng = random.Random(seed)
+    session = requests.Session()
+    while time.monotonic() < stop_at:
+        resp = stats.timed("/roleplays", session, "GET", url + "/roleplays", params={"limit": 50})
+        items = resp.json()["items"] if resp is not None else []
+        if items:
+            rp = rng.choice(items)
+            stats.timed("/update_feedback", session, "POST", url + "/update_feedback",
+                        json={"id": rp["id"], "feedback": f"feedback {rng.random():.3f}", "nota": str(rng.randint(0, 10))})
+            stats.timed("/audio", session, "GET", url + rp["audio_url"])
+        time.sleep(poll)
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="rolefy-load-")
+    proc, url, log_path = start_server(workdir, args.port or free_port(), args.workers, args.ingest_workers)
+    try:
+        recordings = Recordings(args.audio_seconds, seed=args.seed)
+        seed_stats = Stats()
+        session, rng = requests.Session(), random.Random(args.seed)
+        for i in range(args.seed_roleplays):
+            upload(seed_stats, session, url, recordings, rng, f"student{i % max(1, args.students)}")
+
+        stats = Stats()
+        stop_at = time.monotonic() + args.duration
+        threads = [
+            threading.Thread(target=student_loop, args=(stats, url, recordings, stop_at, args.think, args.seed + i))
+            for i in range(args.students)
+        ] + [
+            threading.Thread(target=teacher_loop, args=(stats, url, stop_at, args.poll, args.seed + 10000 + i))
+            for i in range(args.teachers)
+        ]
+        rss = []
+        t0 = time.monotonic()
+        for t in threads:
+            t.start()
+        while any(t.is_alive() for t in threads):
+            value = process_tree_rss(proc.pid)
+            if value is not None:
+                rss.append(value)
+            time.sleep(0.5)
+        elapsed = time.monotonic() - t0
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    with open(log_path) as f:
+        logged_locks = f.read().count(LOCK_MARKER)
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "keep")},
+        "seconds": round(elapsed, 1),
+        "endpoints": summarize(stats, elapsed),
+        "rss_mb": {"max": max(rss) if rss else None, "last": rss[-1] if rss else None},
+        "lock_errors": max(stats.lock_errors, logged_locks),
+    }
+
+
+# --- Informe y comparación ---
+
+def print_report(result):
+    print(f"{'endpoint':<18}{'req':>7}{'err':>6}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+    for name, row in result["endpoints"].items():
+        print(f"{name:<18}{row['requests']:>7}{row['errors']:>6}{row['rps']:>8}"
+              + "".join(f"{row.get(k, '-'):>9}" for k in ("p50_ms", "p95_ms", "p99_ms", "max_ms")))
+    print(f"RSS servidor: máx {result['rss_mb']['max']} MB, final {result['rss_mb']['last']} MB")
+    print(f"Errores 'database is locked': {result['lock_errors']}")
+
+
+def compare(result, baseline, threshold):
+    """Imprime las diferencias con `baseline` y devuelve la lista de empeoramientos."""
+    regressions = []
+    print(f"\nComparado con la ejecución anterior (umbral {threshold:.0%}):")
+    differs = [k for k, v in result["config"].items() if baseline.get("config", {}).get(k) != v]
+    if differs:
+        print(f"  Ojo: la configuración es distinta ({', '.join(differs)})")
+    for name, row in result["endpoints"].items():
+        base = baseline["endpoints"].get(name)
+        if not base or "p95_ms" not in base or "p95_ms" not in row:
+            continue
+        changes = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            change = (row[key] - base[key]) / base[key] if base[key] else 0
+            changes.append(f"{key[:3]} {base[key]}→{row[key]} ({change:+.0%})")
+            # Diferencias de pocos ms son ruido
+            if key == "p95_ms" and change > threshold and row[key] - base[key] > 5:
+                regressions.append(f"{name} p95")
+        rps_change = (row["rps"] - base["rps"]) / base["rps"] if base["rps"] else 0
+        changes.append(f"rps {base['rps']}→{row['rps']} ({rps_change:+.0%})")
+        if rps_change < -threshold:
+            regressions.append(f"{name} rps")
+        if row["errors"] > base["errors"]:
+            regressions.append(f"{name} errors")
+        print(f"  {name:<18}" + ", ".join(changes))
+    if result["lock_errors"] > baseline.get("lock_errors", 0):
+        regressions.append("lock errors")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=30, help="alumnos enviando a la vez")
+    parser.add_argument("--teachers", type=int, default=2, help="profesores consultando a la vez")
+    parser.add_argument("--duration", type=float, default=30, help="segundos de prueba")
+    parser.add_argument("--audio-seconds", type=float, default=60, help="duración media de cada grabación")
+    parser.add_argument("--think", type=float, nargs=2, default=[1.0, 3.0], metavar=("MIN", "MAX"),
+                        help="pausa de cada alumno entre envíos (s)")
+    parser.add_argument("--poll", type=float, default=1.0, help="pausa de cada profesor entre consultas (s)")
+    parser.add_argument("--seed-roleplays", type=int, default=50, help="roleplays creados antes de medir")
+    parser.add_argument("--workers", type=int, default=1, help="workers de uvicorn")
+    parser.add_argument("--ingest-workers", type=int, default=1, help="procesos de ingesta (0 = sin procesar)")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="guardar el resultado en este JSON")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument("--threshold", type=float, default=0.2, help="empeoramiento tolerado (0.2 = 20%%)")
+    parser.add_argument("--keep", action="store_true", help="no borrar la carpeta temporal (BD, audios, log)")
+    args = parser.parse_args()
+
+    result = run(args)
+    print_report(result)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        if regressions:
+            print("Empeora: " + ", ".join(regressions))
+            sys.exit(1)
+        print("Sin empeoramientos")
+
+
+if __name__ == "__main__":
+    main()
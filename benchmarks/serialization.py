@@ -0,0 +1,166 @@
+"""Compara cómo se serializa y comprime la respuesta de /roleplays.
+
+Crea una base de datos temporal con --rows roleplays (con productos,
+feedback y duración, como los de una clase) y mide para páginas de
+--limit filas:
+  - serialización: jsonable_encoder + json (lo que hacía FastAPI al
+    devolver la lista), json directo (fastjson sin orjson) y orjson con las
+    fechas sin isoformat() (ROLEFY_FAST_JSON=1);
+  - compresión del cuerpo resultante: tamaño y tiempo con gzip (varios
+    niveles) y brotli si está instalado;
+  - la petición completa (/roleplays sin caché) con cada combinación, con
+    el TestClient de FastAPI.
+
+Uso:
+    python benchmarks/serialization.py [--rows 20000] [--limit 500] [--repeat 50]
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+NAMES = ["Ana", "Luis", "Marta", "Pablo", "Lucía", "Jorge", "Sara", "Iván", "Nerea", "Hugo"]
+PRODUCTS = ["bread", "apples", "milk", "a T-shirt", "shoes", "a ticket to London", "coffee", "a book"]
+FEEDBACK = ["", "Good pronunciation, but remember the past tense.", "Muy bien 👏", "Speak louder, please."]
+
+
+def timed(fn, repeat):
+    """Mediana en ms de `repeat` llamadas a fn()."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times)
+
+
+def populate(main, rows):
+    import models
+
+    rnd = random.Random(1)
+    start = datetime(2024, 9, 1, 9, 0, 0)
+    db = main.SessionLocal()
+    for i in range(rows):
+        names = rnd.sample(NAMES, 2)
+        products = rnd.sample(PRODUCTS, rnd.randint(1, 4))
+        costs = [round(rnd.uniform(0.5, 40), 2) for _ in products]
+        rp = models.Roleplay(
+            comprador=f"{names[0]} {i % 30}", vendedor=f"{names[1]} {i % 30}",
+            productos=json.dumps(products), costes=json.dumps(costs),
+            audio_filename=f"{i:064x}.wav", compact_filename=f"{i:064x}.ogg", transcode_status="done",
+            duration=rnd.uniform(20, 240), timestamp=start + timedelta(minutes=7 * i, microseconds=rnd.randint(0, 999999)),
+            feedback=rnd.choice(FEEDBACK), nota=rnd.choice(["", "7", "8.5", "10"]),
+        )
+        rp.items = [models.RoleplayItem(position=p, name=n, cost_cents=round(c * 100))
+                    for p, (n, c) in enumerate(zip(products, costs))]
+        db.add(rp)
+    db.commit()
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="rolefy-ser-")
+    os.environ.update({
+        "ROLEFY_DATABASE_URL": f"sqlite:///{tmp}/bench.db",
+        "ROLEFY_UPLOAD_DIR": os.path.join(tmp, "uploads"),
+        "ROLEFY_PARTIAL_DIR": os.path.join(tmp, "partial"),
+        "ROLEFY_FAST_JSON": "1",
+        "ROLEFY_METRICS": "0",
+        "ROLEFY_COMPRESSION": "1",
+        "ROLEFY_INGEST_WORKERS": "0",
+    })
+    try:
+        os.chdir(ROOT)
+        import fastjson
+        import main as app_main
+        from compression import brotli
+        from fastapi.encoders import jsonable_encoder
+        from fastapi.testclient import TestClient
+
+        # Sin el lifespan de la app (TestClient sin `with`): se migra a mano
+        app_main.run_migrations(app_main.engine, app_main.models.Base.metadata)
+        populate(app_main, args.rows)
+        orjson = fastjson.orjson
+        app_main.roleplays_cache.max_entries = 0
+        selected = list(app_main.ROLEPLAY_FIELDS)
+
+        def use_orjson(on):
+            fastjson.orjson = orjson if on else None
+            fastjson.enabled = fastjson.orjson is not None
+
+        db = app_main.SessionLocal()
+        rows = (app_main.roleplay_query(db, selected)
+                .order_by(app_main.models.Roleplay.timestamp.desc()).limit(args.limit).all())
+
+        def fastapi_path():
+            items = [{f: app_main.ROLEPLAY_FIELDS[f][1](r) for f in selected} for r in rows]
+            return app_main.JSONResponse(jsonable_encoder({"items": items, "next_cursor": None})).body
+
+        def fast_path():
+            serialize = app_main.row_serializer(tuple(selected), native=fastjson.enabled)
+            return fastjson.dumps({"items": [serialize(r) for r in rows], "next_cursor": None})
+
+        print(f"{args.rows} roleplays, páginas de {args.limit} filas (mediana de {args.repeat})\n")
+        print("Serialización")
+        results = [("jsonable_encoder + json", fastapi_path)]
+        use_orjson(False)
+        results.append(("json", fast_path))
+        body = fast_path()
+        for name, fn in results:
+            print(f"  {name:<24} {timed(fn, args.repeat):8.2f} ms")
+        if orjson is not None:
+            use_orjson(True)
+            assert json.loads(fast_path()) == json.loads(body), "orjson y json no dan lo mismo"
+            print(f"  {'orjson':<24} {timed(fast_path, args.repeat):8.2f} ms")
+        else:
+            print("  orjson                   (no instalado)")
+        db.close()
+
+        print(f"\nCompresión ({len(body) / 1024:.0f} KB sin comprimir)")
+        codecs = [(f"gzip -{level}", lambda b, level=level: gzip.compress(b, compresslevel=level, mtime=0))
+                  for level in (1, 5, 9)]
+        if brotli is not None:
+            codecs += [(f"brotli q{q}", lambda b, q=q: brotli.compress(b, quality=q)) for q in (1, 4, 9)]
+        else:
+            print("  (brotli no instalado)")
+        for name, fn in codecs:
+            size = len(fn(body))
+            print(f"  {name:<12} {size / 1024:7.1f} KB ({size / len(body):5.1%})  "
+                  f"{timed(lambda: fn(body), args.repeat):7.2f} ms")
+
+        print("\nPetición completa (GET /roleplays, sin caché)")
+        client = TestClient(app_main.app)
+        url = f"/roleplays?limit={args.limit}"
+        modes = [("json", False)] + ([("orjson", True)] if orjson is not None else [])
+        encodings = ["identity", "gzip"] + (["br"] if brotli is not None else [])
+        for mode, on in modes:
+            use_orjson(on)
+            for encoding in encodings:
+                headers = {"accept-encoding": encoding}
+                r = client.get(url, headers=headers)
+                assert r.status_code == 200, r.text
+                size = int(r.headers["content-length"])
+                ms = timed(lambda: client.get(url, headers=headers), args.repeat)
+                print(f"  {mode:<7} {encoding:<9} {ms:8.2f} ms  {size / 1024:7.1f} KB")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Mide el arranque de la app de alumnos.
+
+Lanza `student_app.py --startup-benchmark` varias veces (abre la ventana
+sin buscar backend y se cierra en cuanto está lista) y mide también lo que
+tarda solo el `import student_app`. Necesita pantalla (o Xvfb).
+
+Uso:
+    python benchmarks/startup.py [--runs 10]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = (
+    "import time; t0 = time.perf_counter(); import student_app; "
+    "print(f'import_seconds={time.perf_counter() - t0:.3f}')"
+)
+
+
+def run_once(cmd, key):
+    out = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True, timeout=120)
+    for line in out.stdout.splitlines():
+        if line.startswith(key + "="):
+            return float(line.split("=", 1)[1])
+    raise RuntimeError(f"{key} not found in output:\n{out.stdout}\n{out.stderr}")
+
+
+def summary(name, values):
+    values = sorted(values)
+    p95 = values[min(len(values) - 1, round(0.95 * (len(values) - 1)))]
+    print(f"{name:<10} median={statistics.median(values) * 1000:7.1f} ms  "
+          f"p95={p95 * 1000:7.1f} ms  min={values[0] * 1000:7.1f} ms  (n={len(values)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    imports = [run_once([sys.executable, "-c", IMPORT_SNIPPET], "import_seconds") for _ in range(args.runs)]
+    summary("import", imports)
+    windows = [run_once([sys.executable, "student_app.py", "--startup-benchmark"], "startup_seconds")
+               for _ in range(args.runs)]
+    summary("window", windows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Estado en disco de las subidas por trozos (reanudables).
+
+Cada subida tiene un id elegido por el cliente y dos ficheros en
+PARTIAL_DIR: `<id>.part` con los bytes recibidos hasta ahora y `<id>.json`
+con los datos del roleplay y el estado. Como todo está en disco, una subida
+cortada se puede continuar aunque se reinicie el servidor.
+
+Un trozo y el cierre de la misma subida no pueden ir a la vez, aunque los
+atiendan workers distintos: se bloquea `<id>.lock` con un lock del sistema
+operativo (flock, o msvcrt en Windows), que se suelta solo si el proceso
+muere.
+"""
+import json
+import os
+import re
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import settings
+
+UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def valid_upload_id(upload_id):
+    return bool(UPLOAD_ID_RE.match(upload_id or ""))
+
+
+def _paths(upload_id):
+    base = os.path.join(settings.PARTIAL_DIR, upload_id)
+    return base + ".json", base + ".part"
+
+
+def data_path(upload_id):
+    return _paths(upload_id)[1]
+
+
+def try_lock(upload_id):
+    """Bloquea la subida para este proceso. Devuelve el fichero abierto (para unlock) o None si está ocupada."""
+    os.makedirs(settings.PARTIAL_DIR, exist_ok=True)
+    f = open(os.path.join(settings.PARTIAL_DIR, upload_id + ".lock"), "a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def unlock(f, remove=False):
+    """Suelta el lock. `remove` borra el fichero (solo cuando la subida ya está terminada)."""
+    if remove:
+        try:
+            os.remove(f.name)
+        except OSError:
+            pass
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    f.close()
+
+
+def load_meta(upload_id):
+    meta_path, _ = _paths(upload_id)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_meta(upload_id, meta):
+    """Guarda el estado de forma atómica (fichero temporal + os.replace)."""
+    os.makedirs(settings.PARTIAL_DIR, exist_ok=True)
+    meta_path, _ = _paths(upload_id)
+    tmp = meta_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, meta_path)
+
+
+def current_offset(upload_id):
+    try:
+        return os.path.getsize(data_path(upload_id))
+    except OSError:
+        return 0
+
+
+def remove_data(upload_id):
+    try:
+        os.remove(data_path(upload_id))
+    except FileNotFoundError:
+        pass
+
+
+def cleanup_stale(max_age_hours=settings.PARTIAL_TTL_HOURS):
+    """Borra subidas abandonadas (y estados de subidas terminadas) más antiguas que max_age_hours."""
+    if not os.path.isdir(settings.PARTIAL_DIR):
+        return 0
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    # También los ficheros temporales de storage (STAGING_DIR está dentro)
+    for dirpath, _, filenames in os.walk(settings.PARTIAL_DIR):
+        for fname in filenames:
+            path = os.path.join(dirpath, fname)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+    return removed
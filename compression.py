@@ -0,0 +1,121 @@
+"""Compresión gzip/brotli de las respuestas (según Accept-Encoding).
+
+Middleware ASGI puro, como MetricsMiddleware. Solo se comprimen:
+  - tipos de texto (JSON, HTML, JS, CSV...), nunca los audios, que ya
+    vienen comprimidos y se piden por rangos;
+  - respuestas de al menos ROLEFY_COMPRESS_MIN_BYTES;
+  - respuestas de tamaño conocido (las de un solo bloque, o las que traen
+    content-length y no pasan de MAX_BUFFER_BYTES, como index.html). Las
+    que se van enviando poco a poco (/events, /export) pasan tal cual.
+
+Se usa brotli si el navegador lo acepta y el paquete `brotli` está
+instalado; si no, gzip.
+"""
+import gzip
+
+from starlette.datastructures import Headers, MutableHeaders
+
+import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+# /events se queda abierta enviando eventos: no se puede esperar a tenerla entera
+EXCLUDED_TYPES = ("text/event-stream",)
+MAX_BUFFER_BYTES = 4 * 1024 * 1024
+
+
+def choose_encoding(accept_encoding):
+    """"br", "gzip" o None según la cabecera Accept-Encoding (con sus q=)."""
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+    star = weights.get("*", 0.0)
+    options = []
+    if brotli is not None:
+        options.append((weights.get("br", star), 1, "br"))
+    options.append((weights.get("gzip", star), 0, "gzip"))
+    q, _, name = max(options)
+    return name if q > 0 else None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=settings.GZIP_LEVEL, mtime=0)
+
+
+def _compressible(headers):
+    content_type = headers.get("content-type", "")
+    return (content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith(EXCLUDED_TYPES)
+            and "content-encoding" not in headers)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=None):
+        self.app = app
+        self.minimum_size = settings.COMPRESS_MIN_BYTES if minimum_size is None else minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        chunks = None  # cuerpo acumulado mientras se decide
+
+        async def compressing_send(message):
+            nonlocal start, chunks
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if message["status"] in (204, 206, 304) or not _compressible(headers):
+                    await send(message)
+                    return
+                MutableHeaders(raw=message["headers"]).add_vary_header("Accept-Encoding")
+                start, chunks = message, []
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                length = Headers(raw=start["headers"]).get("content-length")
+                if length is not None and length.isdigit() and int(length) <= MAX_BUFFER_BYTES:
+                    return
+                # Se va enviando poco a poco: sin comprimir
+                held, start = start, None
+                await send(held)
+                await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": True})
+                return
+
+            held, start = start, None
+            body = b"".join(chunks)
+            if len(body) >= self.minimum_size:
+                body = compress(body, encoding)
+                headers = MutableHeaders(raw=held["headers"])
+                headers["content-encoding"] = encoding
+                headers["content-length"] = str(len(body))
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    # Ya no son los mismos bytes que la versión sin comprimir
+                    headers["etag"] = "W/" + etag
+            await send(held)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, compressing_send)
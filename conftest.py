@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _forget_app_modules():
+    """Quita de sys.modules los módulos del backend: leen la configuración al importarse."""
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None)
+        if (path and os.path.dirname(os.path.abspath(path)) == ROOT
+                and name != "conftest" and not name.endswith("_test")):
+            del sys.modules[name]
+
+
+@pytest.fixture
+def app_main(tmp_path, monkeypatch):
+    """main importado de nuevo con su propia base de datos y carpetas en tmp_path."""
+    monkeypatch.setenv("ROLEFY_DATABASE_URL", f"sqlite:///{tmp_path}/test.db")
+    monkeypatch.setenv("ROLEFY_UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setenv("ROLEFY_PARTIAL_DIR", str(tmp_path / "partial"))
+    monkeypatch.setenv("ROLEFY_INGEST_WORKERS", "0")
+    monkeypatch.setenv("ROLEFY_METRICS", "0")
+    monkeypatch.delenv("ROLEFY_SKIP_MIGRATIONS", raising=False)
+    monkeypatch.chdir(ROOT)  # static/
+    _forget_app_modules()
+    import main
+    import migrations
+
+    # Los tests crean filas antes de arrancar la app (que es la que migra)
+    migrations.run_migrations(main.engine, main.models.Base.metadata)
+    try:
+        yield main
+    finally:
+        main.engine.dispose()
+        if main.async_engine is not None:
+            main.async_engine.sync_engine.dispose()
+        _forget_app_modules()
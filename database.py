@@ -1,11 +1,83 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
 
-DATABASE_URL = "sqlite:///./roleplay.db"
+import settings
+
+DATABASE_URL = settings.DATABASE_URL
 
 engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
+    DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": settings.DB_BUSY_TIMEOUT_MS / 1000},
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL deja leer mientras otro proceso escribe; busy_timeout espera al
+    # lock en vez de fallar con "database is locked".
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={settings.DB_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+event.listen(engine, "connect", _set_sqlite_pragmas)
+
+
+# --- Engine asíncrono (opcional) ---
+async_engine = None
+AsyncSessionLocal = None
+
+if settings.DB_MODE == "async":
+    try:
+        import aiosqlite  # noqa: F401
+        import greenlet  # noqa: F401
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    except ImportError:
+        print("aiosqlite no está instalado, se usa la base de datos en modo síncrono.")
+    else:
+        async_engine = create_async_engine(
+            DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1),
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_pre_ping=True,
+        )
+        event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+        AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False)
+
+
+class AsyncDB:
+    """Sesión para endpoints async.
+
+    `run(fn, ...)` ejecuta `fn(session, ...)` con código ORM normal: sobre
+    el engine asíncrono si está activo, o en el threadpool con una sesión
+    síncrona. En ningún caso se bloquea el event loop.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    async def run(self, fn, *args):
+        if AsyncSessionLocal is not None:
+            return await self.session.run_sync(fn, *args)
+        return await run_in_threadpool(fn, self.session, *args)
+
+
+async def get_async_db():
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            yield AsyncDB(session)
+    else:
+        db = SessionLocal()
+        try:
+            yield AsyncDB(db)
+        finally:
+            await run_in_threadpool(db.close)
@@ -0,0 +1,209 @@
+"""Avisos en directo de roleplays nuevos o cambiados (Server-Sent Events, /events).
+
+Cada cambio deja una fila en la tabla `events` dentro de la misma
+transacción que el cambio, así cualquier worker de uvicorn ve los cambios
+de los demás y el id del evento sirve de token para continuar
+(Last-Event-ID). Cada worker tiene un único EventHub que lee los eventos
+nuevos y serializa los roleplays una vez por vuelta para todas las
+pestañas conectadas.
+"""
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, text
+from starlette.concurrency import run_in_threadpool
+
+import models
+import settings
+
+# Eventos pendientes por pestaña; si una se queda atrás se le pide recargar
+QUEUE_SIZE = 100
+# Más eventos perdidos que esto al reconectar: mejor recargar la tabla
+MAX_REPLAY = 1000
+HEARTBEAT_SECONDS = 15
+
+
+def record(db, roleplay_id, kind):
+    """Añade el evento a la sesión (se guarda con el mismo commit que el cambio)."""
+    db.add(models.Event(roleplay_id=roleplay_id, kind=kind))
+
+
+def last_event_id(db):
+    return db.query(func.max(models.Event.id)).scalar() or 0
+
+
+def data_version(db):
+    """(último id de evento, versión de los datos) con una sola consulta.
+
+    Las migraciones no dejan eventos: la versión incluye también
+    PRAGMA user_version (migraciones de datos aplicadas) y schema_version
+    (columnas, tablas e índices), así cambia si tras reiniciar el backend
+    se ha migrado la base de datos aunque no haya eventos nuevos.
+    """
+    last_id, user_version, schema_version = db.execute(text(
+        "SELECT (SELECT max(id) FROM events),"
+        " (SELECT user_version FROM pragma_user_version),"
+        " (SELECT schema_version FROM pragma_schema_version)"
+    )).one()
+    last_id = last_id or 0
+    return last_id, f"{user_version}.{schema_version}.{last_id}"
+
+
+def _sse(event, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+class EventHub:
+    """Reparte los eventos a las conexiones SSE de este proceso.
+
+    `serialize(db, ids)` devuelve {id: dict} con los roleplays tal como
+    los da /roleplays.
+    """
+
+    def __init__(self, session_factory, serialize):
+        self.session_factory = session_factory
+        self.serialize = serialize
+        self.subscribers = set()
+        self.last_id = None
+        self._task = None
+        self._wake = asyncio.Event()
+        self._last_prune = datetime.min
+
+    def notify(self):
+        """Hay eventos nuevos (en este proceso): no esperar al siguiente sondeo."""
+        self._wake.set()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def stream(self, since=None):
+        """Generador SSE de una conexión: primero lo que se perdió desde `since`, luego lo nuevo."""
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.subscribers.add(queue)
+        if self._task is None or self._task.done():
+            # Punto de partida antes de leer lo perdido: así no queda ningún hueco
+            if self.last_id is None:
+                self.last_id = await run_in_threadpool(self._with_db, last_event_id)
+            if self._task is None or self._task.done():
+                self._task = asyncio.create_task(self._loop())
+        try:
+            if since is None:
+                since = await run_in_threadpool(self._with_db, last_event_id)
+                yield _sse("hello", {"last_event_id": since}, since)
+            else:
+                replay = await run_in_threadpool(self._with_db, self._load, since, MAX_REPLAY + 1)
+                if replay is None:
+                    yield _sse("reset", {})
+                    return
+                for message_id, message in replay:
+                    since = message_id
+                    yield message
+            while True:
+                try:
+                    message_id, message = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if message_id is None:
+                    # Esta pestaña no ha leído a tiempo: que recargue
+                    yield message
+                    return
+                if message_id > since:
+                    since = message_id
+                    yield message
+        finally:
+            self.subscribers.discard(queue)
+
+    def _with_db(self, fn, *args):
+        db = self.session_factory()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    def _load(self, db, after, limit=None):
+        """Mensajes SSE de los eventos con id > after (uno por roleplay, con su estado actual).
+
+        Devuelve None si los eventos ya no están (borrados por antiguos) o
+        son demasiados para ponerse al día.
+        """
+        Event = models.Event
+        oldest = db.query(func.min(Event.id)).scalar()
+        if oldest is not None and oldest > after + 1:
+            return None
+        q = db.query(Event.id, Event.roleplay_id, Event.kind).filter(Event.id > after).order_by(Event.id)
+        if limit is not None:
+            q = q.limit(limit)
+        rows = q.all()
+        if limit is not None and len(rows) >= limit:
+            return None
+        latest = {}
+        for event_id, rp_id, kind in rows:
+            previous = latest.pop(rp_id, None)
+            if previous is not None and previous[1] == "created":
+                kind = "created"
+            latest[rp_id] = (event_id, kind)
+        found = self.serialize(db, list(latest)) if latest else {}
+        messages = []
+        for rp_id, (event_id, kind) in latest.items():
+            if rp_id in found:
+                messages.append((event_id, _sse("roleplay", {"op": kind, "roleplay": found[rp_id]}, event_id)))
+        return messages
+
+    async def _loop(self):
+        while self.subscribers:
+            self._wake.clear()
+            try:
+                messages = await run_in_threadpool(self._with_db, self._load, self.last_id)
+                if messages is None:
+                    # Los eventos desde last_id ya se borraron: seguir desde el último
+                    # y que todas las pestañas recarguen
+                    self.last_id = await run_in_threadpool(self._with_db, last_event_id)
+                    for queue in list(self.subscribers):
+                        self._reset(queue)
+                    messages = ()
+                for message_id, message in messages:
+                    self.last_id = message_id
+                    self._publish(message_id, message)
+                if datetime.utcnow() - self._last_prune > timedelta(hours=1):
+                    self._last_prune = datetime.utcnow()
+                    await run_in_threadpool(self._with_db, self._prune)
+            except Exception as e:
+                print("EventHub error:", e)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=settings.EVENTS_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+        # Sin pestañas conectadas: la próxima vez se empieza desde el último evento
+        self.last_id = None
+
+    def _publish(self, message_id, message):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait((message_id, message))
+            except asyncio.QueueFull:
+                self._reset(queue)
+
+    @staticmethod
+    def _reset(queue):
+        """Cambia lo pendiente de una pestaña por un `reset` (recargar la lista)."""
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait((None, _sse("reset", {})))
+
+    @staticmethod
+    def _prune(db):
+        cutoff = datetime.utcnow() - timedelta(hours=settings.EVENTS_RETENTION_HOURS)
+        # El último se queda siempre: su id es la versión de los datos (ver response_cache.py)
+        newest = last_event_id(db)
+        db.query(models.Event).filter(models.Event.created_at < cutoff, models.Event.id < newest) \
+            .delete(synchronize_session=False)
+        db.commit()
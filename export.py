@@ -0,0 +1,183 @@
+"""Exportación de roleplays por streaming (endpoint /export).
+
+Las filas se leen con un cursor del servidor (yield_per) y se van
+escribiendo según salen, así exportar un curso entero usa memoria
+constante. Formatos:
+  ndjson  una línea JSON por roleplay
+  csv     una fila por roleplay (productos y costes como listas JSON)
+  zip     roleplays.ndjson más los audios en audio/<clave>, comprimido al vuelo
+"""
+import csv
+import io
+import json
+import zipfile
+from contextlib import closing
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import selectinload
+
+import models
+import settings
+from storage import storage
+
+BATCH_SIZE = 500
+
+EXPORT_COLUMNS = [
+    "id", "comprador", "vendedor", "productos", "costes", "total", "timestamp", "updated_at",
+    "feedback", "nota", "audio_filename", "audio_hash", "audio_size", "compact_filename",
+]
+
+
+def changed_at():
+    """Fecha del último cambio de un roleplay (los antiguos no tienen updated_at)."""
+    return func.coalesce(models.Roleplay.updated_at, models.Roleplay.timestamp)
+
+
+def export_filter(q, since=None, since_id=None, until=None):
+    """Filtro de exportación incremental: cambios en (since, until] y/o ids mayores que since_id."""
+    if since is not None:
+        q = q.filter(changed_at() > since)
+    if since_id is not None:
+        q = q.filter(models.Roleplay.id > since_id)
+    if until is not None:
+        q = q.filter(changed_at() <= until)
+    return q
+
+
+def export_until(since=None):
+    """El `since` de la siguiente exportación incremental (nunca anterior al de esta).
+
+    updated_at se pone antes del commit, así que un cambio que aún se está
+    guardando puede llevar una fecha anterior a la de otros ya guardados.
+    Por eso el cursor se queda EXPORT_OVERLAP_SECONDS por detrás de ahora:
+    la siguiente exportación repite lo de ese rato (las filas repetidas
+    tienen el mismo id; vale la de updated_at más reciente) pero no se
+    salta ningún cambio.
+    """
+    until = datetime.utcnow() - timedelta(seconds=settings.EXPORT_OVERLAP_SECONDS)
+    return until if since is None or until > since else since
+
+
+def _row(r):
+    items = r.items
+    return {
+        "id": r.id,
+        "comprador": r.comprador,
+        "vendedor": r.vendedor,
+        "productos": [i.name for i in items],
+        "costes": [None if i.cost_cents is None else i.cost_cents / 100 for i in items],
+        "total": sum(i.cost_cents or 0 for i in items) / 100,
+        "timestamp": r.timestamp.isoformat() if r.timestamp else None,
+        "updated_at": r.updated_at.isoformat() if r.updated_at else None,
+        "feedback": r.feedback or "",
+        "nota": r.nota or "",
+        "audio_filename": r.audio_filename,
+        "audio_hash": r.audio_hash,
+        "audio_size": r.audio_size,
+        "compact_filename": r.compact_filename,
+    }
+
+
+def iter_rows(session_factory, since=None, since_id=None, until=None):
+    """Roleplays como dicts, en orden de cambio, leídos por lotes de BATCH_SIZE."""
+    db = session_factory()
+    try:
+        q = (
+            select(models.Roleplay)
+            .options(selectinload(models.Roleplay.items))
+            .order_by(changed_at(), models.Roleplay.id)
+            .execution_options(yield_per=BATCH_SIZE)
+        )
+        for r in db.scalars(export_filter(q, since, since_id, until)):
+            yield _row(r)
+    finally:
+        db.close()
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield (json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def iter_csv(rows):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        row = dict(row, productos=json.dumps(row["productos"], ensure_ascii=False),
+                   costes=json.dumps(row["costes"]))
+        writer.writerow(row)
+        if buf.tell() >= 64 * 1024:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode("utf-8")
+
+
+class _ZipStream(io.RawIOBase):
+    """Destino de zipfile sin seek: acumula lo escrito para ir mandándolo al cliente."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_audio_keys(session_factory, since=None, since_id=None, until=None, variants=("original",)):
+    """Claves de audio de los roleplays exportados, sin repetir.
+
+    Se ordena por clave para quitar repetidas (audios compartidos) sin
+    guardarlas en memoria.
+    """
+    Roleplay = models.Roleplay
+    columns = {"original": Roleplay.audio_filename, "compact": Roleplay.compact_filename}
+    db = session_factory()
+    try:
+        for variant in variants:
+            column = columns[variant]
+            q = export_filter(db.query(column), since, since_id, until).filter(column.isnot(None))
+            last = None
+            for (key,) in q.order_by(column).execution_options(yield_per=BATCH_SIZE):
+                if key != last:
+                    yield key
+                    last = key
+    finally:
+        db.close()
+
+
+AUDIO_VARIANTS = {"none": (), "original": ("original",), "compact": ("compact",), "all": ("original", "compact")}
+
+
+def iter_zip(session_factory, since=None, since_id=None, until=None, audio="original"):
+    """ZIP generado al vuelo: roleplays.ndjson y los audios (`audio`: none, original, compact o all)."""
+    out = _ZipStream()
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        with zf.open("roleplays.ndjson", "w", force_zip64=True) as entry:
+            for chunk in iter_ndjson(iter_rows(session_factory, since, since_id, until)):
+                entry.write(chunk)
+                if out.chunks:
+                    yield out.drain()
+        for key in iter_audio_keys(session_factory, since, since_id, until, AUDIO_VARIANTS[audio]):
+            try:
+                src = storage.open(key)
+            except (OSError, ValueError):
+                continue  # audio perdido: lo indica audio_index.py
+            # Los audios ya van comprimidos (FLAC, Opus...): se guardan tal cual
+            info = zipfile.ZipInfo(f"audio/{key}")
+            info.compress_type = zipfile.ZIP_STORED
+            with closing(src), zf.open(info, "w", force_zip64=True) as entry:
+                for chunk in iter(lambda: src.read(BATCH_SIZE * 1024), b""):
+                    entry.write(chunk)
+                    yield out.drain()
+    yield out.drain()
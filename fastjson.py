@@ -0,0 +1,36 @@
+"""Serialización JSON rápida (opcional) para las respuestas grandes.
+
+Con ROLEFY_FAST_JSON=1 y orjson instalado, /roleplays y la forma de onda
+se serializan con orjson, que además escribe las fechas directamente (sin
+un isoformat() por fila). Sin orjson, o con ROLEFY_FAST_JSON=0, se usa el
+json de siempre y la salida es la misma que la de JSONResponse.
+
+Para comparar las dos formas y la compresión: benchmarks/serialization.py.
+"""
+import json
+
+from fastapi.responses import JSONResponse as _JSONResponse
+
+import settings
+
+orjson = None
+if settings.FAST_JSON:
+    try:
+        import orjson
+    except ImportError:
+        print("orjson no está instalado, se usa el json estándar.")
+
+# orjson sabe escribir fechas y floats de numpy; json necesita cadenas
+enabled = orjson is not None
+
+
+def dumps(obj):
+    """`obj` en JSON compacto (bytes UTF-8)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class JSONResponse(_JSONResponse):
+    def render(self, content):
+        return dumps(content)
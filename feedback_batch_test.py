@@ -0,0 +1,54 @@
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+# app_main (conftest.py): la app con su propia base de datos temporal
+
+
+def _create_roleplay(main):
+    db = main.SessionLocal()
+    rp = main.models.Roleplay(comprador="Ana", vendedor="Luis", productos="[]", costes="[]",
+                              audio_filename="0" * 64 + ".wav")
+    db.add(rp)
+    db.commit()
+    rp_id = rp.id
+    db.close()
+    return rp_id
+
+
+def test_feedback_batch_reports_invalid_items(app_main):
+    rp_id = _create_roleplay(app_main)
+    with TestClient(app_main.app) as client:
+        r = client.post("/feedback/batch", json={"updates": [
+            {"id": rp_id, "feedback": "Muy bien"},
+            {"id": rp_id, "nota": ["no", "es", "texto"]},
+            {"id": "abc", "feedback": "x"},
+            "nada",
+            {"id": 999999, "feedback": "x"},
+        ]})
+        assert r.status_code == 200, r.text
+        results = r.json()["results"]
+        assert results[0] == {"id": rp_id, "status": "ok"}
+        assert results[1] == {"id": rp_id, "status": "error", "message": "Invalid feedback"}
+        assert results[2] == {"id": "abc", "status": "error", "message": "Invalid feedback"}
+        assert results[3] == {"id": None, "status": "error", "message": "Invalid feedback"}
+        assert results[4] == {"id": 999999, "status": "error", "message": "Roleplay not found"}
+
+    # El cambio válido se guarda aunque otros del lote no lo sean
+    db = app_main.SessionLocal()
+    assert db.get(app_main.models.Roleplay, rp_id).feedback == "Muy bien"
+    db.close()
+
+
+def test_update_feedback_reports_invalid_feedback(app_main):
+    rp_id = _create_roleplay(app_main)
+    with TestClient(app_main.app) as client:
+        r = client.post("/update_feedback", json={"id": rp_id, "feedback": {"texto": "x"}})
+        assert r.json() == {"status": "error", "message": "Invalid feedback"}
+        r = client.post("/update_feedback", json={"id": 999999, "feedback": "x"})
+        assert r.json() == {"status": "error", "message": "Roleplay not found"}
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,386 @@
+"""Procesado en segundo plano de los audios subidos.
+
+Cada roleplay nuevo deja filas en `ingest_jobs` (una por tipo de trabajo).
+La cola vive en la base de datos, así que sobrevive a reinicios: un trabajo
+que se quedó en "running" más de INGEST_LEASE_SECONDS se vuelve a coger.
+
+Cada tipo de trabajo se registra en JOB_HANDLERS con tres funciones:
+  prepare(db, job) -> args   lee lo necesario de la BD (proceso principal)
+  run(*args) -> result       el trabajo pesado, en el ProcessPoolExecutor
+  apply(db, job, result)     guarda el resultado (proceso principal)
+"""
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import load_only
+from starlette.concurrency import run_in_threadpool
+
+import audio_index
+import events
+import models
+import normalize
+import settings
+import waveform
+from storage import content_key, staging_path, storage
+
+
+class SkipJob(Exception):
+    """El trabajo no se puede hacer en este servidor (p. ej. falta ffmpeg); no se reintenta."""
+
+
+class JobResult(Exception):
+    """prepare() ya tiene el resultado (p. ej. de otro roleplay con el mismo audio): se aplica sin ejecutar run()."""
+
+    def __init__(self, result):
+        super().__init__("already done")
+        self.result = result
+
+
+# --- Transcodificación WAV -> Opus/MP3 ---
+
+TRANSCODE_FORMATS = {
+    "opus": (".ogg", ["-c:a", "libopus", "-application", "voip"]),
+    "mp3": (".mp3", ["-c:a", "libmp3lame"]),
+}
+
+
+def prepare_transcode(db, job):
+    rp = db.get(models.Roleplay, job.roleplay_id)
+    if rp is None:
+        raise SkipJob("Roleplay not found")
+    if settings.TRANSCODE_CODEC not in TRANSCODE_FORMATS:
+        raise SkipJob(f"Transcoding disabled (codec={settings.TRANSCODE_CODEC})")
+    ext, _ = TRANSCODE_FORMATS[settings.TRANSCODE_CODEC]
+    # El mismo audio (reenvío) ya se comprimió para otro roleplay: se reutiliza
+    done = (
+        db.query(models.Roleplay)
+        .filter(models.Roleplay.audio_filename == rp.audio_filename,
+                models.Roleplay.compact_filename.like(f"%{ext}"))
+        .first()
+    )
+    if done is not None:
+        raise JobResult({"filename": done.compact_filename, "size": done.compact_size, "hash": done.compact_hash})
+    src = storage.local_path(rp.audio_filename)
+    dst = staging_path(ext)
+    return src, dst, settings.TRANSCODE_CODEC, settings.TRANSCODE_BITRATE, settings.TRIM_AUDIO
+
+
+def transcode_audio(src, dst, codec, bitrate, trim=False):
+    """Convierte `src` al códec indicado con ffmpeg. Devuelve nombre, tamaño y sha256 del resultado.
+
+    Con `trim` antes se recortan los silencios y se normaliza el volumen (normalize.py).
+    """
+    ffmpeg = shutil.which(settings.FFMPEG_BIN)
+    if ffmpeg is None:
+        raise SkipJob("ffmpeg not found")
+    _, codec_args = TRANSCODE_FORMATS[codec]
+    tmp = dst + ".part"
+    trimmed = dst + ".trim.wav"
+    if trim:
+        report = normalize.process(src, trimmed)
+        print(f"Recorte {os.path.basename(src)}: {report}")
+        src = trimmed
+    cmd = [ffmpeg, "-nostdin", "-loglevel", "error", "-y", "-i", src, "-vn", "-ac", "1",
+           *codec_args, "-b:a", bitrate, "-f", "ogg" if codec == "opus" else "mp3", tmp]
+    try:
+        proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=600)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.decode(errors="replace").strip()[-500:] or "ffmpeg failed")
+        digest = hashlib.sha256()
+        with open(tmp, "rb") as f:
+            for chunk in iter(lambda: f.read(settings.UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        os.replace(tmp, dst)
+    finally:
+        for path in (tmp, trimmed):
+            if os.path.exists(path):
+                os.remove(path)
+    ext = os.path.splitext(dst)[1]
+    return {"path": dst, "filename": content_key(digest.hexdigest(), ext),
+            "size": os.path.getsize(dst), "hash": digest.hexdigest()}
+
+
+def apply_transcode(db, job, result):
+    rp = db.get(models.Roleplay, job.roleplay_id)
+    duration = None
+    if "path" in result:
+        duration = audio_index.audio_duration(result["path"])
+        storage.put(result["path"], result["filename"])
+    previous = rp.compact_filename
+    rp.compact_filename = result["filename"]
+    rp.compact_size = result["size"]
+    rp.compact_hash = result["hash"]
+    rp.transcode_status = "done"
+    if previous != rp.compact_filename:
+        audio_index.add_reference(db, rp.compact_filename, rp.compact_size, rp.compact_hash, rp.id,
+                                  "compact", duration)
+        if previous:
+            # La versión comprimida anterior (otro códec) ya no la usa este roleplay
+            audio_index.release_reference(db, previous)
+
+
+# --- Forma de onda, duración y volumen ---
+
+def prepare_waveform(db, job):
+    rp = db.get(models.Roleplay, job.roleplay_id)
+    if rp is None:
+        raise SkipJob("Roleplay not found")
+    if settings.WAVEFORM_PEAKS <= 0:
+        raise SkipJob("Waveform disabled")
+    # El mismo audio ya se analizó para otro roleplay
+    done = (
+        db.query(models.Roleplay)
+        .options(load_only(models.Roleplay.duration, models.Roleplay.rms_db,
+                           models.Roleplay.silence_ratio, models.Roleplay.waveform))
+        .filter(models.Roleplay.audio_filename == rp.audio_filename, models.Roleplay.waveform.isnot(None))
+        .first()
+    )
+    if done is not None:
+        raise JobResult({"duration": done.duration, "rms_db": done.rms_db,
+                         "silence_ratio": done.silence_ratio, "peaks": json.loads(done.waveform)})
+    return storage.local_path(rp.audio_filename), settings.WAVEFORM_PEAKS
+
+
+def analyze_waveform(src, peaks):
+    try:
+        return waveform.analyze(src, peaks)
+    except ValueError as e:
+        raise SkipJob(str(e))
+
+
+def apply_waveform(db, job, result):
+    rp = db.get(models.Roleplay, job.roleplay_id)
+    rp.duration = result["duration"]
+    rp.rms_db = result["rms_db"]
+    rp.silence_ratio = result["silence_ratio"]
+    rp.waveform = json.dumps(result["peaks"])
+    events.record(db, rp.id, "updated")
+
+
+def transcode_status_hook(rp, status):
+    if status != "done":
+        rp.transcode_status = status
+
+
+JOB_HANDLERS = {
+    "transcode": (prepare_transcode, transcode_audio, apply_transcode),
+    "waveform": (prepare_waveform, analyze_waveform, apply_waveform),
+}
+
+# Funciones opcionales que reflejan el estado de un trabajo en la fila del roleplay
+STATUS_HOOKS = {
+    "transcode": transcode_status_hook,
+}
+
+
+def enabled_job_kinds():
+    kinds = []
+    if settings.TRANSCODE_CODEC in TRANSCODE_FORMATS:
+        kinds.append("transcode")
+    if settings.WAVEFORM_PEAKS > 0:
+        kinds.append("waveform")
+    return kinds
+
+
+def enqueue_jobs(db, rp):
+    """Añade a la sesión los trabajos de ingesta de un roleplay nuevo (se guardan con su commit)."""
+    for kind in enabled_job_kinds():
+        db.add(models.IngestJob(roleplay_id=rp.id, kind=kind))
+        hook = STATUS_HOOKS.get(kind)
+        if hook is not None:
+            hook(rp, "pending")
+
+
+class IngestWorker:
+    """Reparte los trabajos pendientes en un pool de procesos con concurrencia limitada."""
+
+    def __init__(self, session_factory, workers=settings.INGEST_WORKERS):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.pool = None
+        self._task = None
+        self._running = set()
+        self._wake = asyncio.Event()
+        self._slots = asyncio.Semaphore(workers)
+
+    def start(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._task = asyncio.create_task(self._loop())
+
+    def notify(self):
+        """Avisa de que hay trabajos nuevos, sin esperar al siguiente sondeo."""
+        self._wake.set()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+
+    async def _loop(self):
+        while True:
+            await self._slots.acquire()
+            self._wake.clear()
+            try:
+                job = await run_in_threadpool(self._claim)
+            except Exception:
+                traceback.print_exc()
+                job = None
+            if job is None:
+                self._slots.release()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=settings.INGEST_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(self._run(*job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    def _claim(self):
+        """Marca como "running" un trabajo pendiente (o abandonado) y devuelve (id, kind, args)."""
+        IngestJob = models.IngestJob
+        stale = datetime.utcnow() - timedelta(seconds=settings.INGEST_LEASE_SECONDS)
+        claimable = or_(
+            IngestJob.status == "pending",
+            and_(IngestJob.status == "running", IngestJob.updated_at < stale),
+        )
+        db = self.session_factory()
+        try:
+            candidates = (
+                db.query(IngestJob.id)
+                .filter(claimable, IngestJob.kind.in_(JOB_HANDLERS))
+                .order_by(IngestJob.id)
+                .limit(5)
+                .all()
+            )
+            for (job_id,) in candidates:
+                # UPDATE condicional: si otro worker lo cogió antes, rowcount es 0
+                claimed = (
+                    db.query(IngestJob)
+                    .filter(IngestJob.id == job_id, claimable)
+                    .update({
+                        IngestJob.status: "running",
+                        IngestJob.attempts: IngestJob.attempts + 1,
+                        IngestJob.updated_at: datetime.utcnow(),
+                    }, synchronize_session=False)
+                )
+                db.commit()
+                if not claimed:
+                    continue
+                job = db.get(IngestJob, job_id)
+                self._set_status(db, job, "running")
+                try:
+                    args = JOB_HANDLERS[job.kind][0](db, job)
+                except Exception as e:
+                    self._finish(db, job, e)
+                    continue
+                db.commit()
+                return job_id, job.kind, args
+            return None
+        finally:
+            db.close()
+
+    async def _run(self, job_id, kind, args):
+        try:
+            loop = asyncio.get_running_loop()
+            t0 = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(self.pool, JOB_HANDLERS[kind][1], *args)
+            except Exception as e:
+                result = e
+            await run_in_threadpool(self._complete, job_id, result, time.perf_counter() - t0)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self._slots.release()
+
+    def _complete(self, job_id, result, seconds=None):
+        db = self.session_factory()
+        try:
+            job = db.get(models.IngestJob, job_id)
+            if job is not None:
+                job.run_seconds = seconds
+                self._finish(db, job, result)
+        finally:
+            db.close()
+
+    def _finish(self, db, job, result):
+        if isinstance(result, JobResult):
+            result = result.result
+        if isinstance(result, SkipJob):
+            job.status, job.error = "skipped", str(result)
+        elif isinstance(result, Exception):
+            job.error = f"{type(result).__name__}: {result}"
+            job.status = "failed" if job.attempts >= settings.INGEST_MAX_ATTEMPTS else "pending"
+        else:
+            try:
+                JOB_HANDLERS[job.kind][2](db, job, result)
+                job.status, job.error = "done", None
+            except Exception as e:
+                db.rollback()
+                job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+        job.updated_at = datetime.utcnow()
+        self._set_status(db, job, job.status)
+        db.commit()
+        audio_index.delete_released(db)
+        if job.status == "pending":
+            self.notify()
+
+    @staticmethod
+    def _set_status(db, job, status):
+        hook = STATUS_HOOKS.get(job.kind)
+        rp = db.get(models.Roleplay, job.roleplay_id) if hook is not None else None
+        if rp is not None:
+            hook(rp, status)
+            events.record(db, rp.id, "updated")
+
+
+def job_stats(db):
+    """Tiempos de los trabajos terminados por tipo: cuántos, media, p95 y máximo (segundos),
+    y cuántos segundos de audio se procesan por segundo de trabajo."""
+    IngestJob, Roleplay = models.IngestJob, models.Roleplay
+    rows = (
+        db.query(IngestJob.kind, IngestJob.run_seconds, Roleplay.duration)
+        .join(Roleplay, Roleplay.id == IngestJob.roleplay_id)
+        .filter(IngestJob.status == "done", IngestJob.run_seconds.isnot(None))
+        .all()
+    )
+    stats = {}
+    for kind in sorted({r[0] for r in rows}):
+        times = sorted(r[1] for r in rows if r[0] == kind)
+        audio = sum(r[2] or 0 for r in rows if r[0] == kind)
+        stats[kind] = {
+            "jobs": len(times),
+            "mean": round(sum(times) / len(times), 3),
+            "p95": round(times[min(len(times) - 1, int(len(times) * 0.95))], 3),
+            "max": round(times[-1], 3),
+            "realtime": round(audio / sum(times), 1) if sum(times) else None,
+        }
+    return stats
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        for kind, row in job_stats(db).items():
+            print(f"{kind}: {row}")
+    finally:
+        db.close()
@@ -1,23 +1,82 @@
 import os
 import json
-import uuid
+import asyncio
+import base64
+import functools
+import hashlib
+import stat
 import traceback
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Request
-from fastapi.responses import JSONResponse, FileResponse
+import aiofiles
+from typing import Any, List, Optional
+from pydantic import BaseModel, ValidationError
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Request, Query
+from fastapi.responses import (JSONResponse, FileResponse, PlainTextResponse, Response, RedirectResponse,
+                               StreamingResponse)
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
-from database import SessionLocal, engine
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_, not_
+from sqlalchemy.orm import Session, load_only, selectinload
+from database import SessionLocal, engine, async_engine, AsyncDB, get_async_db
 import models
-from datetime import datetime
+import settings
+import chunked_upload
+import audio_index
+import events
+import export
+import fastjson
+import metrics
+import search
+from compression import CompressionMiddleware
+from response_cache import ResponseCache, etag_matches, weak_etag
+from storage import CONTENT_KEY_RE, content_key, staging_path, storage
+from upload_limit import UploadLimitMiddleware
+from ingest import IngestWorker, enqueue_jobs
+from migrations import run_migrations
+from contextlib import asynccontextmanager
+from datetime import datetime, date, timedelta, timezone
+from email.utils import formatdate, parsedate_to_datetime
 
-app = FastAPI()
+ingest_worker = None
+event_hub = None
 
-models.Base.metadata.create_all(bind=engine)
+
+@asynccontextmanager
+async def lifespan(app):
+    global ingest_worker, event_hub
+    # Se lee al arrancar y no de settings: serve.py lo activa después de migrar,
+    # y con un solo worker uvicorn importa main en ese mismo proceso
+    if os.getenv("ROLEFY_SKIP_MIGRATIONS", "0") != "1":
+        run_migrations(engine, models.Base.metadata)
+    chunked_upload.cleanup_stale()
+    event_hub = events.EventHub(SessionLocal, serialize_roleplays)
+    if settings.INGEST_WORKERS > 0:
+        ingest_worker = IngestWorker(SessionLocal)
+        ingest_worker.start()
+    yield
+    if ingest_worker is not None:
+        await ingest_worker.stop()
+        ingest_worker = None
+    await event_hub.stop()
+    event_hub = None
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Antes de que se lea el formulario de /upload (ver upload_limit.py)
+app.add_middleware(UploadLimitMiddleware)
+
+# La compresión va por dentro de las métricas: así cuentan los bytes que salen de verdad
+if settings.COMPRESSION:
+    app.add_middleware(CompressionMiddleware)
+
+if settings.METRICS:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument_engine(engine)
+    if async_engine is not None:
+        metrics.instrument_engine(async_engine.sync_engine)
 
 # Montar carpeta static para servir logo, iconos, CSS, JS, etc.
 app.mount("/static", StaticFiles(directory="static"), name="static")
-# Montar carpeta uploads para servir audios
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
 
 def get_db():
@@ -28,6 +87,37 @@ def get_db():
         db.close()
 
 
+async def save_upload(upload: UploadFile, path: str):
+    """Guarda el audio en disco por bloques, sin cargarlo entero en memoria.
+
+    Corta la subida si supera MAX_UPLOAD_MB y devuelve (tamaño, sha256).
+    Starlette ya ha recibido el formulario entero en un fichero temporal:
+    los audios demasiado grandes se rechazan antes, en upload_limit.py.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(path, "wb") as f:
+            while True:
+                chunk = await upload.read(settings.UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > settings.MAX_UPLOAD_BYTES:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Audio too large (max {settings.MAX_UPLOAD_MB} MB)"
+                    )
+                digest.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        # No dejar ficheros a medias
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return size, digest.hexdigest()
+
+
 @app.post("/upload")
 async def upload_roleplay(
     comprador: str = Form(...),
@@ -35,112 +125,826 @@ async def upload_roleplay(
     productos: str = Form(...),
     costes: str = Form(...),
     audio: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncDB = Depends(get_async_db)
 ):
     if audio.content_type.split("/")[0] != "audio":
         raise HTTPException(status_code=400, detail="Must upload audio")
 
+    try:
+        productos_list = json.loads(productos)
+        costes_list = json.loads(costes)
+    except ValueError:
+        productos_list = costes_list = None
+    if not isinstance(productos_list, list) or not isinstance(costes_list, list):
+        raise HTTPException(status_code=400, detail="productos and costes must be JSON lists")
+
     ext = os.path.splitext(audio.filename)[1] or ".wav"
-    filename = f"{uuid.uuid4().hex}{ext}"
-    os.makedirs("uploads", exist_ok=True)
-    path = os.path.join("uploads", filename)
-    with open(path, "wb") as f:
-        f.write(await audio.read())
+    staged = staging_path(ext)
+    size, sha256 = await save_upload(audio, staged)
+    key = content_key(sha256, ext)
+    duration = await run_in_threadpool(store_audio, staged, key)
+
+    rp_id = await store_roleplay(db, comprador, vendedor, productos_list, costes_list, key, size, sha256, duration)
+    return JSONResponse({"status": "ok", "id": rp_id})
+
 
+def store_audio(staged, key):
+    """Lee la duración del audio y lo guarda en storage (si ya estaba, no se duplica)."""
+    duration = audio_index.audio_duration(staged)
+    storage.put(staged, key)
+    return duration
+
+
+async def store_roleplay(db: AsyncDB, comprador, vendedor, productos, costes, filename, size, sha256,
+                         duration=None, upload_id=None):
+    """Crea el roleplay de un audio ya guardado en storage y encola su procesado.
+
+    Si falla la inserción se borra el audio, salvo que lo use otro roleplay.
+    """
     rp = models.Roleplay(
         comprador=comprador,
         vendedor=vendedor,
-        productos=productos,
-        costes=costes,
-        audio_filename=filename
+        # Sin escapar los acentos: el índice de búsqueda lee este texto ("piña", no "pi\u00f1a")
+        productos=json.dumps(productos, ensure_ascii=False),
+        costes=json.dumps(costes, ensure_ascii=False),
+        audio_filename=filename,
+        audio_hash=sha256,
+        audio_size=size,
+        upload_id=upload_id,
+        items=models.build_items(productos, costes)
     )
+    try:
+        rp_id = await db.run(_insert_roleplay, rp, duration)
+    except Exception:
+        if not await db.run(_audio_in_use, filename):
+            await run_in_threadpool(storage.delete, filename)
+        raise
+    if ingest_worker is not None:
+        ingest_worker.notify()
+    if event_hub is not None:
+        event_hub.notify()
+    return rp_id
+
+
+def _insert_roleplay(db: Session, rp, duration):
     db.add(rp)
+    db.flush()
+    audio_index.add_reference(db, rp.audio_filename, rp.audio_size, rp.audio_hash, rp.id, duration=duration)
+    enqueue_jobs(db, rp)
+    events.record(db, rp.id, "created")
     db.commit()
-    db.refresh(rp)
-    return JSONResponse({"status": "ok", "id": rp.id})
+    return rp.id
+
+
+def _audio_in_use(db: Session, filename):
+    db.rollback()
+    return db.get(models.AudioFile, filename) is not None
+
+
+# --- Subidas por trozos reanudables ---
+
+class UploadInit(BaseModel):
+    upload_id: str
+    comprador: str
+    vendedor: str
+    productos: List
+    costes: List
+    filename: str = "recording.wav"
+    content_type: str = "audio/wav"
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+
+
+def _upload_status(upload_id, meta):
+    if meta.get("status") == "done":
+        return {"upload_id": upload_id, "status": "done", "id": meta["roleplay_id"]}
+    if meta.get("status") == "finalizing":
+        # Ya está todo recibido (el .part puede estar ya en storage): falta repetir finalize
+        return {"upload_id": upload_id, "status": "finalizing", "offset": meta["audio_size"]}
+    return {"upload_id": upload_id, "status": "open", "offset": chunked_upload.current_offset(upload_id)}
+
+
+def _load_upload(upload_id):
+    if not chunked_upload.valid_upload_id(upload_id):
+        raise HTTPException(status_code=400, detail="Invalid upload_id")
+    meta = chunked_upload.load_meta(upload_id)
+    if meta is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return meta
+
+
+# Segundos que espera un trozo o un cierre a que termine otro de la misma subida
+UPLOAD_LOCK_TIMEOUT = 30
+
+
+@asynccontextmanager
+async def upload_lock(upload_id):
+    """Una subida solo recibe un trozo (o se cierra) a la vez, también entre workers."""
+    deadline = asyncio.get_running_loop().time() + UPLOAD_LOCK_TIMEOUT
+    while True:
+        lock = chunked_upload.try_lock(upload_id)
+        if lock is not None:
+            break
+        if asyncio.get_running_loop().time() > deadline:
+            # El cliente lo reintenta más tarde (como cualquier 429)
+            raise HTTPException(status_code=429, detail="Upload busy", headers={"retry-after": "1"})
+        await asyncio.sleep(0.05)
+    state = {"done": False}
+    try:
+        yield state
+    finally:
+        chunked_upload.unlock(lock, remove=state["done"])
+
+
+@app.post("/upload/init")
+async def init_chunked_upload(body: UploadInit):
+    """Abre (o retoma) una subida por trozos. Devuelve el offset desde el que seguir."""
+    if not chunked_upload.valid_upload_id(body.upload_id):
+        raise HTTPException(status_code=400, detail="Invalid upload_id")
+    if body.content_type.split("/")[0] != "audio":
+        raise HTTPException(status_code=400, detail="Must upload audio")
+    if body.size is not None and body.size > settings.MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Audio too large (max {settings.MAX_UPLOAD_MB} MB)")
+    meta = chunked_upload.load_meta(body.upload_id)
+    if meta is None:
+        meta = body.model_dump()
+        meta["status"] = "open"
+        meta["created_at"] = datetime.utcnow().isoformat()
+        chunked_upload.save_meta(body.upload_id, meta)
+    return _upload_status(body.upload_id, meta)
+
+
+@app.get("/upload/{upload_id}")
+async def chunked_upload_status(upload_id: str):
+    return _upload_status(upload_id, _load_upload(upload_id))
+
+
+@app.put("/upload/{upload_id}")
+async def append_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    """Añade el cuerpo de la petición a la subida en la posición `offset`.
+
+    Si `offset` no coincide con lo que ya tiene el servidor responde 409 con
+    el offset correcto, para que el cliente continúe desde ahí.
+    """
+    meta = _load_upload(upload_id)
+    if meta.get("status") != "open":
+        return _upload_status(upload_id, meta)
+    async with upload_lock(upload_id):
+        # Otro worker puede haberla cerrado mientras se esperaba el lock
+        meta = _load_upload(upload_id)
+        if meta.get("status") != "open":
+            return _upload_status(upload_id, meta)
+        current = chunked_upload.current_offset(upload_id)
+        if offset != current:
+            return JSONResponse({"detail": "Offset mismatch", "offset": current}, status_code=409)
+        path = chunked_upload.data_path(upload_id)
+        written = 0
+        async with aiofiles.open(path, "ab") as f:
+            try:
+                async for chunk in request.stream():
+                    written += len(chunk)
+                    if current + written > settings.MAX_UPLOAD_BYTES:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"Audio too large (max {settings.MAX_UPLOAD_MB} MB)"
+                        )
+                    await f.write(chunk)
+            except BaseException:
+                # Un trozo cortado a medias se descarta entero
+                await f.truncate(current)
+                raise
+    return {"upload_id": upload_id, "status": "open", "offset": current + written}
+
+
+def _roleplay_for_upload(db: Session, upload_id):
+    row = db.query(models.Roleplay.id).filter(models.Roleplay.upload_id == upload_id).first()
+    return row[0] if row else None
+
+
+@app.post("/upload/{upload_id}/finalize")
+async def finalize_chunked_upload(upload_id: str, db: AsyncDB = Depends(get_async_db)):
+    """Cierra la subida y crea el roleplay igual que /upload. Repetirla devuelve el mismo id."""
+    _load_upload(upload_id)
+    async with upload_lock(upload_id) as lock_state:
+        meta = _load_upload(upload_id)
+        if meta.get("status") == "done":
+            lock_state["done"] = True
+            return _upload_status(upload_id, meta)
+        if meta.get("status") == "open":
+            part = chunked_upload.data_path(upload_id)
+            size = chunked_upload.current_offset(upload_id)
+            if size == 0 or (meta.get("size") is not None and size != meta["size"]):
+                return JSONResponse({"detail": "Upload incomplete", "offset": size}, status_code=409)
+            sha256 = await run_in_threadpool(audio_index.hash_file, part)
+            if meta.get("sha256") and meta["sha256"] != sha256:
+                # Contenido corrupto: se descarta para que el cliente lo reenvíe desde 0
+                chunked_upload.remove_data(upload_id)
+                return JSONResponse({"detail": "Checksum mismatch", "offset": 0}, status_code=409)
+            ext = os.path.splitext(meta["filename"])[1] or ".wav"
+            meta.update(status="finalizing", audio_filename=content_key(sha256, ext),
+                        audio_size=size, audio_hash=sha256)
+            chunked_upload.save_meta(upload_id, meta)
+
+        # status == "finalizing": el audio está en storage o aún en el .part
+        part = chunked_upload.data_path(upload_id)
+        if os.path.isfile(part):
+            meta["audio_duration"] = await run_in_threadpool(store_audio, part, meta["audio_filename"])
+            chunked_upload.save_meta(upload_id, meta)
+        rp_id = await db.run(_roleplay_for_upload, upload_id)
+        if rp_id is None:
+            if not await run_in_threadpool(storage.exists, meta["audio_filename"]):
+                # Se vuelve a abrir para que el cliente la reenvíe entera desde 0
+                for name in ("audio_filename", "audio_size", "audio_hash", "audio_duration"):
+                    meta.pop(name, None)
+                meta["status"] = "open"
+                chunked_upload.remove_data(upload_id)
+                chunked_upload.save_meta(upload_id, meta)
+                return JSONResponse({"detail": "Upload data lost, start again", "offset": 0}, status_code=410)
+            rp_id = await store_roleplay(
+                db, meta["comprador"], meta["vendedor"], meta["productos"], meta["costes"],
+                meta["audio_filename"], meta["audio_size"], meta["audio_hash"],
+                meta.get("audio_duration"), upload_id
+            )
+        meta.update(status="done", roleplay_id=rp_id)
+        chunked_upload.save_meta(upload_id, meta)
+        lock_state["done"] = True
+    return _upload_status(upload_id, meta)
+
+
+def cents_to_amount(cents):
+    return None if cents is None else cents / 100
+
+
+# Campos que puede devolver /roleplays (parámetro fields=): atributos que
+# necesita cada uno y cómo se serializa. "items" carga las líneas con un
+# único SELECT ... IN por página.
+ROLEPLAY_FIELDS = {
+    "id": ((), lambda r: r.id),
+    "comprador": (("comprador",), lambda r: r.comprador),
+    "vendedor": (("vendedor",), lambda r: r.vendedor),
+    "productos": (("items",), lambda r: [i.name for i in r.items]),
+    "costes": (("items",), lambda r: [cents_to_amount(i.cost_cents) for i in r.items]),
+    "total": (("total_cents",), lambda r: r.total_cents / 100),
+    "audio_url": (("audio_filename", "compact_filename"), lambda r: f"/audio/{r.compact_filename or r.audio_filename}"),
+    "transcode_status": (("transcode_status",), lambda r: r.transcode_status),
+    "duration": (("duration",), lambda r: r.duration),
+    "timestamp": (("timestamp",), lambda r: r.timestamp.isoformat()),
+    "feedback": (("feedback",), lambda r: r.feedback or ""),
+    "nota": (("nota",), lambda r: r.nota or ""),
+}
+
+# Con orjson (ver fastjson.py) las fechas se dejan tal cual: las escribe él
+NATIVE_GETTERS = {
+    "timestamp": lambda r: r.timestamp,
+}
+
+MAX_PAGE_SIZE = 500
+
+
+@functools.lru_cache(maxsize=None)
+def row_serializer(selected, native=False):
+    """Función fila -> dict con los campos `selected` (se prepara una vez por combinación de campos)."""
+    getters = tuple((f, NATIVE_GETTERS.get(f, ROLEPLAY_FIELDS[f][1]) if native else ROLEPLAY_FIELDS[f][1])
+                    for f in selected)
+    return lambda r: {f: get(r) for f, get in getters}
+
+
+def encode_cursor(ts, key):
+    raw = f"{ts.isoformat()}|{key}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor, key_type=int):
+    """Devuelve (timestamp, clave) de un cursor de paginación."""
+    try:
+        ts, key = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(ts), key_type(key)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def roleplay_query(db: Session, selected):
+    """Query de roleplays que carga solo lo necesario para los campos `selected`."""
+    Roleplay = models.Roleplay
+    columns = {"timestamp"}
+    for f in selected:
+        columns.update(ROLEPLAY_FIELDS[f][0])
+    q = db.query(Roleplay).options(load_only(*(getattr(Roleplay, c) for c in columns if c != "items")))
+    if "items" in columns:
+        q = q.options(selectinload(Roleplay.items))
+    return q
+
+
+def serialize_roleplays(db: Session, ids):
+    """{id: roleplay} con todos los campos de /roleplays (para los avisos de /events)."""
+    rows = roleplay_query(db, ROLEPLAY_FIELDS).filter(models.Roleplay.id.in_(ids))
+    serialize = row_serializer(tuple(ROLEPLAY_FIELDS))
+    return {r.id: serialize(r) for r in rows}
+
+
+def parse_fields(fields):
+    """Lista de campos pedidos con ?fields=a,b (todos si no se indica)."""
+    if not fields:
+        return list(ROLEPLAY_FIELDS)
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in ROLEPLAY_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return selected
+
+
+# Páginas de /roleplays ya serializadas (ver response_cache.py)
+roleplays_cache = ResponseCache(settings.ROLEPLAYS_CACHE_SIZE)
 
 
 @app.get("/roleplays")
-def list_roleplays(db: Session = Depends(get_db)):
-    items = db.query(models.Roleplay).all()
-    out = []
-    for r in items:
-        try:
-            productos = json.loads(r.productos)
-        except:
-            productos = []
-        try:
-            costes = json.loads(r.costes)
-        except:
-            costes = []
-        out.append({
-            "id": r.id,
-            "comprador": r.comprador,
-            "vendedor": r.vendedor,
-            "productos": productos,
-            "costes": costes,
-            "audio_url": f"/uploads/{r.audio_filename}",
-            "timestamp": r.timestamp.isoformat(),
-            "feedback": r.feedback or "",
-            "nota": r.nota or ""
-        })
-    return out
+def list_roleplays(
+    request: Request,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    student: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    has_feedback: Optional[bool] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Lista paginada de roleplays, de más reciente a más antiguo.
+
+    La paginación es por keyset sobre (timestamp, id): `next_cursor` se pasa
+    como `cursor` para pedir la página siguiente. La primera página trae
+    además `last_event_id`, desde donde seguir los cambios con /events.
+
+    Mientras no cambie ningún roleplay la respuesta sale de la caché, y si
+    el cliente ya la tiene (If-None-Match con el ETag) se responde 304.
+    """
+    selected = parse_fields(fields)
+
+    # Antes de leer la página: un cambio que llegue entre medias se recibirá por /events
+    last_id, version = events.data_version(db)
+    key = (limit, cursor, student, date_from, date_to, has_feedback, tuple(selected))
+    headers = {"etag": weak_etag(version, key), "cache-control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), headers["etag"]):
+        return Response(status_code=304, headers=headers)
+    body = roleplays_cache.get(version, key)
+    if body is None:
+        page = roleplays_page(db, limit, cursor, student, date_from, date_to, has_feedback, selected)
+        if not cursor:
+            page["last_event_id"] = last_id
+        body = fastjson.dumps(page)
+        roleplays_cache.put(version, key, body)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def roleplays_page(db: Session, limit, cursor, student, date_from, date_to, has_feedback, selected):
+    Roleplay = models.Roleplay
+    q = roleplay_query(db, selected)
+
+    if student:
+        q = q.filter(or_(Roleplay.comprador == student, Roleplay.vendedor == student))
+    if date_from:
+        q = q.filter(Roleplay.timestamp >= datetime.combine(date_from, datetime.min.time()))
+    if date_to:
+        q = q.filter(Roleplay.timestamp < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    if has_feedback is not None:
+        with_feedback = and_(Roleplay.feedback.isnot(None), Roleplay.feedback != "")
+        q = q.filter(with_feedback if has_feedback else not_(with_feedback))
+    if cursor:
+        ts, rp_id = decode_cursor(cursor)
+        q = q.filter(or_(Roleplay.timestamp < ts, and_(Roleplay.timestamp == ts, Roleplay.id < rp_id)))
+
+    # Se pide una fila de más para saber si hay página siguiente
+    rows = q.order_by(Roleplay.timestamp.desc(), Roleplay.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1].timestamp, rows[limit - 1].id) if len(rows) > limit else None
+    serialize = row_serializer(tuple(selected), native=fastjson.enabled)
+    items = [serialize(r) for r in rows[:limit]]
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@app.get("/search")
+def search_roleplays(
+    q: str = Query(..., max_length=200),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Busca en nombres, productos y feedback (ver search.py), de más a menos relevante.
+
+    Cada resultado trae los campos de /roleplays más `score` y `snippet`
+    (el trozo del feedback donde aparece lo buscado, si aparece ahí). Para
+    la página siguiente se pasa `next_offset` como `offset`.
+    """
+    selected = parse_fields(fields)
+    if not search.available(db):
+        raise HTTPException(status_code=503, detail="Search index not available")
+    # Una de más para saber si hay página siguiente
+    hits = search.search(db, q, limit + 1, offset)
+    ids = [rp_id for rp_id, _ in hits[:limit]]
+    rows = {}
+    if ids:
+        # El feedback siempre, para el fragmento
+        q_rows = roleplay_query(db, selected + ["feedback"]).filter(models.Roleplay.id.in_(ids))
+        rows = {r.id: r for r in q_rows}
+    serialize = row_serializer(tuple(selected), native=fastjson.enabled)
+    items = []
+    for rp_id, score in hits[:limit]:
+        if rp_id in rows:
+            items.append(dict(serialize(rows[rp_id]), score=round(score, 3),
+                              snippet=search.snippet(rows[rp_id].feedback, q)))
+    next_offset = offset + limit if len(hits) > limit else None
+    return fastjson.JSONResponse({"items": items, "next_offset": next_offset})
+
+
+def _load_waveform(db: Session, roleplay_id):
+    Roleplay = models.Roleplay
+    rp = (
+        db.query(Roleplay)
+        .options(load_only(Roleplay.duration, Roleplay.rms_db, Roleplay.silence_ratio, Roleplay.waveform))
+        .filter(Roleplay.id == roleplay_id)
+        .first()
+    )
+    if rp is None:
+        return None, None
+    job = (
+        db.query(models.IngestJob.status, models.IngestJob.error)
+        .filter(models.IngestJob.roleplay_id == roleplay_id, models.IngestJob.kind == "waveform")
+        .order_by(models.IngestJob.id.desc())
+        .first()
+    )
+    return rp, job
+
+
+@app.get("/roleplays/{roleplay_id}/waveform")
+async def get_waveform(roleplay_id: int, db: AsyncDB = Depends(get_async_db)):
+    """Duración, volumen medio, proporción de silencio y picos para dibujar el audio sin descargarlo.
+
+    Mientras no está calculado `peaks` es null y `status` dice en qué punto
+    está el trabajo (pending, running, failed...).
+    """
+    rp, job = await db.run(_load_waveform, roleplay_id)
+    if rp is None:
+        raise HTTPException(status_code=404, detail="Roleplay not found")
+    if rp.waveform is None:
+        body = {"id": roleplay_id, "status": job.status if job else "missing",
+                "error": job.error if job else None, "duration": rp.duration, "peaks": None}
+        return fastjson.JSONResponse(body, headers={"cache-control": "no-store"})
+    body = {
+        "id": roleplay_id,
+        "status": "done",
+        "duration": rp.duration,
+        "rms_db": rp.rms_db,
+        "silence_ratio": rp.silence_ratio,
+        "peaks": json.loads(rp.waveform),
+    }
+    # El audio de un roleplay no cambia, así que su forma de onda tampoco
+    return fastjson.JSONResponse(body, headers={"cache-control": AUDIO_CACHE_CONTROL})
+
+
+@app.get("/events")
+async def roleplay_events(request: Request, since: Optional[int] = Query(None, ge=0)):
+    """Avisos en directo (Server-Sent Events) de roleplays nuevos o cambiados.
+
+    Cada aviso `roleplay` trae el roleplay entero con los mismos campos que
+    /roleplays. `since` (o la cabecera Last-Event-ID al reconectar) es el
+    último evento recibido; si ya no se puede continuar desde ahí se manda
+    `reset` y el cliente debe recargar la lista.
+    """
+    last_event = request.headers.get("last-event-id")
+    if last_event and last_event.isdigit():
+        since = int(last_event)
+    headers = {"cache-control": "no-cache", "x-accel-buffering": "no"}
+    return StreamingResponse(event_hub.stream(since), media_type="text/event-stream", headers=headers)
+
+
+@app.get("/students")
+def list_students(db: Session = Depends(get_db)):
+    """Nombres distintos de compradores y vendedores, para el filtro del profesor."""
+    Roleplay = models.Roleplay
+    names = db.query(Roleplay.comprador).union(db.query(Roleplay.vendedor)).all()
+    return sorted(n for (n,) in names if n)
+
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "zip": "application/zip",
+}
+
+
+@app.get("/export")
+def export_roleplays(
+    format: str = Query("ndjson", pattern="^(ndjson|csv|zip)$"),
+    since: Optional[datetime] = None,
+    since_id: Optional[int] = Query(None, ge=0),
+    audio: str = Query("original", pattern="^(none|original|compact|all)$"),
+    db: Session = Depends(get_db)
+):
+    """Exporta los roleplays por streaming (NDJSON, CSV o ZIP con los audios).
+
+    Incremental: `since` devuelve solo lo que ha cambiado después de esa
+    fecha y `since_id` solo los roleplays con id mayor. La cabecera
+    X-Export-Until trae siempre el `since` para la siguiente exportación
+    (también si esta sale vacía); la siguiente puede repetir algunas filas
+    de esta, ver export.export_until.
+    """
+    if since is not None and since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)  # en la BD se guarda UTC sin zona
+    until = export.export_until(since)
+    headers = {"cache-control": "no-store", "x-export-until": until.isoformat()}
+    stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    headers["content-disposition"] = f'attachment; filename="rolefy-{stamp}.{format}"'
+    if format == "zip":
+        body = export.iter_zip(SessionLocal, since, since_id, audio=audio)
+    else:
+        rows = export.iter_rows(SessionLocal, since, since_id)
+        body = export.iter_ndjson(rows) if format == "ndjson" else export.iter_csv(rows)
+    return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
+
+
+class FeedbackPatch(BaseModel):
+    id: int
+    feedback: Optional[str] = None
+    nota: Optional[str] = None
+
+
+MAX_FEEDBACK_BATCH = 500
+
+
+class FeedbackBatch(BaseModel):
+    # Cada cambio se valida por separado: uno mal formado no tumba el lote entero
+    updates: List[Any]
+
+
+def _parse_feedback_patch(item):
+    """(FeedbackPatch, None) o (None, resultado de error) si el cambio no es válido."""
+    try:
+        return FeedbackPatch.model_validate(item), None
+    except ValidationError:
+        rp_id = item.get("id") if isinstance(item, dict) else None
+        return None, {"id": rp_id, "status": "error", "message": "Invalid feedback"}
+
+
+def _apply_feedback_batch(db: Session, items):
+    """Aplica varios cambios de feedback/nota con un solo SELECT ... IN y un solo commit.
+
+    Los cambios se aplican en orden (si un id se repite gana el último) y
+    se devuelve el resultado de cada uno: "Invalid feedback" si el cambio
+    no tiene un id entero o trae feedback/nota que no son texto, "Roleplay
+    not found" si el id no existe.
+    """
+    Roleplay = models.Roleplay
+    parsed = [_parse_feedback_patch(item) for item in items]
+    ids = {p.id for p, _ in parsed if p is not None}
+    found = {
+        rp.id: rp for rp in
+        db.query(Roleplay).options(load_only(Roleplay.feedback, Roleplay.nota)).filter(Roleplay.id.in_(ids))
+    } if ids else {}
+    results = []
+    for p, error in parsed:
+        if p is None:
+            results.append(error)
+            continue
+        rp = found.get(p.id)
+        if rp is None:
+            results.append({"id": p.id, "status": "error", "message": "Roleplay not found"})
+            continue
+        if p.feedback is not None:
+            rp.feedback = p.feedback
+        if p.nota is not None:
+            rp.nota = p.nota
+        results.append({"id": p.id, "status": "ok"})
+    for rp in found.values():
+        if db.is_modified(rp):
+            events.record(db, rp.id, "updated")
+    db.commit()
+    return results
+
+
+def _apply_feedback(db: Session, roleplay_id, feedback, nota):
+    return _apply_feedback_batch(db, [{"id": roleplay_id, "feedback": feedback, "nota": nota}])[0]
+
+
+@app.post("/feedback/batch")
+async def update_feedback_batch(body: FeedbackBatch, db: AsyncDB = Depends(get_async_db)):
+    """Guarda de una vez los cambios de feedback/nota de la tabla del profesor."""
+    if len(body.updates) > MAX_FEEDBACK_BATCH:
+        raise HTTPException(status_code=413, detail=f"Too many updates (max {MAX_FEEDBACK_BATCH})")
+    if not body.updates:
+        return {"results": []}
+    results = await db.run(_apply_feedback_batch, body.updates)
+    event_hub.notify()
+    return {"results": results}
 
 
 @app.post("/update_feedback")
-async def update_feedback(request: Request, db: Session = Depends(get_db)):
+async def update_feedback(request: Request, db: AsyncDB = Depends(get_async_db)):
     try:
         data = await request.json()
         roleplay_id = data.get("id")
         feedback = data.get("feedback", None)
         nota = data.get("nota", None)
 
-        rp = db.query(models.Roleplay).filter(models.Roleplay.id == roleplay_id).first()
-
-        if rp:
-            if feedback is not None:
-                rp.feedback = feedback
-            if nota is not None:
-                rp.nota = nota
-            db.commit()
+        result = await db.run(_apply_feedback, roleplay_id, feedback, nota)
+        if result["status"] == "ok":
+            event_hub.notify()
             return {"status": "ok"}
 
-        return {"status": "error", "message": "Roleplay not found"}
+        return {"status": "error", "message": result["message"]}
 
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+# Los nombres de audio son el hash de su contenido: el navegador puede cachearlos para siempre
+AUDIO_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+AUDIO_MEDIA_TYPES = {
+    ".wav": "audio/wav",
+    ".webm": "audio/webm",
+    ".mp3": "audio/mpeg",
+    ".ogg": "audio/ogg",
+    ".opus": "audio/ogg",
+    ".flac": "audio/flac",
+}
+
+
+def _resolve_alias(db: Session, filename):
+    """Clave actual de un audio pedido por su nombre de antes del storage por contenido."""
+    alias = db.get(models.AudioAlias, filename)
+    return alias.filename if alias is not None else filename
+
+
+def _find_audio(db: Session, filename):
+    Roleplay = models.Roleplay
+    return (
+        db.query(Roleplay)
+        .options(load_only(Roleplay.audio_filename, Roleplay.audio_hash, Roleplay.compact_filename,
+                           Roleplay.compact_hash, Roleplay.transcode_status))
+        .filter(or_(Roleplay.audio_filename == filename, Roleplay.compact_filename == filename))
+        .first()
+    )
+
+
+def is_not_modified(request_headers, etag, mtime):
+    """Comprueba If-None-Match / If-Modified-Since para responder 304."""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+
 @app.get("/audio/{filename}")
-async def get_audio(filename: str):
-    path = os.path.join("uploads", filename)
-    if not os.path.isfile(path):
+async def get_audio(
+    filename: str,
+    request: Request,
+    variant: str = Query("compact", pattern="^(compact|original)$"),
+    db: AsyncDB = Depends(get_async_db)
+):
+    """Sirve un audio con soporte de Range (206), ETag fuerte y 304.
+
+    Pedido por el nombre original, sirve la versión comprimida si ya existe
+    (salvo con ?variant=original).
+    """
+    if not CONTENT_KEY_RE.match(filename):
+        filename = await db.run(_resolve_alias, filename)
+    rp = await db.run(_find_audio, filename)
+    audio_hash = None
+    cache_control = AUDIO_CACHE_CONTROL
+    if rp is not None:
+        if filename == rp.compact_filename:
+            audio_hash = rp.compact_hash
+        elif variant == "compact" and rp.compact_filename:
+            filename, audio_hash = rp.compact_filename, rp.compact_hash
+        else:
+            audio_hash = rp.audio_hash
+            if variant == "compact" and rp.transcode_status in ("pending", "running"):
+                # Esta URL pasará a servir la versión comprimida: que el navegador revalide
+                cache_control = "no-cache"
+
+    try:
+        stat_result = await run_in_threadpool(storage.stat, filename)
+    except ValueError:
+        stat_result = None
+    if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
         raise HTTPException(status_code=404, detail="Audio file not found")
     ext = os.path.splitext(filename)[1].lower()
-    media = {
-        ".wav": "audio/wav",
-        ".webm": "audio/webm",
-        ".mp3": "audio/mpeg"
-    }.get(ext, "application/octet-stream")
-    return FileResponse(path, media_type=media)
+    media = AUDIO_MEDIA_TYPES.get(ext, "application/octet-stream")
+
+    etag = f'"{audio_hash}"' if audio_hash else f'"{int(stat_result.st_mtime)}-{stat_result.st_size}"'
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "cache-control": cache_control,
+    }
+    if is_not_modified(request.headers, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+    url = storage.url(filename)
+    if url is not None:
+        # S3: el navegador descarga directamente del bucket (que atiende Range)
+        return RedirectResponse(url, status_code=307, headers={"cache-control": "no-store"})
+    # FileResponse atiende Range / If-Range y devuelve 206 con el trozo pedido
+    return FileResponse(storage.local_path(filename), media_type=media, headers=headers, stat_result=stat_result)
+
+
+@app.get("/uploads/{filename}")
+async def get_upload(filename: str, request: Request, db: AsyncDB = Depends(get_async_db)):
+    """Las URLs /uploads/<fichero> de antes (era una carpeta estática): sirven el audio tal cual se subió.
+
+    Los nombres antiguos (<uuid>.wav) se buscan en audio_aliases, que rellena
+    la migración al storage por contenido.
+    """
+    return await get_audio(filename, request, variant="original", db=db)
 
 
 @app.get("/uploads")
-def list_uploads():
-    UPLOADS_FOLDER = "uploads"
-    if not os.path.isdir(UPLOADS_FOLDER):
-        return JSONResponse(content=[], status_code=200)
-    files = []
-    for fname in os.listdir(UPLOADS_FOLDER):
-        if fname.lower().endswith((".wav", ".webm", ".mp3")):
-            path = os.path.join(UPLOADS_FOLDER, fname)
-            files.append({
-                "filename": fname,
-                "timestamp": datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
-            })
-    files.sort(key=lambda x: x["timestamp"], reverse=True)
-    return JSONResponse(content=files)
+def list_uploads(
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Audios guardados, del más reciente al más antiguo, desde el índice audio_files.
+
+    Paginación por keyset sobre (mtime, filename), igual que /roleplays.
+    """
+    AudioFile = models.AudioFile
+    q = db.query(AudioFile)
+    if cursor:
+        ts, name = decode_cursor(cursor, key_type=str)
+        q = q.filter(or_(AudioFile.mtime < ts, and_(AudioFile.mtime == ts, AudioFile.filename < name)))
+    rows = q.order_by(AudioFile.mtime.desc(), AudioFile.filename.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1].mtime, rows[limit - 1].filename) if len(rows) > limit else None
+    items = [{
+        "filename": a.filename,
+        "timestamp": a.mtime.isoformat(),
+        "size": a.size,
+        "duration": a.duration,
+        "hash": a.hash,
+        "roleplay_id": a.roleplay_id,
+        "variant": a.variant,
+        "refcount": a.refcount,
+    } for a in rows[:limit]]
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def check_health():
+    """Comprueba que la base de datos responde y que se puede escribir en la carpeta de audios."""
+    checks = {}
+    try:
+        with engine.connect() as conn:
+            conn.exec_driver_sql("SELECT 1")
+        checks["db"] = "ok"
+    except Exception as e:
+        checks["db"] = f"error: {type(e).__name__}: {e}"
+    try:
+        storage.check()
+        checks["uploads"] = "ok"
+    except Exception as e:
+        checks["uploads"] = f"error: {e}"
+    if settings.INGEST_WORKERS <= 0:
+        checks["ingest"] = "disabled"
+    else:
+        checks["ingest"] = "ok" if ingest_worker is not None else "starting"
+    return checks
+
+
+@app.get("/healthz")
+async def healthz():
+    """Sonda de disponibilidad (launcher, app de alumnos): 200 si todo está listo, 503 si no."""
+    checks = await run_in_threadpool(check_health)
+    ready = checks["db"] == "ok" and checks["uploads"] == "ok"
+    checks["status"] = "ok" if ready else "unavailable"
+    return JSONResponse(content=checks, status_code=200 if ready else 503,
+                        headers={"Cache-Control": "no-store"})
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Métricas de este worker en formato de texto de Prometheus."""
+    text = metrics.metrics.render() + (
+        "# TYPE rolefy_roleplays_cache_hits_total counter\n"
+        f"rolefy_roleplays_cache_hits_total {roleplays_cache.hits}\n"
+        "# TYPE rolefy_roleplays_cache_misses_total counter\n"
+        f"rolefy_roleplays_cache_misses_total {roleplays_cache.misses}\n"
+    )
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4",
+                             headers={"cache-control": "no-store"})
+
+
+@app.get("/metrics/slow")
+async def get_slow_requests():
+    """Las peticiones más lentas que ROLEFY_SLOW_REQUEST_MS (con sus pilas si ROLEFY_PROFILE=1)."""
+    return JSONResponse(metrics.metrics.slow_requests(), headers={"cache-control": "no-store"})
 
 
 @app.get("/")
@@ -149,5 +953,5 @@ async def serve_index():
 
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
+    import serve
+    serve.main()
@@ -0,0 +1,267 @@
+"""Métricas de las peticiones en formato Prometheus (/metrics).
+
+MetricsMiddleware es un middleware ASGI puro (no envuelve la respuesta, así
+que no rompe el streaming de /export ni de /audio) que anota por ruta:
+  - latencia (histograma) y número de peticiones por código de respuesta
+  - peticiones en curso
+  - bytes recibidos y enviados, y bytes/s de las subidas
+  - tiempo y número de consultas a la base de datos de cada petición
+    (con eventos de SQLAlchemy; ver `instrument_engine`)
+  - excepciones no capturadas
+
+Las rutas se etiquetan con su plantilla (/roleplays/{roleplay_id}/waveform),
+así el número de series no crece con los ids. Cada worker de uvicorn lleva
+sus propias métricas.
+
+Además se guardan las SLOWEST_KEPT peticiones más lentas que
+ROLEFY_SLOW_REQUEST_MS (ver /metrics/slow). Con ROLEFY_PROFILE=1 un hilo
+muestrea cada PROFILE_INTERVAL_MS las pilas de todos los hilos, y a cada
+petición lenta se le adjuntan las pilas más repetidas mientras duraba.
+"""
+import bisect
+import contextvars
+import heapq
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, defaultdict, deque
+
+import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+RATE_BUCKETS = (64e3, 256e3, 1e6, 4e6, 16e6, 64e6, 256e6)
+# Solo se mide la velocidad de subida de cuerpos a partir de este tamaño
+UPLOAD_RATE_MIN_BYTES = 64 * 1024
+# Conexiones largas (SSE) o la propia consulta de métricas: no cuentan
+SKIP_ROUTES = {"/metrics", "/metrics/slow", "/events"}
+SLOWEST_KEPT = 20
+PROFILE_INTERVAL_MS = 10
+PROFILE_SAMPLES_KEPT = 6000  # un minuto de muestras a 10 ms
+PROFILE_TOP_STACKS = 15
+
+# Tiempo de base de datos de la petición en curso (lo suman los eventos de SQLAlchemy)
+_db_usage = contextvars.ContextVar("rolefy_db_usage", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Metrics:
+    """Contadores e histogramas de un proceso. Los escribe el event loop; se leen al exportar."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.in_flight = 0
+        self.requests = Counter()            # (method, route, status)
+        self.exceptions = Counter()          # (method, route)
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.request_size = defaultdict(lambda: Histogram(SIZE_BUCKETS))
+        self.response_size = defaultdict(lambda: Histogram(SIZE_BUCKETS))
+        self.upload_rate = defaultdict(lambda: Histogram(RATE_BUCKETS))
+        self.db_time = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.db_queries = Counter()
+        self.slowest = []                    # heap de (segundos, n, registro)
+        self._slow_n = 0
+        self._lock = threading.Lock()
+
+    def record(self, method, route, status, seconds, received, sent, upload_seconds, db, error):
+        key = (method, route)
+        self.requests[(method, route, status)] += 1
+        self.latency[key].observe(seconds)
+        self.request_size[key].observe(received)
+        self.response_size[key].observe(sent)
+        if received >= UPLOAD_RATE_MIN_BYTES and upload_seconds > 0:
+            self.upload_rate[key].observe(received / upload_seconds)
+        self.db_time[key].observe(db[0])
+        self.db_queries[key] += db[1]
+        if error:
+            self.exceptions[key] += 1
+
+    def keep_slow(self, entry):
+        with self._lock:
+            self._slow_n += 1
+            item = (entry["seconds"], self._slow_n, entry)
+            if len(self.slowest) < SLOWEST_KEPT:
+                heapq.heappush(self.slowest, item)
+            elif item[0] > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, item)
+
+    def slow_requests(self):
+        with self._lock:
+            return [entry for _, _, entry in sorted(self.slowest, key=lambda x: -x[0])]
+
+    def render(self):
+        """Texto en formato de exposición de Prometheus."""
+        lines = [
+            "# TYPE rolefy_http_requests_in_flight gauge",
+            f"rolefy_http_requests_in_flight {self.in_flight}",
+            "# TYPE rolefy_process_start_time_seconds gauge",
+            f"rolefy_process_start_time_seconds {self.started:.0f}",
+            "# TYPE rolefy_http_requests_total counter",
+        ]
+        for (method, route, status), n in sorted(self.requests.items()):
+            lines.append(f'rolefy_http_requests_total{{method="{method}",route="{route}",status="{status}"}} {n}')
+        lines.append("# TYPE rolefy_http_exceptions_total counter")
+        for (method, route), n in sorted(self.exceptions.items()):
+            lines.append(f'rolefy_http_exceptions_total{{method="{method}",route="{route}"}} {n}')
+        lines.append("# TYPE rolefy_db_queries_total counter")
+        for (method, route), n in sorted(self.db_queries.items()):
+            lines.append(f'rolefy_db_queries_total{{method="{method}",route="{route}"}} {n}')
+        for name, histograms in (
+            ("rolefy_http_request_duration_seconds", self.latency),
+            ("rolefy_http_request_size_bytes", self.request_size),
+            ("rolefy_http_response_size_bytes", self.response_size),
+            ("rolefy_http_upload_bytes_per_second", self.upload_rate),
+            ("rolefy_db_duration_seconds", self.db_time),
+        ):
+            lines.append(f"# TYPE {name} histogram")
+            for (method, route), h in sorted(histograms.items()):
+                labels = f'method="{method}",route="{route}"'
+                total = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    total += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {total}')
+                total += h.counts[-1]
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {total}')
+                lines.append(f"{name}_sum{{{labels}}} {h.sum:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {total}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+# --- Tiempo de base de datos ---
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("rolefy_query_start", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["rolefy_query_start"].pop()
+    usage = _db_usage.get()
+    if usage is not None:
+        usage[0] += time.perf_counter() - started
+        usage[1] += 1
+
+
+def instrument_engine(engine):
+    """Suma el tiempo de cada consulta de `engine` a la petición en curso."""
+    from sqlalchemy import event
+
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", _after_execute)
+
+
+# --- Profiler por muestreo (opcional) ---
+
+class StackSampler(threading.Thread):
+    """Guarda cada PROFILE_INTERVAL_MS la pila de cada hilo (menos este), con su hora."""
+
+    def __init__(self):
+        super().__init__(daemon=True, name="rolefy-profiler")
+        self.samples = deque(maxlen=PROFILE_SAMPLES_KEPT)
+
+    def run(self):
+        me = threading.get_ident()
+        while True:
+            now = time.perf_counter()
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = traceback.extract_stack(frame, limit=30)
+                self.samples.append((now, ";".join(f"{f.name} ({f.filename.rsplit('/', 1)[-1]}:{f.lineno})"
+                                                   for f in stack)))
+            time.sleep(PROFILE_INTERVAL_MS / 1000)
+
+    def top_stacks(self, start, end):
+        counts = Counter(stack for t, stack in list(self.samples) if start <= t <= end)
+        return [{"samples": n, "stack": stack} for stack, n in counts.most_common(PROFILE_TOP_STACKS)]
+
+
+sampler = None
+
+
+def start_profiler():
+    global sampler
+    if sampler is None:
+        sampler = StackSampler()
+        sampler.start()
+
+
+# --- Middleware ---
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        if settings.PROFILE:
+            start_profiler()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in SKIP_ROUTES:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        state = {"status": 500, "received": 0, "sent": 0, "body_done": None}
+        usage = [0.0, 0]
+        token = _db_usage.set(usage)
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                state["received"] += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    state["body_done"] = time.perf_counter()
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["sent"] += len(message.get("body", b""))
+            await send(message)
+
+        metrics.in_flight += 1
+        error = False
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        except Exception:
+            error = True
+            raise
+        finally:
+            metrics.in_flight -= 1
+            _db_usage.reset(token)
+            end = time.perf_counter()
+            seconds = end - start
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            upload_seconds = (state["body_done"] or end) - start
+            metrics.record(scope["method"], route, state["status"], seconds, state["received"],
+                           state["sent"], upload_seconds, usage, error)
+            if seconds * 1000 >= settings.SLOW_REQUEST_MS:
+                entry = {
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route,
+                    "status": state["status"],
+                    "seconds": round(seconds, 4),
+                    "db_seconds": round(usage[0], 4),
+                    "db_queries": usage[1],
+                    "received": state["received"],
+                    "sent": state["sent"],
+                    "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                }
+                if sampler is not None:
+                    entry["stacks"] = sampler.top_stacks(start, end)
+                metrics.keep_slow(entry)
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+import search
+
+
+def run_migrations(engine, metadata):
+    """Crea las tablas que falten y añade columnas e índices nuevos a una BD existente.
+
+    `create_all` no modifica tablas que ya existen, así que las columnas
+    añadidas al modelo después de crear `roleplay.db` se añaden aquí con
+    ALTER TABLE (SQLite solo admite añadir columnas nullable). Después se
+    aplican una sola vez las migraciones de datos pendientes.
+    """
+    metadata.create_all(bind=engine)
+
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+    # Índice de búsqueda (search.py): no es un modelo, se crea con SQL
+    with engine.begin() as conn:
+        search.create_index(conn)
+
+    run_data_migrations(engine)
+
+
+def _load_list(raw):
+    try:
+        value = json.loads(raw)
+    except (TypeError, ValueError):
+        return []
+    return value if isinstance(value, list) else []
+
+
+def backfill_roleplay_items(conn):
+    """Pasa productos/costes (JSON en texto) de los roleplays antiguos a roleplay_items."""
+    from models import build_items
+
+    rows = conn.execute(text(
+        "SELECT id, productos, costes FROM roleplays r "
+        "WHERE NOT EXISTS (SELECT 1 FROM roleplay_items i WHERE i.roleplay_id = r.id)"
+    )).fetchall()
+    params = []
+    for rp_id, productos, costes in rows:
+        for item in build_items(_load_list(productos), _load_list(costes)):
+            params.append({
+                "roleplay_id": rp_id,
+                "position": item.position,
+                "name": item.name,
+                "cost_cents": item.cost_cents,
+            })
+    if params:
+        conn.execute(text(
+            "INSERT INTO roleplay_items (roleplay_id, position, name, cost_cents) "
+            "VALUES (:roleplay_id, :position, :name, :cost_cents)"
+        ), params)
+    print(f"Backfill roleplay_items: {len(rows)} roleplays, {len(params)} líneas")
+
+
+def backfill_audio_hashes(conn):
+    """Calcula el sha256 y el tamaño de los audios subidos antes de guardarlos (para los ETag)."""
+    import settings
+
+    rows = conn.execute(text(
+        "SELECT id, audio_filename FROM roleplays WHERE audio_hash IS NULL"
+    )).fetchall()
+    done = 0
+    for rp_id, filename in rows:
+        path = os.path.join(settings.UPLOAD_DIR, filename)
+        if not os.path.isfile(path):
+            continue
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(settings.UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        conn.execute(
+            text("UPDATE roleplays SET audio_hash = :h, audio_size = :s WHERE id = :id"),
+            {"h": digest.hexdigest(), "s": os.path.getsize(path), "id": rp_id},
+        )
+        done += 1
+    print(f"Backfill audio_hash: {done} de {len(rows)} audios")
+
+
+def backfill_audio_index(conn):
+    """Crea el índice audio_files con los audios que ya hay en UPLOAD_DIR."""
+    from sqlalchemy.orm import Session
+    import audio_index
+
+    report = audio_index.reconcile(Session(bind=conn), fix=True)
+    print(f"Backfill audio_files: {len(report['unindexed'])} audios, {len(report['orphans'])} sin roleplay")
+
+
+def move_audio_to_content_storage(conn):
+    """Pasa los audios de uploads/<uuid>.ext a storage por contenido (<sha256>.ext, repartidos en carpetas).
+
+    Los audios repetidos quedan en un solo fichero. Se copian, y los
+    originales solo se borran después del commit (la función que se
+    devuelve): si algo falla antes, la base de datos vuelve atrás y los
+    ficheros siguen donde estaban. Se puede repetir sin problema: si un
+    audio ya se copió se reconoce por su hash.
+    """
+    import audio_index
+    import settings
+    from sqlalchemy.orm import Session
+    from storage import CONTENT_KEY_RE, content_key, staging_path, storage
+
+    rows = conn.execute(text(
+        "SELECT id, audio_filename, audio_hash, compact_filename, compact_hash FROM roleplays"
+    )).fetchall()
+    moved = set()
+    for rp_id, audio, audio_hash, compact, compact_hash in rows:
+        for column, name, sha256 in (("audio", audio, audio_hash), ("compact", compact, compact_hash)):
+            if not name or CONTENT_KEY_RE.match(name):
+                continue
+            flat = os.path.join(settings.UPLOAD_DIR, name)
+            if sha256 is None and os.path.isfile(flat):
+                sha256 = audio_index.hash_file(flat)
+            if sha256 is None:
+                continue
+            key = content_key(sha256, os.path.splitext(name)[1])
+            if os.path.isfile(flat):
+                if not storage.exists(key):
+                    copy = staging_path(os.path.splitext(name)[1])
+                    shutil.copyfile(flat, copy)
+                    storage.put(copy, key)
+                moved.add(flat)
+            elif not storage.exists(key):
+                continue
+            conn.execute(
+                text(f"UPDATE roleplays SET {column}_filename = :key, {column}_hash = :h WHERE id = :id"),
+                {"key": key, "h": sha256, "id": rp_id},
+            )
+            # /uploads/<nombre antiguo> y /audio/<nombre antiguo> siguen funcionando
+            conn.execute(
+                text("INSERT OR IGNORE INTO audio_aliases (alias, filename) VALUES (:alias, :key)"),
+                {"alias": name, "key": key},
+            )
+    # Los originales copiados no cuentan como huérfanos: se borran tras el commit
+    report = audio_index.reconcile(Session(bind=conn), fix=True, ignore={os.path.basename(f) for f in moved})
+    print(f"Storage por contenido: {len(moved)} audios movidos, {len(report['orphans'])} sin roleplay")
+
+    def remove_originals():
+        for flat in moved:
+            try:
+                os.remove(flat)
+            except OSError as e:
+                print("No se pudo borrar", flat, e)
+    return remove_originals
+
+
+def enqueue_waveform_jobs(conn):
+    """Encola el análisis de forma de onda de los roleplays que ya había (lo hace el IngestWorker)."""
+    result = conn.execute(text(
+        "INSERT INTO ingest_jobs (roleplay_id, kind, status, attempts, created_at, updated_at) "
+        "SELECT id, 'waveform', 'pending', 0, :now, :now FROM roleplays r WHERE waveform IS NULL "
+        "AND NOT EXISTS (SELECT 1 FROM ingest_jobs j WHERE j.roleplay_id = r.id AND j.kind = 'waveform')"
+    ), {"now": datetime.utcnow()})
+    print(f"Forma de onda: {result.rowcount} roleplays en cola")
+
+
+def build_search_index(conn):
+    """Indexa para /search los roleplays que ya había (los nuevos los añaden los triggers)."""
+    if not search.available(conn):
+        return
+    search.rebuild(conn)
+    count = conn.execute(text("SELECT count(*) FROM roleplays")).scalar()
+    print(f"Índice de búsqueda: {count} roleplays")
+
+
+def unescape_productos(conn):
+    """Reescribe sin escapes \\uXXXX los productos guardados con json.dumps por defecto.
+
+    El índice de búsqueda lee la columna tal cual: con "pl\\u00e1tanos" no
+    se encontraba "plátanos" ni "platanos". El trigger de UPDATE vuelve a
+    indexar cada roleplay que cambia.
+    """
+    rows = conn.execute(text("SELECT id, productos FROM roleplays WHERE productos LIKE '%\\u%'")).fetchall()
+    params = []
+    for rp_id, productos in rows:
+        try:
+            value = json.loads(productos)
+        except (TypeError, ValueError):
+            continue
+        decoded = json.dumps(value, ensure_ascii=False)
+        if decoded != productos:
+            params.append({"id": rp_id, "productos": decoded})
+    if params:
+        conn.execute(text("UPDATE roleplays SET productos = :productos WHERE id = :id"), params)
+    print(f"Productos con acentos: {len(params)} roleplays reescritos")
+
+
+# Migraciones de datos, en orden. Se guarda en PRAGMA user_version cuántas
+# se han aplicado, así cada una se ejecuta una única vez por base de datos.
+# Cada una va en su propia transacción (con su user_version): si falla una,
+# las anteriores ya quedan hechas. Si una devuelve una función, se llama
+# después del commit (para lo que no se puede deshacer, como borrar ficheros).
+DATA_MIGRATIONS = [
+    backfill_roleplay_items,
+    backfill_audio_hashes,
+    backfill_audio_index,
+    move_audio_to_content_storage,
+    enqueue_waveform_jobs,
+    build_search_index,
+    unescape_productos,
+]
+
+
+def run_data_migrations(engine):
+    with engine.connect() as conn:
+        version = conn.execute(text("PRAGMA user_version")).scalar()
+    for number, migration in enumerate(DATA_MIGRATIONS, start=1):
+        if number <= version:
+            continue
+        with engine.begin() as conn:
+            after_commit = migration(conn)
+            conn.execute(text(f"PRAGMA user_version = {number}"))
+        if callable(after_commit):
+            after_commit()
+
+
+if __name__ == "__main__":
+    from database import engine
+    import models
+
+    run_migrations(engine, models.Base.metadata)
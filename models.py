@@ -1,18 +1,139 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, func, select
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship, column_property, deferred
 from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from itertools import zip_longest
 
 Base = declarative_base()
 
+
+class RoleplayItem(Base):
+    __tablename__ = "roleplay_items"
+
+    id = Column(Integer, primary_key=True)
+    roleplay_id = Column(Integer, ForeignKey("roleplays.id", ondelete="CASCADE"), nullable=False, index=True)
+    position = Column(Integer, nullable=False, default=0)
+    name = Column(String, nullable=False, default="")
+    cost_cents = Column(Integer, nullable=True)  # None si el precio no era un número
+
+
 class Roleplay(Base):
     __tablename__ = "roleplays"
 
     id = Column(Integer, primary_key=True, index=True)
-    comprador = Column(String, nullable=False)
-    vendedor = Column(String, nullable=False)
-    productos = Column(String, nullable=False)  # JSON serializado en string
-    costes = Column(String, nullable=False)     # JSON serializado en string
-    audio_filename = Column(String, nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    comprador = Column(String, nullable=False, index=True)
+    vendedor = Column(String, nullable=False, index=True)
+    productos = Column(String, nullable=False)  # JSON tal cual lo envió el cliente (ver items)
+    costes = Column(String, nullable=False)     # JSON tal cual lo envió el cliente (ver items)
+    audio_filename = Column(String, nullable=False, index=True)  # clave en storage: <sha256><ext>
+    audio_hash = Column(String, nullable=True)      # sha256 del audio original
+    audio_size = Column(Integer, nullable=True)     # tamaño en bytes
+    upload_id = Column(String, nullable=True, index=True)  # id de la subida por trozos que lo creó
+    # Variante comprimida (Opus/MP3) generada en segundo plano por ingest.py
+    compact_filename = Column(String, nullable=True, index=True)
+    compact_hash = Column(String, nullable=True)
+    compact_size = Column(Integer, nullable=True)
+    transcode_status = Column(String, nullable=True)  # pending / running / done / failed / skipped
+    # Calculado en segundo plano por waveform.py
+    duration = Column(Float, nullable=True, index=True)  # segundos
+    rms_db = Column(Float, nullable=True)                # volumen medio en dBFS
+    silence_ratio = Column(Float, nullable=True)         # 0..1
+    waveform = deferred(Column(String, nullable=True))   # JSON con los picos (0..1)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    # Último cambio (feedback, nota, procesado); para exportar solo lo nuevo
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     feedback = Column(String, nullable=True, default="")
     nota = Column(String, nullable=True, default="")
+
+    items = relationship(
+        RoleplayItem,
+        order_by=RoleplayItem.position,
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+    # Total en céntimos calculado en SQL (solo se carga si se pide)
+    total_cents = column_property(
+        select(func.coalesce(func.sum(RoleplayItem.cost_cents), 0))
+        .where(RoleplayItem.roleplay_id == id)
+        .correlate_except(RoleplayItem)
+        .scalar_subquery(),
+        deferred=True,
+    )
+
+
+class IngestJob(Base):
+    """Trabajo de procesado de un audio subido (cola persistente, ver ingest.py)."""
+    __tablename__ = "ingest_jobs"
+
+    id = Column(Integer, primary_key=True)
+    roleplay_id = Column(Integer, ForeignKey("roleplays.id", ondelete="CASCADE"), nullable=False, index=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending", index=True)  # pending / running / done / failed
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+    run_seconds = Column(Float, nullable=True)  # lo que tardó la última ejecución
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class AudioFile(Base):
+    """Índice de los audios guardados en storage, para no recorrer la carpeta (ver audio_index.py)."""
+    __tablename__ = "audio_files"
+
+    filename = Column(String, primary_key=True)
+    size = Column(Integer, nullable=False)
+    mtime = Column(DateTime, nullable=False, index=True)
+    hash = Column(String, nullable=True)        # sha256
+    duration = Column(Float, nullable=True)     # segundos, si se pudo leer la cabecera
+    roleplay_id = Column(Integer, ForeignKey("roleplays.id", ondelete="SET NULL"), nullable=True, index=True)
+    variant = Column(String, nullable=False, default="original")  # original / compact
+    refcount = Column(Integer, nullable=True, default=1)  # campos de roleplays que usan este audio
+
+
+class AudioAlias(Base):
+    """Nombre que tenía un audio antes del storage por contenido (<uuid>.wav), para las URLs antiguas."""
+    __tablename__ = "audio_aliases"
+
+    alias = Column(String, primary_key=True)
+    filename = Column(String, nullable=False)  # clave actual en storage
+
+
+class Event(Base):
+    """Cambio en un roleplay para avisar en directo a la vista del profesor (ver events.py)."""
+    __tablename__ = "events"
+    __table_args__ = {"sqlite_autoincrement": True}  # ids siempre crecientes: sirven para continuar
+
+    id = Column(Integer, primary_key=True)
+    roleplay_id = Column(Integer, nullable=False)
+    kind = Column(String, nullable=False)  # created / updated
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+def parse_cost_cents(value):
+    """Convierte un precio ("2.50", "2,50", "€3", 1.5...) a céntimos, o None si no es un número."""
+    if isinstance(value, bool) or value is None:
+        return None
+    text = str(value).strip().replace("€", "").replace("$", "").replace(" ", "")
+    if "," in text and "." not in text:
+        text = text.replace(",", ".")
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        return None
+    if not amount.is_finite():
+        return None
+    return int((amount * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def build_items(productos, costes):
+    """Crea las líneas del roleplay emparejando productos y precios por posición."""
+    return [
+        RoleplayItem(
+            position=i,
+            name="" if name is None else str(name).strip(),
+            cost_cents=parse_cost_cents(cost),
+        )
+        for i, (name, cost) in enumerate(zip_longest(productos, costes))
+    ]
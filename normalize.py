@@ -0,0 +1,136 @@
+"""Recorte de silencios y normalización de volumen antes de comprimir un audio.
+
+Los alumnos suelen empezar a grabar bastante antes de hablar y parar
+tarde. Con ROLEFY_TRIM_AUDIO=1 el trabajo de transcodificación (ver
+ingest.py) pasa antes el audio por `process`:
+
+  1. Una pasada calcula la energía por ventanas (waveform.iter_frames) y
+     busca el primer y el último tramo con voz (por encima de SILENCE_DB),
+     guardando solo esas posiciones y los totales para la ganancia.
+  2. Se calcula la ganancia para que la voz quede en NORMALIZE_DB, sin
+     pasar de MAX_GAIN_DB ni dejar picos por encima de PEAK_CEILING_DB.
+  3. Una segunda pasada escribe solo el tramo con voz, con la ganancia.
+
+Se lee y escribe por bloques, así la memoria no depende de la duración.
+Solo cambia la versión comprimida: el original se guarda tal cual y se
+sigue pudiendo descargar con /audio/<clave>?variant=original.
+
+Para medirlo sobre ficheros sueltos:
+    python normalize.py grabacion.wav [...]
+"""
+import math
+import time
+
+import numpy as np
+
+import settings
+import waveform
+
+
+def scan(rate, blocks, silence):
+    """Primera pasada, guardando solo contadores (la memoria no crece con la duración).
+
+    Devuelve (muestras, primera y última ventana con voz o None, suma de
+    rms² y número de ventanas con voz, pico entre la primera y la última).
+    """
+    total, first, last = 0, None, None
+    voiced_sumsq, voiced_count = 0.0, 0
+    peak, pending = 0.0, 0.0  # pico hasta la última ventana con voz, y el de después
+    index = 0
+    for n, _, rms, frame_peak in waveform.iter_frames(rate, blocks):
+        total += n
+        voiced = np.flatnonzero(rms >= silence)
+        if len(voiced):
+            lo, hi = int(voiced[0]), int(voiced[-1])
+            if first is None:
+                first = index + lo
+            else:
+                lo = 0  # los silencios entre dos tramos con voz también cuentan para el pico
+                peak = max(peak, pending)
+            peak = max(peak, float(frame_peak[lo:hi + 1].max()))
+            pending = float(frame_peak[hi + 1:].max()) if hi + 1 < len(frame_peak) else 0.0
+            last = index + hi
+            voiced_sumsq += float(np.sum(np.square(rms[voiced])))
+            voiced_count += len(voiced)
+        elif first is not None and len(frame_peak):
+            pending = max(pending, float(frame_peak.max()))
+        index += len(rms)
+    return total, first, last, voiced_sumsq, voiced_count, peak
+
+
+def plan(src, silence_db=None, pad_seconds=None, target_db=None, max_gain_db=None, ceiling_db=None):
+    """Primera pasada: (frecuencia, primera muestra, última muestra, ganancia lineal, datos para el informe)."""
+    silence_db = settings.SILENCE_DB if silence_db is None else silence_db
+    pad_seconds = settings.TRIM_PAD_SECONDS if pad_seconds is None else pad_seconds
+    target_db = settings.NORMALIZE_DB if target_db is None else target_db
+    max_gain_db = settings.MAX_GAIN_DB if max_gain_db is None else max_gain_db
+    ceiling_db = settings.PEAK_CEILING_DB if ceiling_db is None else ceiling_db
+
+    rate, blocks = waveform.open_blocks(src)
+    total, first, last, voiced_sumsq, voiced_count, peak = scan(rate, blocks, 10 ** (silence_db / 20))
+    frame = max(1, int(rate * waveform.FRAME_SECONDS))
+    if first is None:
+        # Todo silencio: no se recorta nada (mejor que dejar un audio vacío)
+        return rate, 0, total, 1.0, {"duration": total / rate, "voiced": False}
+
+    pad = int(pad_seconds * rate)
+    start = max(0, first * frame - pad)
+    end = min(total, (last + 1) * frame + pad)
+    # Volumen de la voz: media cuadrática de las ventanas con voz
+    speech_db = waveform.to_db(math.sqrt(voiced_sumsq / voiced_count))
+    peak_db = waveform.to_db(peak)
+    gain_db = min(target_db - speech_db, max_gain_db, ceiling_db - peak_db)
+    return rate, start, end, 10 ** (gain_db / 20), {
+        "duration": total / rate,
+        "voiced": True,
+        "speech_db": round(speech_db, 2),
+        "gain_db": round(gain_db, 2),
+    }
+
+
+def write_range(src, dst, start, end, gain, rate):
+    """Segunda pasada: escribe en `dst` (WAV 16 bits mono) las muestras [start, end) con la ganancia."""
+    import soundfile
+
+    pos = 0
+    with soundfile.SoundFile(dst, "w", samplerate=rate, channels=1, subtype="PCM_16", format="WAV") as out:
+        _, blocks = waveform.open_blocks(src)
+        for block in blocks:
+            block_start, pos = pos, pos + len(block)
+            if pos <= start:
+                continue
+            if block_start >= end:
+                break
+            chunk = block[max(0, start - block_start):end - block_start]
+            out.write(np.clip(chunk * gain, -1.0, 1.0))
+
+
+def process(src, dst, **options):
+    """Recorta y normaliza `src` en `dst`. Devuelve un informe con lo hecho y cuánto ha tardado."""
+    t0 = time.perf_counter()
+    rate, start, end, gain, report = plan(src, **options)
+    write_range(src, dst, start, end, gain, rate)
+    seconds = time.perf_counter() - t0
+    report.update(
+        trimmed_head=round(start / rate, 3),
+        trimmed_tail=round(report["duration"] - end / rate, 3),
+        seconds=round(seconds, 3),
+        realtime=round(report["duration"] / seconds, 1) if seconds > 0 else None,
+    )
+    return report
+
+
+if __name__ == "__main__":
+    import json
+    import os
+    import sys
+
+    from storage import staging_path
+
+    for arg in sys.argv[1:]:
+        out = staging_path(".wav")
+        try:
+            print(json.dumps(dict(process(arg, out), file=arg)))
+        finally:
+            if os.path.exists(out):
+                os.remove(out)
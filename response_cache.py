@@ -0,0 +1,60 @@
+"""Caché en memoria de respuestas ya serializadas (la usa /roleplays).
+
+Cada entrada se guarda con la versión de los datos con la que se generó
+(events.data_version: el último id de la tabla events más las versiones
+de migraciones y esquema de la base de datos). Cualquier escritura que
+cambie un roleplay añade un evento y cualquier migración cambia el
+esquema o PRAGMA user_version, así que al cambiar la versión las entradas
+antiguas dejan de usarse (y los ETag de los navegadores dejan de valer),
+también si la escritura la ha hecho otro worker. Las menos usadas salen
+cuando hay más de `max_entries`.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version, key):
+        with self._lock:
+            body = self._entries.get((version, key))
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((version, key))
+            self.hits += 1
+            return body
+
+    def put(self, version, key, body):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[(version, key)] = body
+            self._entries.move_to_end((version, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def weak_etag(version, key):
+    """ETag débil de una respuesta: versión de los datos más un hash de los parámetros."""
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    return f'W/"{version}-{digest}"'
+
+
+def etag_matches(if_none_match, etag):
+    """Compara If-None-Match con `etag` (comparación débil, como pide RFC 9110 para 304)."""
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    return any(t.strip() == "*" or t.strip().removeprefix("W/") == opaque for t in if_none_match.split(","))
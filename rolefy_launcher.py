@@ -1,6 +1,10 @@
 # rolefy_launcher.py
 
+import argparse
+import json
 import subprocess
+import urllib.error
+import urllib.request
 import webbrowser
 import time
 import sys
@@ -8,20 +12,154 @@ import os
 import signal
 import socket
 
+HOST = '127.0.0.1'
+PORT = 8000
+
+# Espera máxima a que el backend esté listo tras arrancarlo
+READY_TIMEOUT = 60
+# Cada cuánto se comprueba que el backend sigue vivo
+CHECK_INTERVAL = 2
+# Reinicios seguidos antes de rendirse (se reinicia la cuenta tras un rato estable)
+MAX_RESTARTS = 5
+STABLE_SECONDS = 60
+
+
 def is_windows():
     return os.name == 'nt'
 
-def is_port_open(host='127.0.0.1', port=8000):
+def is_port_open(host=HOST, port=PORT):
     # Comprueba si el puerto ya está abierto (es decir backend corriendo)
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
         sock.settimeout(1)
         result = sock.connect_ex((host, port))
         return result == 0
 
+def check_health(backend_url, timeout=2):
+    """Consulta /healthz. Devuelve (listo, detalle) donde detalle es el JSON o el error."""
+    try:
+        with urllib.request.urlopen(f"{backend_url}/healthz", timeout=timeout) as resp:
+            return resp.status == 200, json.loads(resp.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        # 503: el backend responde pero algo no está listo (BD, carpeta de audios)
+        try:
+            return False, json.loads(e.read() or b"{}")
+        except ValueError:
+            return False, {"status": f"HTTP {e.code}"}
+    except (OSError, ValueError) as e:
+        return False, {"status": str(e)}
+
+def wait_until_ready(backend_url, process=None, timeout=READY_TIMEOUT):
+    """Sondea /healthz con esperas crecientes hasta que el backend está listo.
+
+    Devuelve los segundos que ha tardado, o None si pasa `timeout` o el
+    proceso termina antes.
+    """
+    start = time.monotonic()
+    delay = 0.1
+    detail = {}
+    while time.monotonic() - start < timeout:
+        ready, detail = check_health(backend_url, timeout=1)
+        if ready:
+            return time.monotonic() - start
+        if process is not None and process.poll() is not None:
+            print(f"El backend terminó al arrancar (código {process.returncode}).")
+            return None
+        time.sleep(delay)
+        delay = min(delay * 2, 1.0)
+    print(f"El backend no está listo tras {timeout} s: {detail}")
+    return None
+
+def _serve(args=(), **env):
+    python = 'python' if is_windows() else 'python3'
+    cmd = [python, 'serve.py', *args]
+    env = dict(os.environ, **env)
+    if is_windows():
+        # Grupo de procesos propio para poder mandarle CTRL_BREAK al salir
+        return subprocess.Popen(cmd, env=env, creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+    return subprocess.Popen(cmd, env=env)
+
+def start_migrations():
+    """Crea/migra la base de datos (serve.py --migrate-only) antes de arrancar el backend.
+
+    No tiene límite de tiempo: la primera vez tras actualizar puede tener
+    que mover todos los audios, y mientras tanto el backend no responde.
+    """
+    return _serve(['--migrate-only'])
+
+def start_backend(workers=1):
+    """Lanza el backend con serve.py y `workers` procesos de uvicorn (ya migrado: no migran)."""
+    return _serve(ROLEFY_HOST=HOST, ROLEFY_PORT=str(PORT), PORT=str(PORT),
+                  ROLEFY_WEB_WORKERS=str(workers), ROLEFY_SKIP_MIGRATIONS='1')
+
+def stop_backend(backend_process):
+    if backend_process is None or backend_process.poll() is not None:
+        return
+    if is_windows():
+        backend_process.send_signal(signal.CTRL_BREAK_EVENT)
+    else:
+        backend_process.terminate()
+    try:
+        backend_process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        backend_process.kill()
+        backend_process.wait()
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+def supervise(backend_url, workers, restart=True):
+    """Arranca el backend y lo vuelve a arrancar si se cae. Devuelve el código de salida."""
+    backend_process = None
+    restarts = 0
+    browser_opened = False
+    try:
+        # Antes del límite de READY_TIMEOUT: migrar puede tardar mucho más
+        print("Preparando la base de datos...")
+        backend_process = start_migrations()
+        if backend_process.wait() != 0:
+            print(f"Error: no se pudo migrar la base de datos (código {backend_process.returncode}).")
+            return 1
+        while True:
+            print("Iniciando backend..." if restarts == 0 else f"Reiniciando backend (intento {restarts})...")
+            backend_process = start_backend(workers)
+            ready_after = wait_until_ready(backend_url, backend_process)
+            if ready_after is None:
+                stop_backend(backend_process)
+            else:
+                print(f"Backend listo en {ready_after:.1f} s.")
+                if not browser_opened:
+                    print(f"Abriendo navegador en {backend_url}...")
+                    webbrowser.open(backend_url)
+                    browser_opened = True
+                started = time.monotonic()
+                while backend_process.poll() is None:
+                    time.sleep(CHECK_INTERVAL)
+                print(f"El backend se ha detenido (código {backend_process.returncode}).")
+                if time.monotonic() - started > STABLE_SECONDS:
+                    restarts = 0
+            if not restart:
+                return 1
+            restarts += 1
+            if restarts > MAX_RESTARTS:
+                print(f"Error: el backend ha fallado {MAX_RESTARTS} veces seguidas, se deja de reintentar.")
+                return 1
+            time.sleep(min(2 ** restarts, 30))
+    except KeyboardInterrupt:
+        print("Terminando backend y saliendo...")
+        stop_backend(backend_process)
+        return 0
+
 def main():
-    backend_script = 'main.py'
+    parser = argparse.ArgumentParser(description="Arranca el backend de Rolefy y abre el navegador.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="procesos de uvicorn (por defecto 1)")
+    parser.add_argument('--no-restart', action='store_true',
+                        help="no reiniciar el backend si se cae")
+    args = parser.parse_args()
+
+    backend_script = 'serve.py'
     icon_path = 'icon.ico'  # Asumiendo que está en la misma carpeta que launcher.py
-    backend_url = 'http://127.0.0.1:8000'
+    backend_url = f'http://{HOST}:{PORT}'
 
     if not os.path.isfile(backend_script):
         print(f"Error: No se encontró el archivo backend '{backend_script}'.")
@@ -29,46 +167,25 @@ def main():
     if not os.path.isfile(icon_path):
         print(f"Advertencia: No se encontró el icono '{icon_path}', el ejecutable se generará sin icono.")
 
-    backend_process = None
-
-    try:
-        if is_port_open():
-            print("Backend ya está corriendo en el puerto 8000, no se inicia de nuevo.")
-        else:
-            print("Iniciando backend...")
-            if is_windows():
-                backend_process = subprocess.Popen(['python', backend_script], shell=True)
-            else:
-                backend_process = subprocess.Popen(['python3', backend_script])
-            # Esperar un poco a que arranque
-            time.sleep(4)
-
-            if not is_port_open():
-                print("Error: No se pudo iniciar el backend correctamente.")
-                if backend_process:
-                    backend_process.terminate()
-                sys.exit(1)
-
+    if is_port_open():
+        print(f"Backend ya está corriendo en el puerto {PORT}, no se inicia de nuevo.")
+        ready_after = wait_until_ready(backend_url, timeout=10)
+        if ready_after is None:
+            sys.exit(1)
         print(f"Abriendo navegador en {backend_url}...")
         webbrowser.open(backend_url)
-
-        if backend_process:
-            backend_process.wait()
-        else:
-            # Si backend ya estaba corriendo, solo esperamos Ctrl+C
-            print("Presiona Ctrl+C para salir.")
+        # Si backend ya estaba corriendo, solo esperamos Ctrl+C
+        print("Presiona Ctrl+C para salir.")
+        try:
             while True:
                 time.sleep(1)
+        except KeyboardInterrupt:
+            sys.exit(0)
 
-    except KeyboardInterrupt:
-        print("Terminando backend y saliendo...")
-        if backend_process:
-            if is_windows():
-                backend_process.send_signal(signal.CTRL_BREAK_EVENT)
-            else:
-                backend_process.terminate()
-            backend_process.wait()
-        sys.exit(0)
+    if not is_windows():
+        # Al recibir SIGTERM se sale igual que con Ctrl+C, parando también el backend
+        signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    sys.exit(supervise(backend_url, args.workers, restart=not args.no_restart))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,127 @@
+"""Búsqueda de texto en los roleplays (SQLite FTS5, /search).
+
+`roleplays_fts` es una tabla FTS5 de contenido externo sobre `roleplays`:
+no guarda otra copia del texto, solo el índice de comprador, vendedor,
+productos y feedback. Se mantiene con triggers de SQLite, así cualquier
+escritura (las peticiones de cualquier worker, el IngestWorker o las
+migraciones) la deja al día en la misma transacción. Los cambios de otras
+columnas (audio, forma de onda...) no la tocan.
+
+Las palabras se buscan sin distinguir mayúsculas ni acentos (tokenizer
+unicode61 con remove_diacritics) y por prefijo ("banan" encuentra
+"bananas"); todas tienen que aparecer. Los productos se indexan tal como
+están en la columna, así que se guardan sin escapes \\uXXXX (ver
+migrations.unescape_productos).
+
+Los resultados se ordenan por relevancia (bm25): pesa más encontrar la
+palabra en un nombre o un producto que en un feedback largo.
+
+Se ordenan todos los que encajan (ORDER BY rank, con los pesos de WEIGHTS
+guardados como rank de la tabla) y se pagina con LIMIT/OFFSET. Con 30000
+roleplays, una palabra que sale en un tercio de ellos cuesta ~10 ms.
+"""
+import re
+import unicodedata
+
+from sqlalchemy import text
+
+# Pesos bm25 por columna, en el orden de la tabla
+WEIGHTS = (3.0, 3.0, 2.0, 1.0)
+SNIPPET_WORDS = 12
+MAX_TERMS = 10
+
+# Lo que calcula `rank` (se guarda en la configuración de la tabla)
+RANK = "bm25(%s)" % ", ".join(str(w) for w in WEIGHTS)
+
+SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS roleplays_fts USING fts5(
+        comprador, vendedor, productos, feedback,
+        content='roleplays', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS roleplays_fts_insert AFTER INSERT ON roleplays BEGIN
+        INSERT INTO roleplays_fts (rowid, comprador, vendedor, productos, feedback)
+        VALUES (new.id, new.comprador, new.vendedor, new.productos, new.feedback);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS roleplays_fts_delete AFTER DELETE ON roleplays BEGIN
+        INSERT INTO roleplays_fts (roleplays_fts, rowid, comprador, vendedor, productos, feedback)
+        VALUES ('delete', old.id, old.comprador, old.vendedor, old.productos, old.feedback);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS roleplays_fts_update
+    AFTER UPDATE OF comprador, vendedor, productos, feedback ON roleplays BEGIN
+        INSERT INTO roleplays_fts (roleplays_fts, rowid, comprador, vendedor, productos, feedback)
+        VALUES ('delete', old.id, old.comprador, old.vendedor, old.productos, old.feedback);
+        INSERT INTO roleplays_fts (rowid, comprador, vendedor, productos, feedback)
+        VALUES (new.id, new.comprador, new.vendedor, new.productos, new.feedback);
+    END""",
+]
+
+
+def create_index(conn):
+    """Crea la tabla y los triggers si no existen. Devuelve False si este SQLite no tiene FTS5."""
+    try:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+    except Exception as e:
+        print("Búsqueda desactivada (SQLite sin FTS5):", e)
+        return False
+    # Solo si cambia: al escribirla, la siguiente búsqueda de las demás conexiones abiertas falla
+    current = conn.execute(text("SELECT v FROM roleplays_fts_config WHERE k = 'rank'")).scalar()
+    if current != RANK:
+        conn.execute(text("INSERT INTO roleplays_fts (roleplays_fts, rank) VALUES ('rank', :rank)"), {"rank": RANK})
+    return True
+
+
+def rebuild(conn):
+    """Vuelve a indexar todos los roleplays (tras crear la tabla en una base de datos con datos)."""
+    conn.execute(text("INSERT INTO roleplays_fts (roleplays_fts) VALUES ('rebuild')"))
+
+
+def available(db):
+    return db.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'roleplays_fts'"
+    )).first() is not None
+
+
+def match_query(q):
+    """Convierte lo que escribe el profesor en una consulta FTS5 segura (o None si no hay palabras).
+
+    Cada palabra va entre comillas (así `"`, `*`, `OR` o `-` no se toman
+    como sintaxis de FTS5) y se busca por prefijo, salvo las de una letra
+    (que encajarían con casi todo).
+    """
+    terms = re.findall(r"\w+", q)[:MAX_TERMS]
+    if not terms:
+        return None
+    return " ".join(f'"{t}"*' if len(t) > 1 else f'"{t}"' for t in terms)
+
+
+def search(db, q, limit, offset=0):
+    """[(id, puntuación)] de los roleplays que encajan con `q`, de más a menos relevante."""
+    match = match_query(q)
+    if match is None:
+        return []
+    rows = db.execute(text(
+        "SELECT rowid, rank FROM roleplays_fts WHERE roleplays_fts MATCH :match"
+        " ORDER BY rank, rowid DESC LIMIT :limit OFFSET :offset"
+    ), {"match": match, "limit": limit, "offset": offset}).fetchall()
+    # bm25 da valores negativos: cuanto más bajo, más relevante
+    return [(rp_id, -score) for rp_id, score in rows]
+
+
+def _fold(word):
+    """Minúsculas y sin acentos, como el tokenizer (remove_diacritics)."""
+    return "".join(c for c in unicodedata.normalize("NFD", word.lower()) if not unicodedata.combining(c))
+
+
+def snippet(value, q):
+    """Trozo de `value` alrededor de la primera palabra buscada ("" si no aparece)."""
+    terms = [_fold(t) for t in re.findall(r"\w+", q)[:MAX_TERMS]]
+    words = (value or "").split()
+    for i, word in enumerate(words):
+        folded = _fold(word)
+        if any(w.startswith(t) for t in terms for w in re.findall(r"\w+", folded)):
+            start = max(0, i - SNIPPET_WORDS // 3)
+            end = start + SNIPPET_WORDS
+            return ("…" if start > 0 else "") + " ".join(words[start:end]) + ("…" if end < len(words) else "")
+    return ""
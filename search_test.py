@@ -0,0 +1,85 @@
+import io
+import json
+import sys
+import wave
+
+import pytest
+from fastapi.testclient import TestClient
+
+# app_main (conftest.py): la app con su propia base de datos temporal
+
+
+def _wav(seed):
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(16000)
+        wf.writeframes(seed.to_bytes(2, "little") * 1600)
+    return buf.getvalue()
+
+
+def _search_ids(client, q):
+    r = client.get("/search", params={"q": q})
+    assert r.status_code == 200, r.text
+    return {item["id"] for item in r.json()["items"]}
+
+
+def test_search_finds_accented_products(app_main):
+    with TestClient(app_main.app) as client:
+        r = client.post("/upload", data={
+            "comprador": "Ana", "vendedor": "Luis",
+            "productos": json.dumps(["plátanos", "una piña"]), "costes": json.dumps([1.5, 2]),
+        }, files={"audio": ("rp.wav", _wav(1), "audio/wav")})
+        assert r.status_code == 200, r.text
+        rp_id = r.json()["id"]
+
+        for q in ("plátanos", "platanos", "PLATAN", "piña", "pina"):
+            assert rp_id in _search_ids(client, q), q
+
+
+def test_escaped_products_are_reindexed(app_main):
+    import migrations
+
+    # Roleplay guardado antes con json.dumps por defecto ("pi\u00f1a")
+    db = app_main.SessionLocal()
+    rp = app_main.models.Roleplay(comprador="Marta", vendedor="Hugo", productos=json.dumps(["piña colada"]),
+                                  costes="[3]", audio_filename="0" * 64 + ".wav")
+    db.add(rp)
+    db.commit()
+    rp_id = rp.id
+    db.close()
+
+    with TestClient(app_main.app) as client:
+        assert rp_id not in _search_ids(client, "colada piña")
+        with app_main.engine.begin() as conn:
+            migrations.unescape_productos(conn)
+        assert rp_id in _search_ids(client, "colada piña")
+        assert rp_id in _search_ids(client, "pina")
+
+
+def test_ranking_covers_every_match(app_main):
+    # El más relevante es el más antiguo, con más de 1000 coincidencias más recientes
+    Roleplay = app_main.models.Roleplay
+    db = app_main.SessionLocal()
+    best = Roleplay(comprador="Leche", vendedor="Sara", productos=json.dumps(["leche"]),
+                    costes="[1]", audio_filename="1" * 64 + ".wav")
+    db.add(best)
+    db.flush()
+    for i in range(1100):
+        db.add(Roleplay(comprador=f"Iván {i}", vendedor="Nerea", productos="[]", costes="[]",
+                        audio_filename=f"{i:064x}.wav",
+                        feedback="Remember to ask for the price before paying for the leche, please."))
+    db.commit()
+    best_id = best.id
+    db.close()
+
+    with TestClient(app_main.app) as client:
+        r = client.get("/search", params={"q": "leche", "limit": 5})
+        assert r.json()["items"][0]["id"] == best_id
+        r = client.get("/search", params={"q": "leche", "limit": 100, "offset": 1000})
+        assert len(r.json()["items"]) == 100 and r.json()["next_offset"] == 1100
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
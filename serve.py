@@ -0,0 +1,75 @@
+"""Arranque de producción del backend.
+
+Crea y migra el esquema una sola vez y después lanza uvicorn con
+WEB_WORKERS procesos (uno por núcleo por defecto), así que cuando toda la
+clase envía a la vez las peticiones se reparten entre núcleos. Los workers
+no vuelven a migrar (ROLEFY_SKIP_MIGRATIONS). Al parar, uvicorn deja de
+aceptar conexiones y espera hasta SHUTDOWN_TIMEOUT a que terminen las
+peticiones en curso, como las subidas.
+
+Uso:
+    python serve.py            (o python main.py)
+    python serve.py --migrate-only    solo migra y sale (lo usa rolefy_launcher.py)
+    ROLEFY_RELOAD=1 python serve.py   desarrollo, un proceso con recarga
+"""
+import argparse
+import importlib.util
+import os
+
+import uvicorn
+
+import settings
+
+
+def prepare():
+    """Tareas que deben hacerse una vez y no en cada worker."""
+    import models
+    from database import engine
+    from migrations import run_migrations
+
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    if not settings.SKIP_MIGRATIONS:  # ya migrada por quien lanza serve.py
+        run_migrations(engine, models.Base.metadata)
+    engine.dispose()
+    os.environ["ROLEFY_SKIP_MIGRATIONS"] = "1"
+
+
+def ingest_workers_per_process(web_workers):
+    """Reparte los procesos de ingesta entre los workers web para no multiplicarlos."""
+    if settings.INGEST_WORKERS <= 0:
+        return 0
+    return max(1, -(-settings.INGEST_WORKERS // web_workers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arranca el backend de Rolefy.")
+    parser.add_argument("--migrate-only", action="store_true", help="crea/migra la base de datos y sale")
+    args = parser.parse_args()
+    if args.migrate_only:
+        prepare()
+        return
+    if settings.RELOAD:
+        uvicorn.run("main:app", host=settings.HOST, port=settings.PORT, reload=True)
+        return
+
+    workers = max(1, settings.WEB_WORKERS)
+    prepare()
+    os.environ["ROLEFY_INGEST_WORKERS"] = str(ingest_workers_per_process(workers))
+    # uvloop y httptools son más rápidos que asyncio y h11, pero son opcionales
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    print(f"Rolefy: {workers} worker(s) en {settings.HOST}:{settings.PORT} (loop={loop}, http={http})")
+    uvicorn.run(
+        "main:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        workers=workers,
+        loop=loop,
+        http=http,
+        timeout_graceful_shutdown=settings.SHUTDOWN_TIMEOUT,
+        proxy_headers=True,
+    )
+
+
+if __name__ == "__main__":
+    main()
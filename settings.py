@@ -0,0 +1,102 @@
+import os
+
+from dotenv import load_dotenv
+
+# Configuración del backend, sobreescribible con variables de entorno
+# (o con un fichero .env en la carpeta del proyecto).
+load_dotenv()
+
+# Carpeta donde se guardan los audios subidos
+UPLOAD_DIR = os.getenv("ROLEFY_UPLOAD_DIR", "uploads")
+
+# Tamaño máximo de un audio subido (en MB) y tamaño de bloque al guardarlo
+MAX_UPLOAD_MB = int(os.getenv("ROLEFY_MAX_UPLOAD_MB", "200"))
+MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+UPLOAD_CHUNK_SIZE = int(os.getenv("ROLEFY_UPLOAD_CHUNK_KB", "256")) * 1024
+
+# Subidas por trozos a medio terminar (fuera de UPLOAD_DIR para no servirlas)
+PARTIAL_DIR = os.getenv("ROLEFY_PARTIAL_DIR", "uploads_partial")
+PARTIAL_TTL_HOURS = int(os.getenv("ROLEFY_PARTIAL_TTL_HOURS", "72"))
+
+# Dónde se guardan los audios (ver storage.py): "local" (UPLOAD_DIR) o "s3"
+STORAGE_BACKEND = os.getenv("ROLEFY_STORAGE", "local").lower()
+S3_BUCKET = os.getenv("ROLEFY_S3_BUCKET", "rolefy")
+S3_ENDPOINT = os.getenv("ROLEFY_S3_ENDPOINT")  # p. ej. http://localhost:9000 para MinIO
+S3_PREFIX = os.getenv("ROLEFY_S3_PREFIX", "audio/")
+S3_URL_EXPIRES = int(os.getenv("ROLEFY_S3_URL_EXPIRES", "3600"))
+# Ficheros a medio guardar (mismo disco que PARTIAL_DIR para poder moverlos sin copiar)
+STAGING_DIR = os.path.join(PARTIAL_DIR, "staging")
+
+# Base de datos. ROLEFY_DB_MODE=async usa aiosqlite (si está instalado);
+# ROLEFY_DB_MODE=sync vuelve al engine síncrono de siempre.
+DATABASE_URL = os.getenv("ROLEFY_DATABASE_URL", "sqlite:///./roleplay.db")
+DB_MODE = os.getenv("ROLEFY_DB_MODE", "async").lower()
+DB_POOL_SIZE = int(os.getenv("ROLEFY_DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("ROLEFY_DB_MAX_OVERFLOW", "10"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("ROLEFY_DB_BUSY_TIMEOUT_MS", "5000"))
+
+# Procesado de audios en segundo plano (ingest.py). Con 0 procesos no se
+# ejecuta ningún trabajo y quedan en cola.
+INGEST_WORKERS = int(os.getenv("ROLEFY_INGEST_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+INGEST_POLL_SECONDS = float(os.getenv("ROLEFY_INGEST_POLL_SECONDS", "5"))
+INGEST_MAX_ATTEMPTS = int(os.getenv("ROLEFY_INGEST_MAX_ATTEMPTS", "3"))
+# Un trabajo "running" más antiguo que esto se considera abandonado (reinicio, crash)
+INGEST_LEASE_SECONDS = int(os.getenv("ROLEFY_INGEST_LEASE_SECONDS", "600"))
+
+# Transcodificación con ffmpeg: "opus", "mp3" o "none" para desactivarla
+TRANSCODE_CODEC = os.getenv("ROLEFY_TRANSCODE_CODEC", "opus").lower()
+TRANSCODE_BITRATE = os.getenv("ROLEFY_TRANSCODE_BITRATE", "32k")
+FFMPEG_BIN = os.getenv("ROLEFY_FFMPEG", "ffmpeg")
+
+# Forma de onda y volumen de cada audio (waveform.py). Con 0 picos no se calcula.
+WAVEFORM_PEAKS = int(os.getenv("ROLEFY_WAVEFORM_PEAKS", "500"))
+# Por debajo de este nivel (dBFS) se considera silencio
+SILENCE_DB = float(os.getenv("ROLEFY_SILENCE_DB", "-45"))
+
+# Recorte de silencios al principio/final y normalización de volumen de la
+# versión comprimida (normalize.py). El original no se toca.
+TRIM_AUDIO = os.getenv("ROLEFY_TRIM_AUDIO", "0") == "1"
+TRIM_PAD_SECONDS = float(os.getenv("ROLEFY_TRIM_PAD_SECONDS", "0.3"))  # margen que se deja antes/después de la voz
+NORMALIZE_DB = float(os.getenv("ROLEFY_NORMALIZE_DB", "-20"))          # volumen objetivo de la voz (dBFS)
+MAX_GAIN_DB = float(os.getenv("ROLEFY_MAX_GAIN_DB", "20"))
+PEAK_CEILING_DB = float(os.getenv("ROLEFY_PEAK_CEILING_DB", "-1"))
+
+# Servidor de producción (serve.py). Railway pone PORT y hay que escuchar en 0.0.0.0.
+HOST = os.getenv("ROLEFY_HOST", "0.0.0.0" if "PORT" in os.environ else "127.0.0.1")
+PORT = int(os.getenv("PORT", os.getenv("ROLEFY_PORT", "8000")))
+WEB_WORKERS = int(os.getenv("ROLEFY_WEB_WORKERS", str(os.cpu_count() or 1)))
+# Segundos que se espera a las peticiones en curso (subidas) al parar
+SHUTDOWN_TIMEOUT = int(os.getenv("ROLEFY_SHUTDOWN_TIMEOUT", "30"))
+# Desarrollo: un solo proceso que se recarga al cambiar el código
+RELOAD = os.getenv("ROLEFY_RELOAD", "0") == "1"
+# serve.py crea/migra el esquema una vez antes de lanzar los workers
+# (main.py lo vuelve a leer del entorno al arrancar la app, ver lifespan)
+SKIP_MIGRATIONS = os.getenv("ROLEFY_SKIP_MIGRATIONS", "0") == "1"
+
+# Avisos en directo a la vista del profesor (/events)
+# Cada cuánto mira cada worker si hay cambios hechos por otros workers
+EVENTS_POLL_SECONDS = float(os.getenv("ROLEFY_EVENTS_POLL_SECONDS", "1"))
+# Horas que se guardan los eventos para poder reconectar sin recargar
+EVENTS_RETENTION_HOURS = int(os.getenv("ROLEFY_EVENTS_RETENTION_HOURS", "24"))
+
+# Exportación incremental (/export): la siguiente vuelve a incluir los cambios de
+# estos últimos segundos, por si alguno aún no se había guardado (ver export.export_until)
+EXPORT_OVERLAP_SECONDS = int(os.getenv("ROLEFY_EXPORT_OVERLAP_SECONDS", "60"))
+
+# Métricas de las peticiones en /metrics (metrics.py)
+METRICS = os.getenv("ROLEFY_METRICS", "1") == "1"
+# Las peticiones más lentas que esto se guardan en /metrics/slow
+SLOW_REQUEST_MS = float(os.getenv("ROLEFY_SLOW_REQUEST_MS", "1000"))
+# Profiler por muestreo para ver en qué se les va el tiempo a las peticiones lentas
+PROFILE = os.getenv("ROLEFY_PROFILE", "0") == "1"
+
+# Páginas de /roleplays que se guardan ya serializadas (0 = sin caché)
+ROLEPLAYS_CACHE_SIZE = int(os.getenv("ROLEFY_ROLEPLAYS_CACHE_SIZE", "64"))
+
+# Respuestas JSON con orjson (fastjson.py), si está instalado
+FAST_JSON = os.getenv("ROLEFY_FAST_JSON", "0") == "1"
+# Compresión gzip/brotli de las respuestas de texto (compression.py)
+COMPRESSION = os.getenv("ROLEFY_COMPRESSION", "1") == "1"
+COMPRESS_MIN_BYTES = int(os.getenv("ROLEFY_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("ROLEFY_GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("ROLEFY_BROTLI_QUALITY", "4"))
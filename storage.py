@@ -0,0 +1,200 @@
+"""Almacenamiento de los audios por contenido.
+
+Cada audio se guarda con la clave `<sha256><ext>`, así dos subidas con los
+mismos bytes (reintentos, envíos repetidos) ocupan una sola copia. En
+disco las claves se reparten en subcarpetas por los primeros caracteres
+del hash (`ab/cd/abcd...wav`) para que ninguna carpeta crezca sin límite.
+Cuántos roleplays usan cada clave se lleva en audio_files.refcount (ver
+audio_index.py); el fichero se borra cuando un roleplay deja de usarlo y
+no queda ningún otro (p. ej. al cambiar su versión comprimida). Los
+roleplays no se borran desde la app, así que los originales se quedan.
+
+Hay dos implementaciones con la misma interfaz, elegidas con
+ROLEFY_STORAGE:
+  local  carpeta UPLOAD_DIR (por defecto)
+  s3     un bucket S3 o compatible (MinIO, etc. con ROLEFY_S3_ENDPOINT); necesita boto3
+"""
+import os
+import re
+import shutil
+import uuid
+from datetime import datetime
+
+import settings
+
+CONTENT_KEY_RE = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]+$")
+
+
+def content_key(sha256, ext):
+    return sha256 + (ext or ".wav").lower()
+
+
+def shard(key):
+    """Ruta relativa de una clave. Los nombres antiguos (no son un hash) siguen en la raíz."""
+    if "/" in key or "\\" in key or key.startswith("."):
+        raise ValueError(f"Invalid storage key: {key!r}")
+    if CONTENT_KEY_RE.match(key):
+        return f"{key[:2]}/{key[2:4]}/{key}"
+    return key
+
+
+def staging_path(suffix=""):
+    """Fichero temporal donde escribir un audio antes de guardarlo con `put`."""
+    os.makedirs(settings.STAGING_DIR, exist_ok=True)
+    return os.path.join(settings.STAGING_DIR, uuid.uuid4().hex + suffix)
+
+
+class LocalStorage:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, *shard(key).split("/"))
+
+    def check(self):
+        """Lanza una excepción si no se puede guardar (para /healthz)."""
+        if not (os.path.isdir(self.root) and os.access(self.root, os.W_OK)):
+            raise OSError(f"{self.root} is not writable")
+
+    def exists(self, key):
+        return os.path.isfile(self.path(key))
+
+    def put(self, src, key):
+        """Guarda el fichero `src` (se mueve) con la clave `key`.
+
+        Si la clave ya existe el contenido es el mismo, así que `src` se
+        descarta. Devuelve True si el fichero es nuevo.
+        """
+        dst = self.path(key)
+        if os.path.isfile(dst):
+            os.remove(src)
+            return False
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        tmp = f"{dst}.{uuid.uuid4().hex}.tmp"
+        shutil.move(src, tmp)
+        os.replace(tmp, dst)
+        return True
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def stat(self, key):
+        """os.stat_result del fichero, o None si no existe."""
+        try:
+            return os.stat(self.path(key))
+        except (OSError, ValueError):
+            return None
+
+    def open(self, key):
+        """Fichero binario abierto para leer el audio."""
+        return open(self.path(key), "rb")
+
+    def local_path(self, key):
+        """Ruta local para leer el audio (aquí, el propio fichero)."""
+        return self.path(key)
+
+    def url(self, key):
+        """URL directa al audio, o None si se sirve desde esta app."""
+        return None
+
+    def iter_files(self):
+        """(clave, tamaño, fecha de modificación) de todos los audios guardados."""
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".tmp") or name.startswith("."):
+                    continue
+                st = os.stat(os.path.join(dirpath, name))
+                yield name, st.st_size, datetime.fromtimestamp(st.st_mtime)
+
+
+class S3Storage:
+    """Bucket S3 (o compatible). Los audios se sirven con URLs prefirmadas."""
+
+    def __init__(self, bucket, endpoint_url=None, prefix=""):
+        import boto3
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None)
+        self.cache_dir = os.path.join(settings.STAGING_DIR, "s3cache")
+
+    def _object(self, key):
+        return self.prefix + shard(key)
+
+    def check(self):
+        self.client.head_bucket(Bucket=self.bucket)
+
+    def _head(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._object(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def put(self, src, key):
+        if self.exists(key):
+            os.remove(src)
+            return False
+        self.client.upload_file(src, self.bucket, self._object(key))
+        os.remove(src)
+        return True
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object(key))
+        cached = os.path.join(self.cache_dir, key)
+        if os.path.exists(cached):
+            os.remove(cached)
+
+    def stat(self, key):
+        head = self._head(key)
+        if head is None:
+            return None
+        mtime = head["LastModified"].timestamp()
+        return os.stat_result((0o100644, 0, 0, 1, 0, 0, head["ContentLength"], mtime, mtime, mtime))
+
+    def open(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._object(key))["Body"]
+        except ClientError as e:
+            raise FileNotFoundError(key) from e
+
+    def local_path(self, key):
+        """Descarga el audio a una caché local (para ffmpeg) y devuelve su ruta."""
+        path = os.path.join(self.cache_dir, key)
+        if not os.path.isfile(path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+            self.client.download_file(self.bucket, self._object(key), tmp)
+            os.replace(tmp, path)
+        return path
+
+    def url(self, key):
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._object(key)},
+            ExpiresIn=settings.S3_URL_EXPIRES,
+        )
+
+    def iter_files(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                yield obj["Key"].rsplit("/", 1)[-1], obj["Size"], obj["LastModified"].astimezone().replace(tzinfo=None)
+
+
+def create_storage():
+    if settings.STORAGE_BACKEND == "s3":
+        return S3Storage(settings.S3_BUCKET, settings.S3_ENDPOINT, settings.S3_PREFIX)
+    return LocalStorage(settings.UPLOAD_DIR)
+
+
+storage = create_storage()
@@ -1,45 +1,96 @@
-import sounddevice as sd
-import numpy as np
+# numpy, sounddevice, PIL, requests y fpdf se importan al usarlos por primera
+# vez, para que la ventana aparezca cuanto antes.
 import wave
 import threading
 import tkinter as tk
 from tkinter import messagebox, simpledialog, Canvas, Frame, Scrollbar
-from PIL import Image, ImageTk, ImageDraw, ImageFont
 import io
 import json
-import requests
 import os
 import time
+import uuid
+import random
+import shutil
+import hashlib
+import math
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from fpdf import FPDF
 import subprocess
 import sys
 
 # --- START BACKEND FUNCTION ---
-def start_backend():
-    """Inicia el backend FastAPI si no está ya iniciado."""
-    backend_cmd = [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', '8000']
+def is_backend_ready(url, timeout=2):
+    import requests
     try:
-        resp = requests.get("http://127.0.0.1:8000")
-        if resp.status_code == 200:
-            print("Backend ya está corriendo.")
-            return
-    except Exception:
-        print("Arrancando backend...")
-        subprocess.Popen(backend_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        time.sleep(3)
+        return requests.get(f"{url}/healthz", timeout=timeout).status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
+
+def wait_until_ready(url, timeout, stop=None):
+    """Sondea el backend hasta que responde (o pasa `timeout`, o se activa `stop`), con esperas crecientes."""
+    deadline = time.monotonic() + timeout
+    delay = 0.1
+    while time.monotonic() < deadline:
+        if stop is not None and stop.is_set():
+            return False
+        if is_backend_ready(url, timeout=min(1.0, max(0.1, deadline - time.monotonic()))):
+            return True
+        time.sleep(delay)
+        delay = min(delay * 2, 1.0)
+    return False
+
+
+def start_backend(stop=None):
+    """Inicia el backend FastAPI si no está ya iniciado y espera a que responda.
+
+    Si se activa `stop` (ya se encontró otro backend) deja de esperar.
+    """
+    backend_cmd = [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', '8000']
+    if is_backend_ready(LOCAL_BACKEND):
+        print("Backend ya está corriendo.")
+        return True
+    if stop is not None and stop.is_set():
+        return False
+    print("Arrancando backend...")
+    subprocess.Popen(backend_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return wait_until_ready(LOCAL_BACKEND, BACKEND_READY_TIMEOUT, stop)
 # --- END BACKEND FUNCTION ---
 
 CONFIG_URL = "https://raw.githubusercontent.com/lolypisci/roleplay-app-cash-in/main/config.json"
 DEFAULT_BACKEND = "http://localhost:8000"
+LOCAL_BACKEND = "http://127.0.0.1:8000"
+BACKEND_READY_TIMEOUT = 20
+# Último backend que respondió, para arrancar sin esperar a la red
+BACKEND_CACHE_PATH = "backend_cache.json"
 ASSETS_DIR = "assets"
 FONTS_DIR = os.path.join(ASSETS_DIR, "fonts")
 HANDOUT_PATH = os.path.join("handouts", "handout.png")
 LOGO_PATH = os.path.join(ASSETS_DIR, "logo.png")
+
+STARTUP_T0 = time.perf_counter()
+STARTUP_BENCHMARK = False
 BACKUP_DIR = "backups"
 
-SAMPLE_RATE = 44100
+# 16 kHz basta para voz y ocupa casi 3 veces menos que 44.1 kHz
+SAMPLE_RATE = 16000
 CHANNELS = 1
+RECORDINGS_DIR = "recordings"
+RING_SECONDS = 10
+# Medidor de nivel: refresco en pantalla y avisos
+METER_INTERVAL_MS = 100
+SILENCE_LEVEL = 10 ** (-50 / 20)   # por debajo de -50 dBFS se considera silencio
+CLIP_LEVEL = 0.99                  # a partir de aquí la señal satura
+SILENCE_WARN_SECONDS = 5
+AUDIO_MIME_TYPES = {".flac": "audio/flac", ".wav": "audio/wav"}
+
+# Envíos pendientes de subir (sobreviven a cerrar la app)
+OUTBOX_DIR = "outbox"
+UPLOAD_CHUNK_SIZE = 256 * 1024
+UPLOAD_TIMEOUT = (5, 30)  # (conexión, lectura) en segundos
+RETRY_BASE_SECONDS = 2
+RETRY_MAX_SECONDS = 300
 
 COLOR_BG = "#FFFFFF"
 COLOR_PRIMARY = "#A9E5BB"
@@ -48,54 +99,323 @@ COLOR_ACCENT = "#1E90FF"
 COLOR_TEXT = "#333333"
 COLOR_MUTED = "#777777"
 
-start_backend()
+def load_cached_backend():
+    try:
+        with open(BACKEND_CACHE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f).get("backend_url") or None
+    except (OSError, ValueError):
+        return None
+
+
+def save_cached_backend(url):
+    try:
+        with open(BACKEND_CACHE_PATH, "w", encoding="utf-8") as f:
+            json.dump({"backend_url": url}, f)
+    except OSError as e:
+        print("Error saving backend cache:", e)
+
 
-def get_backend_url():
+def fetch_config_backend():
+    import requests
     try:
         r = requests.get(CONFIG_URL, timeout=5)
-        url = r.json().get("backend_url", "").rstrip("/")
-        return url if url else DEFAULT_BACKEND
-    except:
-        root = tk.Tk()
-        root.withdraw()
-        url = simpledialog.askstring("Backend URL", "Enter backend URL:", initialvalue=DEFAULT_BACKEND)
-        root.destroy()
-        if not url:
-            exit("No backend provided")
-        return url.rstrip("/")
-
-BACKEND = get_backend_url()
+        return r.json().get("backend_url", "").rstrip("/") or None
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+
+
+def discover_backend(task):
+    """Busca un backend que responda (se ejecuta en el TaskRunner).
+
+    Se prueban a la vez el de config.json en GitHub, el último que
+    funcionó y si ya hay uno local corriendo, pero se elige por prioridad:
+    config > caché > local. Uno de menos prioridad solo vale cuando los de
+    más han fallado o agotado su tiempo, así el servidor de la clase gana
+    aunque el local conteste antes. El local solo se arranca si no
+    responde ninguno remoto, y su URL no se guarda en la caché. Devuelve
+    la URL o None si ninguno responde.
+    """
+    stop = threading.Event()
+    results = {}
+    done = threading.Condition()
+
+    def from_config():
+        url = fetch_config_backend()
+        return url if url and is_backend_ready(url, timeout=5) else None
+
+    def from_cache():
+        url = load_cached_backend()
+        if url in (DEFAULT_BACKEND, LOCAL_BACKEND):
+            return None  # el local se prueba aparte, con la menor prioridad
+        return url if url and is_backend_ready(url, timeout=5) else None
+
+    def running_local():
+        return DEFAULT_BACKEND if is_backend_ready(LOCAL_BACKEND) else None
+
+    def spawn_local():
+        return DEFAULT_BACKEND if start_backend(stop=stop) else None
+
+    def run(name, probe):
+        url = None
+        try:
+            url = probe()
+        except Exception as e:
+            print("Error buscando backend:", e)
+        with done:
+            results[name] = url
+            done.notify_all()
+
+    def result(name):
+        with done:
+            while name not in results:
+                if task.cancelled:
+                    raise TaskCancelled()
+                done.wait(0.2)
+            return results[name]
+
+    def start(name, probe):
+        threading.Thread(target=run, args=(name, probe), daemon=True).start()
+
+    for name, probe in (("config", from_config), ("cache", from_cache), ("running", running_local)):
+        start(name, probe)
+    task.report(0, "Connecting to backend...")
+    try:
+        for name in ("config", "cache"):
+            url = result(name)
+            if url:
+                save_cached_backend(url)
+                return url
+        url = result("running")
+        if url:
+            return url
+        start("local", spawn_local)
+        return result("local")
+    finally:
+        stop.set()
+
+
+class RingBuffer:
+    """Buffer circular int16 preasignado.
+
+    El callback de audio escribe y el hilo del encoder lee, sin reservar
+    memoria por bloque. Si el encoder se retrasa más de RING_SECONDS se
+    descarta el bloque en vez de bloquear el callback.
+    """
+
+    def __init__(self, capacity):
+        import numpy as np
+        self.data = np.zeros(capacity, dtype=np.int16)
+        self.capacity = capacity
+        self.reset()
+
+    def reset(self):
+        self.written = 0
+        self.consumed = 0
+        self.dropped = 0
+
+    def write(self, samples):
+        n = len(samples)
+        if self.written + n - self.consumed > self.capacity:
+            self.dropped += n
+            return
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[start:start + first] = samples[:first]
+        if first < n:
+            self.data[:n - first] = samples[first:]
+        self.written += n
+
+    def read_into(self, out):
+        """Copia en `out` las muestras pendientes (hasta len(out)) y devuelve cuántas son."""
+        n = min(self.written - self.consumed, len(out))
+        start = self.consumed % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.data[start:start + first]
+        if first < n:
+            out[first:n] = self.data[:n - first]
+        self.consumed += n
+        return n
+
+
+class LevelMeter:
+    """Nivel de entrada (RMS y pico) calculado en el callback de audio.
+
+    El callback es tiempo real: nada de reservar memoria por bloque. Las
+    muestras se escalan a un buffer float32 preasignado y de ahí salen la
+    suma de cuadrados y el pico. La interfaz lee el nivel con `read()`
+    cada METER_INTERVAL_MS, así el callback nunca toca Tk.
+    """
+
+    def __init__(self, max_block=SAMPLE_RATE):
+        import numpy as np
+        self._np = np
+        self._buf = np.empty(max_block, dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        self._sumsq = 0.0
+        self._count = 0
+        self._peak = 0.0
+        self.silent_samples = 0    # muestras seguidas en silencio
+        self.voiced_samples = 0    # muestras con sonido en toda la grabación
+        self.clipped_blocks = 0    # bloques saturados desde la última lectura
+
+    def update(self, samples):
+        """Desde el callback de audio: acumula el nivel de un bloque int16."""
+        np = self._np
+        for start in range(0, len(samples), len(self._buf)):
+            chunk = samples[start:start + len(self._buf)]
+            f = self._buf[:len(chunk)]
+            np.multiply(chunk, 1 / 32768, out=f)
+            sumsq = float(np.dot(f, f))
+            peak = float(np.abs(f, out=f).max())
+            self._sumsq += sumsq
+            self._count += len(chunk)
+            self._peak = max(self._peak, peak)
+            if sumsq < SILENCE_LEVEL ** 2 * len(chunk):
+                self.silent_samples += len(chunk)
+            else:
+                self.silent_samples = 0
+                self.voiced_samples += len(chunk)
+            if peak >= CLIP_LEVEL:
+                self.clipped_blocks += 1
+
+    def read(self):
+        """Desde la interfaz: (rms, pico, segundos en silencio, saturado) desde la última lectura."""
+        sumsq, count, peak, clipped = self._sumsq, self._count, self._peak, self.clipped_blocks
+        self._sumsq, self._count, self._peak, self.clipped_blocks = 0.0, 0, 0.0, 0
+        rms = (sumsq / count) ** 0.5 if count else 0.0
+        return rms, peak, self.silent_samples / SAMPLE_RATE, clipped > 0
+
+
+class StreamingEncoder:
+    """Escribe el audio a disco mientras se graba: FLAC si está soundfile, si no WAV de 16 bits."""
+
+    def __init__(self, path_base):
+        try:
+            import soundfile
+        except (ImportError, OSError):
+            soundfile = None
+        self.frames = 0
+        self._sf = self._wav = None
+        if soundfile is not None:
+            self.path = path_base + ".flac"
+            self.mime = "audio/flac"
+            self._sf = soundfile.SoundFile(self.path, "w", samplerate=SAMPLE_RATE, channels=CHANNELS,
+                                           format="FLAC", subtype="PCM_16")
+        else:
+            self.path = path_base + ".wav"
+            self.mime = "audio/wav"
+            self._wav = wave.open(self.path, "wb")
+            self._wav.setnchannels(CHANNELS)
+            self._wav.setsampwidth(2)
+            self._wav.setframerate(SAMPLE_RATE)
+
+    def write(self, samples):
+        if self._sf is not None:
+            self._sf.write(samples)
+        else:
+            self._wav.writeframes(samples.tobytes())
+        self.frames += len(samples)
+
+    def close(self):
+        if self._sf is not None:
+            self._sf.close()
+        else:
+            self._wav.close()
+
 
 class Recorder:
+    """Graba del micrófono. start()/stop() lanzan excepción si algo falla (no tocan Tk)."""
+
     def __init__(self):
         self.recording = False
-        self.frames = []
+        self.ring = None
+        self.meter = None
+        self._scratch = None
+        self.encoder = None
+        self.stream = None
+        self._encoder_thread = None
+        # start() y stop() se ejecutan en el pool de tareas: que no se solapen
+        self._lock = threading.Lock()
 
     def start(self):
-        try:
-            self.frames = []
-            self.recording = True
-            def callback(indata, frames, time, status):
-                if self.recording:
-                    self.frames.append(indata.copy())
-            self.stream = sd.InputStream(samplerate=SAMPLE_RATE, channels=CHANNELS, callback=callback)
-            self.stream.start()
-        except Exception as e:
-            self.recording = False
-            messagebox.showerror("Error", f"Could not start recording:\n{e}")
-
-    def stop(self):
-        try:
+        with self._lock:
+            try:
+                import numpy as np
+                import sounddevice as sd
+                if self.ring is None:
+                    self.ring = RingBuffer(SAMPLE_RATE * RING_SECONDS)
+                    self._scratch = np.empty(SAMPLE_RATE, dtype=np.int16)
+                    self.meter = LevelMeter()
+                os.makedirs(RECORDINGS_DIR, exist_ok=True)
+                self.ring.reset()
+                self.meter.reset()
+                name = datetime.now().strftime("recording_%Y%m%d_%H%M%S")
+                self.encoder = StreamingEncoder(os.path.join(RECORDINGS_DIR, name))
+                self.recording = True
+                def callback(indata, frames, time, status):
+                    if self.recording:
+                        block = indata[:, 0]
+                        self.ring.write(block)
+                        self.meter.update(block)
+                self.stream = sd.InputStream(samplerate=SAMPLE_RATE, channels=CHANNELS, dtype="int16",
+                                             callback=callback)
+                self.stream.start()
+                self._encoder_thread = threading.Thread(target=self._encode_loop, daemon=True)
+                self._encoder_thread.start()
+            except Exception:
+                self.recording = False
+                raise
+
+    def _encode_loop(self):
+        while self.recording:
+            self._drain()
+            time.sleep(0.2)
+
+    def _drain(self, task=None):
+        backlog = self.ring.written - self.ring.consumed
+        done = 0
+        while True:
+            n = self.ring.read_into(self._scratch)
+            if not n:
+                break
+            self.encoder.write(self._scratch[:n])
+            done += n
+            if task is not None:
+                task.report(done / backlog, "Encoding...")
+
+    def stop(self, task=None):
+        """Para la grabación y devuelve la ruta del fichero codificado (o None si está vacío)."""
+        with self._lock:
             self.recording = False
+            if self.stream is None:
+                return None
             self.stream.stop()
             self.stream.close()
-            return np.concatenate(self.frames, axis=0) if self.frames else None
-        except Exception as e:
-            messagebox.showerror("Error", f"Could not stop recording:\n{e}")
-            return None
+            self.stream = None
+            if self._encoder_thread is not None:
+                self._encoder_thread.join()
+            try:
+                self._drain(task)
+            except BaseException:
+                # Cancelado: se descarta la grabación
+                self.encoder.close()
+                os.remove(self.encoder.path)
+                raise
+            self.encoder.close()
+            if self.ring.dropped:
+                print(f"Recorder: {self.ring.dropped} samples dropped")
+            if self.encoder.frames == 0:
+                os.remove(self.encoder.path)
+                return None
+            return self.encoder.path
 
 def encode_wav(data):
-    raw = (np.int16(np.clip(data, -1, 1) * 32767)).tobytes()
+    import numpy as np
+    if data.dtype != np.int16:
+        data = np.int16(np.clip(data, -1, 1) * 32767)
+    raw = data.tobytes()
     buf = io.BytesIO()
     wf = wave.open(buf, 'wb')
     wf.setnchannels(CHANNELS)
@@ -105,6 +425,373 @@ def encode_wav(data):
     wf.close()
     return buf.getvalue()
 
+class TaskCancelled(Exception):
+    pass
+
+
+class Task:
+    """Tarea en segundo plano. La función recibe la tarea para informar del progreso y ver si se canceló."""
+
+    def __init__(self, runner, on_progress):
+        self._runner = runner
+        self._on_progress = on_progress
+        self._cancel = threading.Event()
+        self.future = None
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def report(self, fraction, text=""):
+        """Publica el progreso (0..1) en la UI. Lanza TaskCancelled si se pidió cancelar."""
+        if self.cancelled:
+            raise TaskCancelled()
+        if self._on_progress is not None:
+            self._runner.call_in_ui(self._on_progress, fraction, text)
+
+
+class TaskRunner:
+    """Pool de hilos para el trabajo lento de la app (grabar, codificar, generar recibos).
+
+    Tk solo se puede tocar desde el hilo principal: los hilos dejan las
+    llamadas para la UI en `ui_queue` y `_pump` las ejecuta cada
+    UI_POLL_MS con root.after.
+    """
+
+    UI_POLL_MS = 50
+
+    def __init__(self, root, workers=2):
+        self.root = root
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rolefy")
+        self.ui_queue = queue.Queue()
+        self.root.after(self.UI_POLL_MS, self._pump)
+
+    def call_in_ui(self, fn, *args):
+        """Programa fn(*args) en el hilo de Tk. Se puede llamar desde cualquier hilo."""
+        self.ui_queue.put((fn, args))
+
+    def submit(self, fn, *args, on_done=None, on_error=None, on_progress=None):
+        """Ejecuta fn(task, *args) en el pool; on_done/on_error/on_progress se llaman en el hilo de Tk."""
+        task = Task(self, on_progress)
+
+        def run():
+            try:
+                result = fn(task, *args)
+            except TaskCancelled:
+                return
+            except Exception as e:
+                if on_error is not None:
+                    self.call_in_ui(on_error, e)
+                else:
+                    print("Background task failed:", e)
+                return
+            if on_done is not None and not task.cancelled:
+                self.call_in_ui(on_done, result)
+
+        task.future = self.pool.submit(run)
+        return task
+
+    def _pump(self):
+        # Un máximo por vuelta para que una ráfaga de progreso no congele la ventana
+        for _ in range(100):
+            try:
+                fn, args = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                fn(*args)
+            except Exception as e:
+                print("UI callback failed:", e)
+        self.root.after(self.UI_POLL_MS, self._pump)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class PermanentUploadError(Exception):
+    """El servidor rechazó el envío (datos inválidos): reintentar no sirve."""
+
+
+class UploadCancelled(Exception):
+    pass
+
+
+class UploadRestart(Exception):
+    """Hay que reintentar la subida más tarde (con la espera exponencial de los fallos de red)."""
+
+
+class UploadQueue:
+    """Cola persistente de envíos en la carpeta outbox/, subidos en segundo plano.
+
+    Cada envío es el audio más un .json con los datos del formulario y el
+    estado de los reintentos. Se sube por trozos con /upload/init,
+    PUT /upload/{id} y /upload/{id}/finalize, así que una subida cortada
+    continúa desde el último trozo recibido. Los fallos de red se
+    reintentan con espera exponencial; si se cierra la app, los envíos
+    pendientes se retoman al volver a abrirla.
+    """
+
+    def __init__(self, backend=None, on_change=None):
+        self.backend = backend  # None hasta que se encuentra un backend (set_backend)
+        self.status = {}    # upload_id -> "pending" / "uploading" / "retrying" / "done" / "failed" / "cancelled"
+        self.progress = {}  # upload_id -> fracción subida (0..1)
+        # Se llama desde el hilo de subida cada vez que cambia algo (usar TaskRunner.call_in_ui)
+        self.on_change = on_change
+        self._cancelled = set()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def set_backend(self, url):
+        """Fija el backend al que subir y despierta el hilo (los envíos esperan hasta tenerlo)."""
+        self.backend = url
+        self._wake.set()
+
+    def enqueue(self, audio_path, buyer, seller, items, costs):
+        """Mueve la grabación a outbox/ con sus datos y avisa al hilo de subida."""
+        os.makedirs(OUTBOX_DIR, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        audio_name = upload_id + os.path.splitext(audio_path)[1]
+        shutil.move(audio_path, os.path.join(OUTBOX_DIR, audio_name))
+        entry = {
+            "upload_id": upload_id,
+            "audio": audio_name,
+            "comprador": buyer,
+            "vendedor": seller,
+            "productos": items,
+            "costes": costs,
+            "attempts": 0,
+            "next_try": 0,
+        }
+        self._save(entry)
+        self._set_status(upload_id, "pending")
+        self._wake.set()
+        return upload_id
+
+    def cancel_all(self):
+        """Cancela (y borra de outbox/) los envíos que aún no se han subido."""
+        for upload_id, st in list(self.status.items()):
+            if st in ("pending", "uploading", "retrying", "failed"):
+                self._cancelled.add(upload_id)
+        self._wake.set()
+
+    def _set_status(self, upload_id, status, progress=None):
+        self.status[upload_id] = status
+        if progress is not None:
+            self.progress[upload_id] = progress
+        if self.on_change is not None:
+            self.on_change()
+
+    def pending(self):
+        entries = []
+        if not os.path.isdir(OUTBOX_DIR):
+            return entries
+        for fname in sorted(os.listdir(OUTBOX_DIR)):
+            if fname.endswith(".json"):
+                try:
+                    with open(os.path.join(OUTBOX_DIR, fname), "r", encoding="utf-8") as f:
+                        entries.append(json.load(f))
+                except (OSError, ValueError) as e:
+                    print("Error reading outbox entry:", fname, e)
+        return entries
+
+    def _save(self, entry):
+        path = os.path.join(OUTBOX_DIR, entry["upload_id"] + ".json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(path + ".tmp", path)
+
+    def _remove(self, entry):
+        for name in (entry["audio"], entry["upload_id"] + ".json"):
+            try:
+                os.remove(os.path.join(OUTBOX_DIR, name))
+            except FileNotFoundError:
+                pass
+
+    def _run(self):
+        while True:
+            if self.backend is None:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            wait = 60
+            for entry in self.pending():
+                upload_id = entry["upload_id"]
+                if upload_id in self._cancelled:
+                    self._remove(entry)
+                    self._set_status(upload_id, "cancelled")
+                    continue
+                if entry.get("failed"):
+                    if self.status.get(upload_id) != "failed":
+                        self._set_status(upload_id, "failed")
+                    continue
+                delay = entry["next_try"] - time.time()
+                if delay > 0:
+                    if upload_id not in self.status:
+                        self._set_status(upload_id, "retrying")
+                    wait = min(wait, delay)
+                    continue
+                self._set_status(upload_id, "uploading", 0.0)
+                try:
+                    self._upload(entry)
+                except UploadCancelled:
+                    self._remove(entry)
+                    self._set_status(upload_id, "cancelled")
+                except PermanentUploadError as e:
+                    print("Upload rejected:", upload_id, e)
+                    entry["failed"] = str(e)
+                    self._save(entry)
+                    self._set_status(upload_id, "failed")
+                except Exception as e:
+                    entry["attempts"] += 1
+                    backoff = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** entry["attempts"])
+                    backoff *= random.uniform(0.5, 1.0)  # para que no reintente toda la clase a la vez
+                    entry["next_try"] = time.time() + backoff
+                    self._save(entry)
+                    self._set_status(upload_id, "retrying")
+                    wait = min(wait, backoff)
+                    print(f"Upload {upload_id} failed ({e}), retrying in {backoff:.0f}s")
+                else:
+                    self._remove(entry)
+                    self._set_status(upload_id, "done", 1.0)
+            self._wake.wait(timeout=wait)
+            self._wake.clear()
+
+    def _check(self, resp):
+        if 400 <= resp.status_code < 500 and resp.status_code not in (404, 408, 409, 410, 429):
+            raise PermanentUploadError(f"{resp.status_code}: {resp.text[:200]}")
+        resp.raise_for_status()
+        return resp.json()
+
+    def _upload(self, entry):
+        upload_id = entry["upload_id"]
+        path = os.path.join(OUTBOX_DIR, entry["audio"])
+        size = os.path.getsize(path)
+        mime = AUDIO_MIME_TYPES.get(os.path.splitext(path)[1], "audio/wav")
+        if "sha256" not in entry:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+            entry["sha256"] = digest.hexdigest()
+            self._save(entry)
+
+        import requests
+        with requests.Session() as session:
+            resp = session.post(f"{self.backend}/upload/init", json={
+                "upload_id": upload_id,
+                "comprador": entry["comprador"],
+                "vendedor": entry["vendedor"],
+                "productos": entry["productos"],
+                "costes": entry["costes"],
+                "filename": entry["audio"],
+                "content_type": mime,
+                "size": size,
+                "sha256": entry["sha256"],
+            }, timeout=UPLOAD_TIMEOUT)
+            if resp.status_code == 404:
+                # Backend antiguo sin subidas por trozos
+                return self._upload_single(session, entry, path, mime)
+            state = self._check(resp)
+
+            with open(path, "rb") as f:
+                while state["status"] != "done":
+                    if upload_id in self._cancelled:
+                        raise UploadCancelled()
+                    offset = state["offset"]
+                    self._set_status(upload_id, "uploading", offset / size)
+                    if offset >= size:
+                        resp = session.post(f"{self.backend}/upload/{upload_id}/finalize", timeout=UPLOAD_TIMEOUT)
+                    else:
+                        f.seek(offset)
+                        resp = session.put(f"{self.backend}/upload/{upload_id}", params={"offset": offset},
+                                           data=f.read(UPLOAD_CHUNK_SIZE),
+                                           headers={"Content-Type": "application/octet-stream"},
+                                           timeout=UPLOAD_TIMEOUT)
+                    if resp.status_code == 409:
+                        # El servidor tiene otro offset (trozo repetido o perdido): seguir desde el suyo
+                        state = {"status": "open", "offset": resp.json()["offset"]}
+                        continue
+                    if resp.status_code == 410:
+                        # El servidor perdió el audio y reabrió la subida: se reenvía desde 0
+                        # en el siguiente intento, con la espera de cualquier fallo
+                        raise UploadRestart(resp.json().get("detail", "Upload data lost"))
+                    state = self._check(resp)
+                    if state["status"] == "open" and state["offset"] <= offset < size:
+                        # Un trozo aceptado sin avanzar: reintentar más tarde, no en bucle
+                        raise UploadRestart(f"Upload stuck at offset {offset}")
+        return state["id"]
+
+    def _upload_single(self, session, entry, path, mime):
+        data = {
+            'comprador': entry["comprador"],
+            'vendedor': entry["vendedor"],
+            'productos': json.dumps(entry["productos"]),
+            'costes': json.dumps(entry["costes"])
+        }
+        with open(path, "rb") as audio_file:
+            files = {'audio': (entry["audio"], audio_file, mime)}
+            resp = session.post(f"{self.backend}/upload", files=files, data=data, timeout=UPLOAD_TIMEOUT)
+        return self._check(resp)["id"]
+
+
+def build_receipt(task, filename, buyer, seller, items, costs):
+    """Genera el recibo en PDF (se ejecuta en el TaskRunner) y devuelve el nombre del fichero."""
+    from fpdf import FPDF
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", "B", 16)
+    pdf.cell(0, 10, "ROLEFY Receipt", ln=True, align="C")
+    pdf.set_font("Arial", "", 12)
+    pdf.cell(0, 10, f"Buyer: {buyer}", ln=True)
+    pdf.cell(0, 10, f"Seller: {seller}", ln=True)
+    pdf.cell(0, 10, f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", ln=True)
+    pdf.ln(10)
+    pdf.set_font("Arial", "B", 14)
+    pdf.cell(0, 10, "Items and Costs:", ln=True)
+
+    total = 0.0
+    for item, cost in zip(items, costs):
+        try:
+            cost_float = float(cost.strip())
+        except:
+            cost_float = 0.0
+        total += cost_float
+        pdf.cell(0, 10, f"{item.strip()}: ${cost_float:.2f}", ln=True)
+
+    pdf.ln(5)
+    pdf.set_font("Arial", "B", 14)
+    pdf.cell(0, 10, f"Total: ${total:.2f}", ln=True)
+
+    task.report(1.0)  # última oportunidad de cancelar antes de escribir el fichero
+    pdf.output(filename)
+    return filename
+
+
+def load_images(task):
+    """Abre y redimensiona el logo y el handout con PIL (se ejecuta en el TaskRunner)."""
+    from PIL import Image
+    logo = handout = None
+    if os.path.exists(LOGO_PATH):
+        try:
+            logo = Image.open(LOGO_PATH).resize((50, 50), Image.Resampling.LANCZOS)
+        except Exception as e:
+            print("Error loading logo:", e)
+    if os.path.isfile(HANDOUT_PATH):
+        try:
+            handout = Image.open(HANDOUT_PATH)
+            handout.thumbnail((600, 400), Image.Resampling.LANCZOS)
+        except Exception as e:
+            print("Error loading handout preview:", e)
+            handout = None
+    return logo, handout
+
+
 class App:
     def __init__(self, root):
         self.root = root
@@ -126,8 +813,12 @@ class App:
         self.canvas.bind("<Configure>", self.on_canvas_configure)
         self.canvas.bind_all("<MouseWheel>", self._on_mousewheel)
 
+        self.tasks = TaskRunner(root)
+        self.current_task = None
         self.recorder = Recorder()
-        self.audio_data = None
+        self.audio_path = None
+        self.uploads = UploadQueue(on_change=lambda: self.tasks.call_in_ui(self._refresh_uploads))
+        self._uploads_were_active = False
         self.seconds = 0
 
         self.fonts = {
@@ -137,38 +828,59 @@ class App:
             "Nunito-Bold": os.path.join(FONTS_DIR, "Nunito-Bold.ttf"),
         }
 
-        self.load_fonts_for_pil()
+        self._pil_fonts = None
 
         self._build_ui()
         self._load_draft()
+        self.uploads.start()
+        root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Lo lento va al TaskRunner: la ventana se muestra ya en estado "connecting"
+        self.tasks.submit(load_images, on_done=self._images_loaded)
+        if not STARTUP_BENCHMARK:
+            self.status_lbl.config(text="Connecting to server...")
+            self.tasks.submit(discover_backend, on_done=self._backend_found,
+                              on_progress=lambda fraction, text: self.status_lbl.config(text=text))
+
+    def _backend_found(self, url):
+        if url is None:
+            url = simpledialog.askstring("Backend URL", "Enter backend URL:",
+                                         initialvalue=load_cached_backend() or DEFAULT_BACKEND, parent=self.root)
+            if not url:
+                self.status_lbl.config(text="No backend: roleplays will wait in the outbox")
+                return
+            url = url.rstrip("/")
+            save_cached_backend(url)
+        self.uploads.set_backend(url)
+        if self.current_task is None and not self.recorder.recording:
+            self.status_lbl.config(text="Ready")
+        self._refresh_uploads()
+
+    @property
+    def pil_fonts(self):
+        if self._pil_fonts is None:
+            self._pil_fonts = self.load_fonts_for_pil()
+        return self._pil_fonts
 
     def load_fonts_for_pil(self):
-        self.pil_fonts = {}
+        from PIL import ImageFont
+        pil_fonts = {}
         for name, path in self.fonts.items():
             try:
-                self.pil_fonts[name] = ImageFont.truetype(path, 18)
-                self.pil_fonts[name + "_small"] = ImageFont.truetype(path, 12)
-                self.pil_fonts[name + "_big"] = ImageFont.truetype(path, 24)
+                pil_fonts[name] = ImageFont.truetype(path, 18)
+                pil_fonts[name + "_small"] = ImageFont.truetype(path, 12)
+                pil_fonts[name + "_big"] = ImageFont.truetype(path, 24)
             except Exception:
-                self.pil_fonts[name] = ImageFont.load_default()
+                pil_fonts[name] = ImageFont.load_default()
+        return pil_fonts
 
     def _build_ui(self):
         header = Frame(self.container, bg=COLOR_BG)
         header.pack(pady=10)
 
-        if os.path.exists(LOGO_PATH):
-            try:
-                logo_img = Image.open(LOGO_PATH)
-                logo_img = logo_img.resize((50, 50), Image.Resampling.LANCZOS)
-                self.logo_tk = ImageTk.PhotoImage(logo_img)
-                logo_lbl = tk.Label(header, image=self.logo_tk, bg=COLOR_BG)
-                logo_lbl.pack(side="left", padx=10)
-            except:
-                logo_lbl = tk.Label(header, text="ROLEFY", font=("Arial", 24, "bold"), bg=COLOR_BG)
-                logo_lbl.pack(side="left")
-        else:
-            logo_lbl = tk.Label(header, text="ROLEFY", font=("Arial", 24, "bold"), bg=COLOR_BG)
-            logo_lbl.pack(side="left")
+        # Texto provisional; _images_loaded pone el logo cuando se ha cargado
+        self.logo_lbl = tk.Label(header, text="ROLEFY", font=("Arial", 24, "bold"), bg=COLOR_BG)
+        self.logo_lbl.pack(side="left")
 
         text_frame = Frame(header, bg=COLOR_BG)
         text_frame.pack(side="left", padx=5)
@@ -182,8 +894,9 @@ class App:
         self.titems = self._add_text("Items (1 per line):")
         self.tcosts = self._add_text("Costs (1 per line):")
 
-        self.handout_label = None
-        self.load_handout_preview()
+        # Hueco para la vista previa del handout (se rellena en _images_loaded)
+        self.handout_label = tk.Label(self.container, bg=COLOR_BG)
+        self.handout_label.pack(pady=10)
 
         self.bt_open_handout = tk.Button(self.container, text="Open Handout", command=self.open_handout,
                                          bg=COLOR_ACCENT, fg="white", relief="flat")
@@ -196,10 +909,12 @@ class App:
         self.bt_stop = self._styled_button("Stop Recording", "#FF6666", self.stop_recording, btn_frame)
         self.bt_submit = self._styled_button("Submit", COLOR_SECONDARY, self.submit, btn_frame)
         self.bt_download = self._styled_button("Download Receipt", COLOR_ACCENT, self.download_receipt, btn_frame)
+        self.bt_cancel = self._styled_button("Cancel", COLOR_MUTED, self.cancel, btn_frame)
 
         self.bt_stop["state"] = "disabled"
         self.bt_submit["state"] = "disabled"
         self.bt_download["state"] = "disabled"
+        self.bt_cancel["state"] = "disabled"
 
         self.status_lbl = tk.Label(self.container, text="Ready", bg=COLOR_BG, fg=COLOR_TEXT)
         self.status_lbl.pack()
@@ -207,6 +922,13 @@ class App:
         self.timer_lbl = tk.Label(self.container, text="00:00", bg=COLOR_BG, fg="green")
         self.timer_lbl.pack()
 
+        # Medidor de nivel del micrófono (se actualiza mientras se graba)
+        self.meter_canvas = Canvas(self.container, width=240, height=12, bg="#EEEEEE", highlightthickness=0)
+        self.meter_canvas.pack(pady=(4, 0))
+        self.meter_bar = self.meter_canvas.create_rectangle(0, 0, 0, 12, fill=COLOR_PRIMARY, width=0)
+        self.meter_lbl = tk.Label(self.container, text="", bg=COLOR_BG, fg="#CC3333", font=("Lexend", 10))
+        self.meter_lbl.pack()
+
         footer = Frame(self.container, bg=COLOR_BG)
         footer.pack(side="bottom", pady=10)
         tk.Label(footer, text="Rolefy - Roleplay Evaluation App", font=("Lexend", 9), fg=COLOR_MUTED,
@@ -236,26 +958,25 @@ class App:
         btn.pack(side="left", padx=10, ipadx=10, ipady=5)
         return btn
 
-    def load_handout_preview(self):
-        if not os.path.isfile(HANDOUT_PATH):
-            if self.handout_label:
-                self.handout_label.destroy()
-            return
-        try:
-            img = Image.open(HANDOUT_PATH)
-            max_w, max_h = 600, 400
-            img.thumbnail((max_w, max_h), Image.Resampling.LANCZOS)
-            self.handout_img_tk = ImageTk.PhotoImage(img)
-            if self.handout_label:
-                self.handout_label.configure(image=self.handout_img_tk)
-            else:
-                self.handout_label = tk.Label(self.container, image=self.handout_img_tk, bg=COLOR_BG)
-                self.handout_label.pack(pady=10)
-        except Exception as e:
-            print("Error loading handout preview:", e)
-            if self.handout_label:
-                self.handout_label.destroy()
-            self.handout_label = None
+    def _images_loaded(self, images):
+        """Crea los PhotoImage (solo se puede en el hilo de Tk) con lo que ha preparado load_images."""
+        from PIL import ImageTk
+        logo, handout = images
+        if logo is not None:
+            self.logo_tk = ImageTk.PhotoImage(logo)
+            self.logo_lbl.configure(image=self.logo_tk, text="")
+            self.logo_lbl.pack_configure(padx=10)
+        if handout is not None:
+            self.handout_img_tk = ImageTk.PhotoImage(handout)
+            self.handout_label.configure(image=self.handout_img_tk)
+        else:
+            self.handout_label.pack_forget()
+        if STARTUP_BENCHMARK:
+            self.root.after_idle(self._startup_done)
+
+    def _startup_done(self):
+        print(f"startup_seconds={time.perf_counter() - STARTUP_T0:.3f}", flush=True)
+        self.on_close()
 
     def open_handout(self):
         if os.path.isfile(HANDOUT_PATH):
@@ -287,25 +1008,86 @@ class App:
         self.recorder.recording = True
 
         self.update_timer()
-        threading.Thread(target=self._record_thread, daemon=True).start()
+        self.tasks.submit(lambda task: self.recorder.start(), on_error=self._recording_failed)
+        self.meter_lbl.config(text="")
+        self.root.after(METER_INTERVAL_MS, self.update_meter)
 
-    def _record_thread(self):
-        try:
-            self.recorder.start()
-            while self.recorder.recording:
-                time.sleep(0.1)
-            self.audio_data = self.recorder.stop()
-        except Exception as e:
-            self.status_lbl.config(text=f"Recording error: {e}")
+    def update_meter(self):
+        """Dibuja el nivel del micrófono y avisa de silencio largo o saturación."""
+        meter = self.recorder.meter
+        if not self.recorder.recording:
+            self.meter_canvas.coords(self.meter_bar, 0, 0, 0, 12)
+            return
+        if meter is not None:
+            rms, peak, silent_seconds, clipped = meter.read()
+            # Escala en dB de -60 a 0 para que la voz normal llene media barra
+            level = max(0.0, 1 + 20 * math.log10(max(rms, 1e-6)) / 60)
+            color = "#FF6666" if clipped else COLOR_PRIMARY
+            self.meter_canvas.coords(self.meter_bar, 0, 0, int(240 * level), 12)
+            self.meter_canvas.itemconfig(self.meter_bar, fill=color)
+            if clipped:
+                self.meter_lbl.config(text="Too loud: move a bit away from the microphone")
+            elif silent_seconds >= SILENCE_WARN_SECONDS:
+                self.meter_lbl.config(text=f"No sound for {int(silent_seconds)} s: check the microphone")
+            else:
+                self.meter_lbl.config(text="")
+        self.root.after(METER_INTERVAL_MS, self.update_meter)
+
+    def _recording_failed(self, error):
+        self.recorder.recording = False
+        self.current_task = None
+        self.status_lbl.config(text="Recording error")
+        self.bt_start["state"] = "normal"
+        self.bt_stop["state"] = "disabled"
+        self.bt_cancel["state"] = "disabled"
+        messagebox.showerror("Error", f"Recording error:\n{error}")
 
     def stop_recording(self):
         if not self.recorder.recording:
             return
         self.recorder.recording = False
-        self.status_lbl.config(text="Recording stopped")
-        self.bt_start["state"] = "normal"
+        self.status_lbl.config(text="Finishing recording...")
         self.bt_stop["state"] = "disabled"
-        self.bt_submit["state"] = "normal"
+        self.current_task = self.tasks.submit(
+            self.recorder.stop,
+            on_done=self._recording_ready,
+            on_error=self._recording_failed,
+            on_progress=self._show_progress,
+        )
+        self.bt_cancel["state"] = "normal"
+
+    def _recording_ready(self, path):
+        self.current_task = None
+        self.audio_path = path
+        self.status_lbl.config(text="Recording stopped" if path else "Nothing was recorded")
+        meter = self.recorder.meter
+        if path and meter is not None and meter.voiced_samples < SAMPLE_RATE:
+            self.meter_lbl.config(text="The recording seems silent: listen to it or record again before submitting")
+        else:
+            self.meter_lbl.config(text="")
+        self.bt_start["state"] = "normal"
+        self.bt_submit["state"] = "normal" if path else "disabled"
+        self._refresh_cancel()
+
+    def _show_progress(self, fraction, text):
+        self.status_lbl.config(text=f"{text} {fraction:.0%}")
+
+    def cancel(self):
+        """Cancela la tarea en curso o, si no hay ninguna, los envíos pendientes."""
+        if self.current_task is not None:
+            self.current_task.cancel()
+            self.current_task = None
+            self.status_lbl.config(text="Cancelled")
+            self.bt_start["state"] = "normal"
+            self._refresh_cancel()
+            return
+        if messagebox.askyesno("Cancel uploads",
+                               "Cancel the roleplays that are still uploading?\nTheir recordings will be deleted."):
+            self.uploads.cancel_all()
+
+    def _refresh_cancel(self):
+        pending = any(st in ("pending", "uploading", "retrying", "failed") for st in self.uploads.status.values())
+        self.bt_cancel["state"] = "normal" if self.current_task is not None or pending else "disabled"
 
     def update_timer(self):
         mins = self.seconds // 60
@@ -330,35 +1112,40 @@ class App:
         if not costs:
             messagebox.showwarning("Warning", "Please enter costs.")
             return
-        if self.audio_data is None or self.audio_data.size == 0:
+        if not self.audio_path or not os.path.isfile(self.audio_path):
             messagebox.showwarning("Warning", "Please record audio before submitting.")
             return
 
-        wav_bytes = encode_wav(self.audio_data)
-
-        wav_file = io.BytesIO(wav_bytes)
-        wav_file.name = "recording.wav"
-
-        files = {'audio': (wav_file.name, wav_file, 'audio/wav')}
-        data = {
-            'comprador': buyer,
-            'vendedor': seller,
-            'productos': json.dumps(items.splitlines()),
-            'costes': json.dumps(costs.splitlines())
-        }
-
-        try:
-            with requests.Session() as session:
-                resp = session.post(f"{BACKEND}/upload", files=files, data=data, timeout=15)
-                resp.raise_for_status()
-
-            messagebox.showinfo("Success", "Roleplay uploaded successfully!")
-            self.bt_submit["state"] = "disabled"
-            self.bt_download["state"] = "normal"
-            self._save_draft_clear()
+        # Se guarda en outbox/ y se sube en segundo plano, con reintentos
+        self.uploads.enqueue(self.audio_path, buyer, seller, items.splitlines(), costs.splitlines())
+        self.audio_path = None
+        self.status_lbl.config(text="Roleplay saved, uploading...")
+        self.bt_submit["state"] = "disabled"
+        self.bt_download["state"] = "normal"
+        self._save_draft_clear()
 
-        except requests.exceptions.RequestException as e:
-            messagebox.showerror("Failed to upload roleplay", str(e))
+    def _refresh_uploads(self):
+        """Muestra en la barra de estado cómo van los envíos pendientes (lo llama UploadQueue vía TaskRunner)."""
+        self._refresh_cancel()
+        if self.recorder.recording or self.current_task is not None:
+            return
+        states = dict(self.uploads.status)
+        active = [uid for uid, st in states.items() if st in ("pending", "uploading", "retrying")]
+        failed = sum(1 for st in states.values() if st == "failed")
+        if active or failed:
+            uploading = [uid for uid in active if states[uid] == "uploading"]
+            text = f"Uploads pending: {len(active)}"
+            if uploading:
+                text += f" · uploading {self.uploads.progress.get(uploading[0], 0):.0%}"
+            elif "retrying" in states.values():
+                text += " (no connection, retrying...)"
+            if failed:
+                text += f" · {failed} rejected by server"
+            self.status_lbl.config(text=text)
+            self._uploads_were_active = True
+        elif self._uploads_were_active:
+            self.status_lbl.config(text="All roleplays uploaded successfully!")
+            self._uploads_were_active = False
 
     def download_receipt(self):
         buyer = self.ebuyer.get().strip()
@@ -370,37 +1157,32 @@ class App:
             messagebox.showwarning("Warning", "Complete buyer, seller, items, and costs before downloading receipt.")
             return
 
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", "B", 16)
-        pdf.cell(0, 10, "ROLEFY Receipt", ln=True, align="C")
-        pdf.set_font("Arial", "", 12)
-        pdf.cell(0, 10, f"Buyer: {buyer}", ln=True)
-        pdf.cell(0, 10, f"Seller: {seller}", ln=True)
-        pdf.cell(0, 10, f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", ln=True)
-        pdf.ln(10)
-        pdf.set_font("Arial", "B", 14)
-        pdf.cell(0, 10, "Items and Costs:", ln=True)
-
-        total = 0.0
-        for item, cost in zip(items, costs):
-            try:
-                cost_float = float(cost.strip())
-            except:
-                cost_float = 0.0
-            total += cost_float
-            pdf.cell(0, 10, f"{item.strip()}: ${cost_float:.2f}", ln=True)
-
-        pdf.ln(5)
-        pdf.set_font("Arial", "B", 14)
-        pdf.cell(0, 10, f"Total: ${total:.2f}", ln=True)
-
         filename = f"receipt_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        try:
-            pdf.output(filename)
-            messagebox.showinfo("Download", f"Receipt saved as {filename}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save receipt:\n{e}")
+        self.status_lbl.config(text="Generating receipt...")
+        self.current_task = self.tasks.submit(
+            build_receipt, filename, buyer, seller, items, costs,
+            on_done=self._receipt_saved,
+            on_error=self._receipt_failed,
+        )
+        self._refresh_cancel()
+
+    def _receipt_saved(self, filename):
+        self.current_task = None
+        self._refresh_cancel()
+        self.status_lbl.config(text="Receipt saved")
+        messagebox.showinfo("Download", f"Receipt saved as {filename}")
+
+    def _receipt_failed(self, error):
+        self.current_task = None
+        self._refresh_cancel()
+        self.status_lbl.config(text="Receipt error")
+        messagebox.showerror("Error", f"Failed to save receipt:\n{error}")
+
+    def on_close(self):
+        if self.recorder.recording:
+            self.recorder.recording = False
+        self.tasks.shutdown()
+        self.root.destroy()
 
     def _save_draft(self):
         draft = {
@@ -446,6 +1228,8 @@ class App:
 
 
 if __name__ == "__main__":
+    # --startup-benchmark: no busca backend e imprime el tiempo hasta que la ventana está lista
+    STARTUP_BENCHMARK = "--startup-benchmark" in sys.argv
     root = tk.Tk()
     app = App(root)
     root.mainloop()
@@ -0,0 +1,55 @@
+"""Límite de tamaño de POST /upload antes de que Starlette lea el formulario.
+
+FastAPI recibe el formulario multipart entero (y lo vuelca a un fichero
+temporal si pasa de 1 MB) antes de llamar al endpoint, así que el límite
+de save_upload llegaba tarde: un audio demasiado grande ya se había
+recibido y escrito en disco. Este middleware ASGI puro:
+  - responde 413 sin leer el cuerpo si Content-Length ya pasa del límite;
+  - si no hay Content-Length (chunked), cuenta los bytes según llegan y
+    corta con 413 en cuanto lo pasan.
+
+El límite es MAX_UPLOAD_BYTES más FORM_OVERHEAD_BYTES para los demás
+campos del formulario y las cabeceras de cada parte.
+"""
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+import settings
+
+FORM_OVERHEAD_BYTES = 64 * 1024
+LIMITED_PATHS = ("/upload",)
+
+
+def _too_large():
+    return f"Audio too large (max {settings.MAX_UPLOAD_MB} MB)"
+
+
+class UploadLimitMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.max_bytes = settings.MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in LIMITED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        length = Headers(scope=scope).get("content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            response = JSONResponse({"detail": _too_large()}, status_code=413, headers={"connection": "close"})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # FastAPI deja pasar las HTTPException que salen al leer el formulario
+                    raise HTTPException(status_code=413, detail=_too_large())
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,141 @@
+"""Análisis de un audio para la vista del profesor: duración, volumen y forma de onda.
+
+El audio se lee por bloques (memoria constante aunque dure horas) y todo el
+cálculo se hace con NumPy sobre ventanas de FRAME_SECONDS:
+  duration       segundos
+  rms_db         volumen medio (dBFS, 0 = máximo)
+  silence_ratio  parte del audio por debajo de SILENCE_DB
+  peaks          WAVEFORM_PEAKS picos (0..1) para dibujar la forma de onda
+
+Lo usa el trabajo de ingesta "waveform" (ver ingest.py).
+"""
+import math
+import shutil
+import subprocess
+
+import numpy as np
+
+import settings
+
+FRAME_SECONDS = 0.01
+BLOCK_FRAMES = 65536
+# Para los formatos que no lee soundfile (webm del navegador) se decodifica con ffmpeg
+FFMPEG_RATE = 16000
+MIN_DB = -120.0
+
+
+def _soundfile_blocks(path):
+    import soundfile
+
+    rate = soundfile.info(path).samplerate
+
+    def blocks():
+        for block in soundfile.blocks(path, blocksize=BLOCK_FRAMES, dtype="float32", always_2d=True):
+            yield block.mean(axis=1)
+    return rate, blocks()
+
+
+def _ffmpeg_blocks(path):
+    ffmpeg = shutil.which(settings.FFMPEG_BIN)
+    if ffmpeg is None:
+        raise ValueError("Unsupported audio format and ffmpeg not found")
+    cmd = [ffmpeg, "-nostdin", "-loglevel", "error", "-i", path, "-vn", "-ac", "1",
+           "-ar", str(FFMPEG_RATE), "-f", "f32le", "-"]
+
+    def blocks():
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                data = proc.stdout.read(BLOCK_FRAMES * 4)
+                if not data:
+                    break
+                yield np.frombuffer(data[:len(data) // 4 * 4], dtype=np.float32)
+        finally:
+            proc.stdout.close()
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+        if proc.returncode not in (0, -9):
+            raise ValueError(f"ffmpeg could not decode {path}")
+    return FFMPEG_RATE, blocks()
+
+
+def open_blocks(path):
+    """(frecuencia, generador de bloques float32 mono) del audio."""
+    try:
+        return _soundfile_blocks(path)
+    except Exception:
+        return _ffmpeg_blocks(path)
+
+
+def to_db(value):
+    return max(MIN_DB, 20 * math.log10(value)) if value > 0 else MIN_DB
+
+
+def iter_frames(rate, blocks):
+    """Recorre el audio por ventanas de FRAME_SECONDS sin guardar los bloques ya vistos.
+
+    Da por cada bloque (muestras, suma de cuadrados, rms por ventana, pico
+    por ventana); la última ventana puede ser más corta.
+    """
+    frame = max(1, int(rate * FRAME_SECONDS))
+    carry = np.zeros(0, dtype=np.float32)
+    for block in blocks:
+        buf = np.concatenate([carry, block]) if len(carry) else block
+        n = len(buf) // frame * frame
+        frames = buf[:n].reshape(-1, frame)
+        yield (len(block), float(np.dot(block, block.astype(np.float64))),
+               np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1)), np.abs(frames).max(axis=1))
+        carry = buf[n:]
+    if len(carry):
+        yield 0, 0.0, np.sqrt([np.mean(np.square(carry, dtype=np.float64))]), np.abs(carry).max(keepdims=True)
+
+
+def frame_stats(rate, blocks):
+    """Recorre el audio y devuelve (muestras, suma de cuadrados, rms por ventana, pico por ventana)."""
+    total, sumsq = 0, 0.0
+    rms, peak = [], []
+    for n, block_sumsq, block_rms, block_peak in iter_frames(rate, blocks):
+        total += n
+        sumsq += block_sumsq
+        rms.append(block_rms)
+        peak.append(block_peak)
+    if not rms:
+        return 0, 0.0, np.zeros(0), np.zeros(0)
+    return total, sumsq, np.concatenate(rms), np.concatenate(peak)
+
+
+def downsample_peaks(peak, count):
+    """Reduce los picos por ventana a `count` valores (el máximo de cada tramo)."""
+    if len(peak) == 0 or count <= 0:
+        return []
+    count = min(count, len(peak))
+    edges = np.arange(count) * len(peak) // count
+    reduced = np.minimum(np.maximum.reduceat(peak, edges), 1.0)
+    return [round(float(x), 3) for x in reduced]
+
+
+def analyze(path, peaks=None, silence_db=None):
+    """Duración, volumen medio, proporción de silencio y picos del audio en `path`."""
+    peaks = settings.WAVEFORM_PEAKS if peaks is None else peaks
+    silence_db = settings.SILENCE_DB if silence_db is None else silence_db
+    rate, blocks = open_blocks(path)
+    total, sumsq, rms, peak = frame_stats(rate, blocks)
+    return {
+        "duration": total / rate,
+        "rms_db": round(to_db(math.sqrt(sumsq / total)), 2) if total else MIN_DB,
+        "silence_ratio": round(float(np.mean(rms < 10 ** (silence_db / 20))), 4) if len(rms) else 1.0,
+        "peaks": downsample_peaks(peak, peaks),
+    }
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+    import time
+
+    for arg in sys.argv[1:]:
+        t0 = time.perf_counter()
+        result = analyze(arg)
+        result["peaks"] = len(result["peaks"])
+        print(json.dumps(dict(result, file=arg, seconds=round(time.perf_counter() - t0, 3))))